@@ -348,6 +348,11 @@ RQ_QUEUES = {
         "DEFAULT_TIMEOUT": 7200,
         "AUTOCOMMIT": False,
     },
+    "github": {
+        "USE_REDIS_CACHE": "default",
+        "DEFAULT_TIMEOUT": 500,
+        "AUTOCOMMIT": False,
+    },
 }
 RQ_EXCEPTION_HANDLERS = ["metaci.build.exceptions.maybe_requeue_job"]
 CRON_JOBS = {
@@ -355,6 +360,10 @@ CRON_JOBS = {
         "func": "metaci.build.autoscaling.autoscale",
         "cron_string": "* * * * *",
     },
+    "prune_autoscaling_decisions": {
+        "func": "metaci.build.autoscaling.prune_autoscaling_decisions",
+        "cron_string": "0 3 * * *",
+    },
     "check_waiting_builds": {
         "func": "metaci.build.tasks.check_waiting_builds",
         "cron_string": "* * * * *",
@@ -375,10 +384,18 @@ CRON_JOBS = {
         "func": "metaci.plan.tasks.run_scheduled_hourly",
         "cron_string": "0 * * * *",
     },
-    "prune_branches": {
-        "func": "metaci.repository.tasks.prune_branches",
+    "fill_org_pools": {
+        "func": "metaci.build.tasks.fill_org_pools",
+        "cron_string": "*/15 * * * *",
+    },
+    "sync_branches": {
+        "func": "metaci.repository.tasks.sync_branches",
         "cron_string": "0 * * * *",
     },
+    "requeue_webhook_events": {
+        "func": "metaci.repository.tasks.requeue_webhook_events",
+        "cron_string": "*/5 * * * *",
+    },
     "update_cohort_status": {
         "func": "metaci.release.tasks.update_cohort_status",
         "cron_string": "* * * * *",
@@ -448,10 +465,62 @@ GUS_BUS_OWNER_ID = env("GUS_BUS_OWNER_ID", default="")
 # Number of scratch orgs to leave available in the org.
 SCRATCH_ORG_RESERVE = env.int("METACI_SCRATCH_ORG_RESERVE", 10)
 
+# Build admission limits, 0 for no limit
+METACI_MAX_CONCURRENT_BUILDS = env.int("METACI_MAX_CONCURRENT_BUILDS", 0)
+METACI_MAX_CONCURRENT_BUILDS_PER_REPO = env.int(
+    "METACI_MAX_CONCURRENT_BUILDS_PER_REPO", 0
+)
+# Seconds a build waits for admission to make up for one running build of its repo
+METACI_ADMISSION_AGING_SECONDS = env.int("METACI_ADMISSION_AGING_SECONDS", 15 * 60)
+# How long (in seconds) a prepared org may wait in the org pool before it is discarded.
+METACI_ORG_POOL_MAX_AGE = env.int("METACI_ORG_POOL_MAX_AGE", 12 * 60 * 60)
+
+# Seconds between checks on robot shards running on other workers
+METACI_ROBOT_SHARD_POLL_INTERVAL = env.int("METACI_ROBOT_SHARD_POLL_INTERVAL", 30)
+
+# History used to balance test shards by duration
+METACI_SHARD_HISTORY_DAYS = env.int("METACI_SHARD_HISTORY_DAYS", 30)
+METACI_SHARD_HISTORY_RUNS = env.int("METACI_SHARD_HISTORY_RUNS", 10)
+
+# Seconds a repository fetched from the GitHub API is reused for
+METACI_GITHUB_REPOSITORY_CACHE_SECONDS = env.int(
+    "METACI_GITHUB_REPOSITORY_CACHE_SECONDS", 300
+)
+# Responses kept per GitHub client to make conditional requests with their ETag
+METACI_GITHUB_ETAG_CACHE_SIZE = env.int("METACI_GITHUB_ETAG_CACHE_SIZE", 1000)
+
+# Seconds between GitHub commit statuses posted by the status publisher
+METACI_GITHUB_STATUS_INTERVAL = env.float("METACI_GITHUB_STATUS_INTERVAL", 1.0)
+# Most GitHub commit statuses posted by one publish job
+METACI_GITHUB_STATUS_BATCH_SIZE = env.int("METACI_GITHUB_STATUS_BATCH_SIZE", 50)
+
+# Repositories whose branches are listed at once by the sync_branches job
+METACI_BRANCH_SYNC_WORKERS = env.int("METACI_BRANCH_SYNC_WORKERS", 8)
+# Branches offered at once by the run plan form and its typeahead
+METACI_BRANCH_CHOICES_LIMIT = env.int("METACI_BRANCH_CHOICES_LIMIT", 50)
+# Seconds a webhook delivery id is remembered in the cache to turn away
+# redeliveries without a query
+METACI_WEBHOOK_DEDUP_SECONDS = env.int("METACI_WEBHOOK_DEDUP_SECONDS", 600)
+
+# Repositories whose branch HEADs are fetched at once when running schedules
+METACI_SCHEDULE_WORKERS = env.int("METACI_SCHEDULE_WORKERS", 8)
+
+# GitHub requests made at once when updating merge freeze statuses
+METACI_MERGE_FREEZE_WORKERS = env.int("METACI_MERGE_FREEZE_WORKERS", 8)
+
 # Autoscaler class used for scaling the worker formation
 METACI_WORKER_AUTOSCALER = env(
     "METACI_WORKER_AUTOSCALER", default="metaci.build.autoscaling.NonAutoscaler"
 )
+# Autoscaling policy used unless an autoscaler config sets "policy":
+# "queue_depth" (a worker per queued build) or "predictive" (build history)
+METACI_AUTOSCALER_POLICY = env("METACI_AUTOSCALER_POLICY", default="queue_depth")
+# Days of builds used to estimate build durations for the predictive policy
+METACI_AUTOSCALER_HISTORY_DAYS = env.int("METACI_AUTOSCALER_HISTORY_DAYS", 14)
+# Days recorded autoscaling decisions are kept
+METACI_AUTOSCALER_DECISION_RETENTION_DAYS = env.int(
+    "METACI_AUTOSCALER_DECISION_RETENTION_DAYS", 30
+)
 # What's the max number of worker dynos we should scale up to
 METACI_MAX_WORKERS = env.int("METACI_MAX_WORKERS", 3)
 # How many worker slots to reserve for high-priority jobs.
@@ -459,6 +528,22 @@ METACI_MAX_WORKERS = env.int("METACI_MAX_WORKERS", 3)
 METACI_WORKER_RESERVE = env.int("METACI_WORKER_RESERVE", 1)
 WORKER_DYNO_NAME = env("WORKER_DYNO_NAME", default=None) or "worker"
 
+# Worker process types reported to HireFire, with the queues they work on.
+# Process types with a worker_reserve keep that many workers for the high queue
+# (as the autoscalers do), and counts are capped at max_workers when set.
+HIREFIRE_PROCESSES = json.loads(env("HIREFIRE_PROCESSES", default="null")) or {
+    WORKER_DYNO_NAME: {
+        "queues": ["high", "medium", "default"],
+        "max_workers": METACI_MAX_WORKERS,
+        "worker_reserve": METACI_WORKER_RESERVE,
+    },
+    "robot_worker": {"queues": ["robot"]},
+    # worker_short also runs the scheduler, so keep one running
+    "worker_short": {"queues": ["short", "github"], "min_workers": 1},
+}
+# Seconds the queue counts reported to HireFire are cached for
+HIREFIRE_CACHE_SECONDS = env.int("HIREFIRE_CACHE_SECONDS", 5)
+
 
 # Django REST Framework
 REST_FRAMEWORK = {
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+
+from metaci.plan.models import Plan
+from metaci.repository.models import Repository
+from metaci.testresults.choices import TEST_TYPE_CHOICES
+
+
+class ShardPlanRequestSerializer(serializers.Serializer):
+    repo_id = serializers.PrimaryKeyRelatedField(
+        queryset=Repository.objects.all(), source="repo"
+    )
+    plan_id = serializers.PrimaryKeyRelatedField(
+        queryset=Plan.objects.all(), source="plan", required=False
+    )
+    test_type = serializers.ChoiceField(choices=TEST_TYPE_CHOICES, required=False)
+    tests = serializers.ListField(
+        child=serializers.CharField(max_length=255), allow_empty=False
+    )
+    shards = serializers.IntegerField(min_value=1, max_value=100)
+
+
+class ShardSerializer(serializers.Serializer):
+    tests = serializers.ListField(child=serializers.CharField())
+    duration = serializers.FloatField()
@@ -0,0 +1,28 @@
+import pytest
+from rest_framework.test import APIClient
+
+from metaci.conftest import RepositoryFactory, StaffSuperuserFactory
+from metaci.testresults.tests.test_planner import add_results
+
+
+@pytest.mark.django_db
+def test_shard_plan_api():
+    repo = RepositoryFactory()
+    add_results(repo, "Slow Suite", [300])
+    add_results(repo, "A", [10])
+    client = APIClient()
+    client.force_authenticate(StaffSuperuserFactory())
+
+    response = client.post(
+        "/api/test_shards/",
+        {
+            "repo_id": repo.id,
+            "test_type": "Robot",
+            "tests": ["robot/slow_suite.robot", "robot/a.robot", "robot/b.robot"],
+            "shards": 2,
+        },
+        format="json",
+    )
+
+    assert response.status_code == 200
+    assert response.json()["shards"][0]["tests"] == ["robot/slow_suite.robot"]
@@ -18,6 +18,7 @@ class TestURLReversals(unittest.TestCase):
         self.assertEqual(reverse("repo-list"), "/api/repos/")
         self.assertEqual(reverse("scratch_org-list"), "/api/scratch_orgs/")
         self.assertEqual(reverse("service-list"), "/api/services/")
+        self.assertEqual(reverse("test_shard-list"), "/api/test_shards/")
 
     def test_detail_reverse(self):
         """<entity>-detail [1] should reverse to /api/<entity>/1."""
@@ -11,6 +11,7 @@ from metaci.api.views.cumulusci import (
 from metaci.api.views.plan import PlanRepositoryViewSet, PlanViewSet
 from metaci.api.views.repository import BranchViewSet, RepositoryViewSet
 from metaci.api.views.robot import RobotTestResultViewSet
+from metaci.api.views.testresults import ShardPlanViewSet
 
 router = DefaultRouter()
 router.register(r"branches", BranchViewSet, basename="branch")
@@ -23,6 +24,7 @@ router.register(r"rebuilds", RebuildViewSet, basename="rebuild")
 router.register(r"repos", RepositoryViewSet, basename="repo")
 router.register(r"scratch_orgs", ScratchOrgInstanceViewSet, basename="scratch_org")
 router.register(r"services", ServiceViewSet, basename="service")
+router.register(r"test_shards", ShardPlanViewSet, basename="test_shard")
 router.register(r"robot", RobotTestResultViewSet, basename="robot")
 
 urlpatterns = router.urls
@@ -0,0 +1,33 @@
+from rest_framework import viewsets
+from rest_framework.response import Response
+
+from metaci.api.serializers.testresults import (
+    ShardPlanRequestSerializer,
+    ShardSerializer,
+)
+from metaci.testresults.planner import plan_shards, robot_suite_name
+
+
+class ShardPlanViewSet(viewsets.ViewSet):
+    """
+    Split test classes or robot suites into shards balanced by
+    historical test duration.
+
+    POST a repo_id, a list of tests and the number of shards.
+    Robot suites may be given as .robot file paths.
+    """
+
+    def create(self, request):
+        serializer = ShardPlanRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        key = robot_suite_name if data.get("test_type") == "Robot" else None
+        shards = plan_shards(
+            data["repo"],
+            data["tests"],
+            data["shards"],
+            plan=data.get("plan"),
+            test_type=data.get("test_type"),
+            key=key,
+        )
+        return Response({"shards": ShardSerializer(shards, many=True).data})
@@ -1,6 +1,12 @@
 from django.contrib import admin
 
-from metaci.build.models import Build, BuildFlow, FlowTask, Rebuild
+from metaci.build.models import (
+    AutoscalingDecision,
+    Build,
+    BuildFlow,
+    FlowTask,
+    Rebuild,
+)
 
 
 @admin.register(Build)
@@ -52,3 +58,18 @@ class RebuildAdmin(admin.ModelAdmin):
     )
     list_filter = ("build__repo", "build__plan")
     raw_id_fields = ("build", "org_instance")
+
+
+@admin.register(AutoscalingDecision)
+class AutoscalingDecisionAdmin(admin.ModelAdmin):
+    list_display = (
+        "app_name",
+        "time",
+        "policy",
+        "active_builds",
+        "workers",
+        "demand",
+        "target_workers",
+        "predicted_load",
+    )
+    list_filter = ("app_name", "policy")
@@ -0,0 +1,144 @@
+"""Admission control for builds.
+
+Before a build is dispatched it has to fit within the concurrency limits
+of its plan, of its plan on its repository, of its repository and of
+MetaCI as a whole. Builds which don't fit wait in a Redis set. When a
+build finishes, the waiting build picked next is the one whose repository
+has the fewest running builds for its priority weight, with builds
+gaining priority the longer they wait so nothing starves.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from metaci.build.waitlist import CHECK_TIMEOUT, get_connection
+
+ADMISSION_KEY = "metaci:admission"
+
+
+def admitted_key(build_id):
+    return f"metaci:admission:admitted:{build_id}"
+
+
+def active_builds():
+    """Builds which are running or have been dispatched to a worker."""
+    from metaci.build.models import Build
+
+    return Build.objects.filter(
+        Q(status="running")
+        | Q(status__in=("queued", "waiting"), task_id_run__isnull=False)
+    )
+
+
+def blocked_reason(build):
+    """Return why the build can't be admitted yet, or None."""
+    active = active_builds().exclude(id=build.id)
+    limits = [
+        (settings.METACI_MAX_CONCURRENT_BUILDS, active, "MetaCI"),
+        (
+            settings.METACI_MAX_CONCURRENT_BUILDS_PER_REPO,
+            active.filter(repo_id=build.repo_id),
+            f"repository {build.repo}",
+        ),
+        (
+            build.plan.max_concurrent_builds,
+            active.filter(plan_id=build.plan_id),
+            f"plan {build.plan}",
+        ),
+    ]
+    if build.planrepo:
+        limits.append(
+            (
+                build.planrepo.max_concurrent_builds,
+                active.filter(planrepo_id=build.planrepo_id),
+                f"plan {build.plan} on {build.repo}",
+            )
+        )
+    for limit, builds, name in limits:
+        if limit and builds.count() >= limit:
+            return (
+                f"Waiting for one of the {limit} builds running for {name} to complete"
+            )
+    return None
+
+
+def check(build):
+    """Return why the build has to wait for admission, or None if it can go ahead.
+
+    Builds which arrive while others are waiting join them, so that the
+    next one is picked fairly.
+    """
+    reason = blocked_reason(build)
+    if reason is None and not cache.get(admitted_key(build.id)):
+        if get_connection().zcard(ADMISSION_KEY):
+            reason = "Waiting for builds which were queued earlier to be admitted"
+    if reason:
+        add(build)
+    else:
+        remove(build.id)
+    return reason
+
+
+def add(build):
+    get_connection().zadd(
+        ADMISSION_KEY, {build.id: build.time_queue.timestamp()}, nx=True
+    )
+
+
+def remove(build_id):
+    get_connection().zrem(ADMISSION_KEY, build_id)
+
+
+def is_waiting(build_id):
+    """Whether the build is waiting to be admitted, rather than for its org."""
+    return get_connection().zscore(ADMISSION_KEY, build_id) is not None
+
+
+def priority(build, running, now):
+    """Lower values are admitted first."""
+    weight = build.planrepo.priority_weight if build.planrepo else 1
+    waited = (now - build.time_queue).total_seconds()
+    return (running[build.repo_id] + 1) / max(weight, 1) - (
+        waited / settings.METACI_ADMISSION_AGING_SECONDS
+    )
+
+
+def wake():
+    """Check the waiting build which is next in line for admission.
+
+    Returns the id of the build which was checked, if any.
+    """
+    from metaci.build.models import Build
+    from metaci.build.tasks import check_queued_build
+
+    ids = [int(build_id) for build_id in get_connection().zrange(ADMISSION_KEY, 0, -1)]
+    if not ids:
+        return None
+    builds = [
+        build
+        for build in Build.objects.filter(id__in=ids).select_related(
+            "plan", "planrepo", "repo"
+        )
+        if build.get_status() == "waiting"
+    ]
+    # Drop builds which were canceled or deleted while waiting
+    for build_id in set(ids) - {build.id for build in builds}:
+        remove(build_id)
+
+    running = Counter(active_builds().values_list("repo_id", flat=True))
+    now = timezone.now()
+    builds.sort(key=lambda build: (priority(build, running, now), build.time_queue))
+    for build in builds:
+        if blocked_reason(build):
+            continue
+        if not cache.add(admitted_key(build.id), True, timeout=CHECK_TIMEOUT):
+            # Already on its way
+            return None
+        res_check = check_queued_build.delay(build.id)
+        build.task_id_check = res_check.id
+        build.save()
+        return build.id
+    return None
@@ -1,32 +1,178 @@
 import logging
+import math
 import subprocess
 import typing as T
+from datetime import timedelta
+from statistics import median
 
 import django_rq
 import requests
 from cumulusci.core.utils import import_global
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
 from rq import Worker
 from rq.registry import StartedJobRegistry
+from rq.worker import WorkerStatus
 
+from metaci.build import drain
 from metaci.exceptions import ConfigError
 
 logger = logging.getLogger(__name__)
 
+POLICIES = ("queue_depth", "predictive")
+DURATIONS_CACHE_TIMEOUT = 600
+
+
+def get_plan_durations(queue_names):
+    """Return the median duration in seconds of recent builds of each plan
+    which runs on one of the queues."""
+    from metaci.build.models import Build
+
+    key = f"metaci:autoscaler:durations:{','.join(sorted(queue_names))}"
+    durations = cache.get(key)
+    if durations is not None:
+        return durations
+
+    builds = Build.objects.filter(
+        plan__queue__in=queue_names,
+        status__in=("success", "fail", "error"),
+        time_start__isnull=False,
+        time_end__gte=timezone.now()
+        - timedelta(days=settings.METACI_AUTOSCALER_HISTORY_DAYS),
+    ).values_list("plan_id", "time_start", "time_end")
+    samples = {}
+    for plan_id, time_start, time_end in builds.iterator():
+        samples.setdefault(plan_id, []).append((time_end - time_start).total_seconds())
+    durations = {plan_id: median(values) for plan_id, values in samples.items()}
+    cache.set(key, durations, DURATIONS_CACHE_TIMEOUT)
+    return durations
+
+
+def get_arrival_rates(queue_names, window):
+    """Return how many builds per second were queued for each plan which
+    runs on one of the queues over the last `window` seconds."""
+    from metaci.build.models import Build
+
+    counts = (
+        Build.objects.filter(
+            plan__queue__in=queue_names,
+            time_queue__gte=timezone.now() - timedelta(seconds=window),
+        )
+        .order_by()
+        .values_list("plan_id")
+        .annotate(count=Count("id"))
+    )
+    return {plan_id: count / window for plan_id, count in counts}
+
+
+def allocate_workers(active_builds, high_priority_builds, max_workers, worker_reserve):
+    """Return how many of the workers needed for the active builds are
+    reserve workers, and how many are needed in total."""
+    # Allocate as many high-priority builds as possible to reserve workers,
+    # then the remainder to standard workers
+    reserve_workers = min(high_priority_builds, worker_reserve)
+    other_workers = min(active_builds - reserve_workers, max_workers - worker_reserve)
+    return reserve_workers, reserve_workers + other_workers
+
+
+class Environment(object):
+    """What an autoscaler observes and acts on: the rq queues and workers,
+    the drain protocol, build history, the clock and the worker formation.
+
+    The simulator passes in its own to replay builds offline.
+    """
+
+    def now(self):
+        return timezone.now()
+
+    def get_queue(self, name):
+        return django_rq.get_queue(name)
+
+    def count_started(self, queue):
+        return len(StartedJobRegistry(queue=queue))
+
+    def count_workers(self, queue):
+        return Worker.count(queue=queue)
+
+    def all_workers(self, queue):
+        return Worker.all(queue=queue)
+
+    def get_drain_states(self):
+        return drain.get_states()
+
+    def request_drain(self, worker_ids):
+        return drain.request(worker_ids)
+
+    def cancel_drain(self, worker_ids):
+        drain.cancel(worker_ids)
+
+    def retire_drained(self, worker_ids):
+        drain.retire(worker_ids)
+
+    def get_plan_durations(self, queue_names):
+        return get_plan_durations(queue_names)
+
+    def get_arrival_rates(self, queue_names, window):
+        return get_arrival_rates(queue_names, window)
+
+    def get_target_history(self, app_name):
+        """Return the previous target and when it was set (None if there
+        is no recorded decision)."""
+        from metaci.build.models import AutoscalingDecision
+
+        if app_name is None:
+            return None, None
+        previous = (
+            AutoscalingDecision.objects.filter(app_name=app_name)
+            .order_by("-time")
+            .first()
+        )
+        if previous is None:
+            return None, None
+        return previous.target_workers, previous.time
+
+    def start_worker(self, args):
+        return subprocess.Popen(args)
+
+    def heroku_headers(self):
+        return {
+            "Accept": "application/vnd.heroku+json; version=3",
+            "Authorization": f"Bearer {settings.HEROKU_TOKEN}",
+        }
+
+    def get_formation(self, url):
+        return requests.get(url, headers=self.heroku_headers())
+
+    def patch_formation(self, url, quantity):
+        return requests.patch(
+            url, json={"quantity": quantity}, headers=self.heroku_headers()
+        )
+
 
 class Autoscaler(object):
-    """Utility to adjust the # of workers based on queue size."""
+    """Utility to adjust the # of workers based on queue size.
+
+    With the "predictive" policy the target also accounts for how long the
+    queued builds are expected to take and for the rate builds have been
+    arriving at, and the target is lowered one step at a time.
+    """
 
     active_builds = 0
+    running_builds = 0
     target_workers = 0
+    demand = 0
+    predicted_load = None
 
-    def __init__(self, config):
+    def __init__(self, config, environment=None):
         """config is a dict that has an entry for queues"""
+        self.env = environment or Environment()
         if "queues" not in config:
             raise ConfigError(
                 f"'queues' not present in autoscaler config:\nFound: {config}"
             )
-        self.queues = [django_rq.get_queue(name) for name in config["queues"]]
+        self.queues = [self.env.get_queue(name) for name in config["queues"]]
 
         if "max_workers" not in config:
             raise ConfigError(
@@ -40,6 +186,20 @@ class Autoscaler(object):
             )
         self.worker_reserve = config["worker_reserve"]
 
+        self.name = config.get("name")
+        self.policy = config.get("policy", settings.METACI_AUTOSCALER_POLICY)
+        if self.policy not in POLICIES:
+            raise ConfigError(
+                f"Unknown autoscaler policy {self.policy}, expected one of {POLICIES}"
+            )
+        # Seconds of recent builds used to estimate the arrival rate
+        self.arrival_window = config.get("arrival_window", 60 * 60)
+        # Seconds within which queued builds should have started
+        self.drain_horizon = config.get("drain_horizon", 15 * 60)
+        # Seconds the target must hold before each step down, and the step size
+        self.scale_down_delay = config.get("scale_down_delay", 10 * 60)
+        self.scale_down_step = config.get("scale_down_step", 1)
+
     def measure(self):
         # Check how many builds are active (queued or started)
         self.active_builds = 0
@@ -50,27 +210,117 @@ class Autoscaler(object):
             if queue.name == "high":
                 high_priority_builds += active_builds
 
-        # Allocate as many high-priority builds as possible to reserve workers,
-        # then the remainder to standard workers
-        reserve_workers = min(high_priority_builds, self.worker_reserve)
-        other_workers = min(
-            self.active_builds - reserve_workers,
-            self.max_workers - self.worker_reserve,
+        reserve_workers, self.target_workers = allocate_workers(
+            self.active_builds,
+            high_priority_builds,
+            self.max_workers,
+            self.worker_reserve,
+        )
+        self.demand = self.target_workers
+
+        if self.policy == "predictive":
+            self.running_builds = sum(
+                self.env.count_started(queue) for queue in self.queues
+            )
+            self.demand = self.predict_workers(reserve_workers)
+            if self.demand is not None:
+                self.target_workers = self.smooth(self.demand)
+
+    def predict_workers(self, reserve_workers):
+        """Estimate how many workers are needed from build history.
+
+        Running builds each keep a worker, queued builds need enough workers
+        to start within the drain horizon, and the formation should also
+        keep up with the current arrival rate (the expected number of busy
+        workers is arrival rate x duration). Returns None if there is no
+        history to go on.
+        """
+        queue_names = [queue.name for queue in self.queues]
+        durations = self.env.get_plan_durations(queue_names)
+        if not durations:
+            return None
+        rates = self.env.get_arrival_rates(queue_names, self.arrival_window)
+        default = median(durations.values())
+
+        self.predicted_load = sum(
+            rate * durations.get(plan_id, default) for plan_id, rate in rates.items()
+        )
+        if rates:
+            mean_duration = self.predicted_load / sum(rates.values())
+        else:
+            mean_duration = default
+
+        queued = max(self.active_builds - self.running_builds, 0)
+        backlog = min(queued, math.ceil(queued * mean_duration / self.drain_horizon))
+        demand = max(
+            self.running_builds + backlog,
+            math.ceil(self.predicted_load),
+            reserve_workers,
+        )
+        return min(demand, self.max_workers)
+
+    def smooth(self, demand):
+        """Scale up straight away, but only scale down by one step once the
+        previous target has held for the scale down delay."""
+        previous, changed = self.env.get_target_history(self.name)
+        if previous is None or demand >= previous:
+            return demand
+        held_since = self.env.now() - timedelta(seconds=self.scale_down_delay)
+        if changed is not None and changed > held_since:
+            return previous
+        return max(demand, previous - self.scale_down_step)
+
+    def record(self):
+        """Save the decision taken by the last measurement if it changed the
+        target # of workers. Returns None otherwise."""
+        from metaci.build.models import AutoscalingDecision
+
+        previous, _ = self.env.get_target_history(self.name)
+        if previous == self.target_workers:
+            return None
+        return AutoscalingDecision.objects.create(
+            app_name=self.name or "",
+            policy=self.policy,
+            active_builds=self.active_builds,
+            workers=self.count_workers(),
+            demand=self.demand,
+            target_workers=self.target_workers,
+            predicted_load=self.predicted_load,
+            details={
+                "running_builds": self.running_builds,
+                "max_workers": self.max_workers,
+                "worker_reserve": self.worker_reserve,
+            },
         )
-        self.target_workers = reserve_workers + other_workers
 
     def __repr__(self):
         return f"<{self.__class__.__name__} builds: {self.active_builds}, workers: {self.target_workers}>"
 
     def count_builds(self, queue):
-        return queue.count + len(StartedJobRegistry(queue=queue))
+        return queue.count + self.env.count_started(queue)
 
     def count_workers(self):
         """Count how many workers are active
 
         (Note: this assumes that all workers process the first (high-priority) queue.)
         """
-        return Worker.count(queue=self.queues[0])
+        return self.env.count_workers(self.queues[0])
+
+    def retire_workers(self, count):
+        """Drain workers until `count` of them are draining, idle ones first.
+
+        Returns the names of the workers which were asked to drain.
+        """
+        states = self.env.get_drain_states()
+        workers = self.env.all_workers(self.queues[0])
+        count -= sum(1 for worker in workers if worker.name in states)
+        candidates = sorted(
+            (worker for worker in workers if worker.name not in states),
+            key=lambda worker: worker.get_state() != WorkerStatus.IDLE,
+        )
+        return self.env.request_drain(
+            [worker.name for worker in candidates[: max(count, 0)]]
+        )
 
     def scale(self):
         """Do what is needed to achieve the target # of workers.
@@ -103,11 +353,13 @@ class LocalAutoscaler(Autoscaler):
             LocalAutoscaler.processes = []
         else:
             count = self.target_workers - self.count_workers()
-            if count > 0:
+            if count < 0:
+                self.retire_workers(-count)
+            elif count > 0:
                 logger.info(f"Starting {count} workers in burst mode")
                 for x in range(count):
                     self.processes.append(
-                        subprocess.Popen(
+                        self.env.start_worker(
                             [
                                 "python",
                                 "./manage.py",
@@ -136,7 +388,7 @@ class HerokuAutoscaler(Autoscaler):
 
     API_ROOT = "https://api.heroku.com/apps"
 
-    def __init__(self, config):
+    def __init__(self, config, environment=None):
         """config is a dict which has entries for: app_name, worker_type, and queues."""
 
         if "app_name" not in config:
@@ -152,53 +404,67 @@ class HerokuAutoscaler(Autoscaler):
         self.worker_type = config["worker_type"]
         self.base_url = f"{self.API_ROOT}/{config['app_name']}"
         self.url = f"{self.base_url}/formation/{self.worker_type}"
-        self.headers = {
-            "Accept": "application/vnd.heroku+json; version=3",
-            "Authorization": f"Bearer {settings.HEROKU_TOKEN}",
-        }
-        super().__init__(config)
+        super().__init__(config, environment)
 
     def scale(self):
-        # We should only scale down if there are no active builds,
-        # because we don't know which worker will be stopped.
-        active_workers = self.count_workers()
-        if active_workers and not self.active_builds:
-            self._scale_down(num_workers=0)
-        elif self.target_workers > active_workers:
-            self._scale_up(num_workers=self.target_workers)
+        # Drained dynos are still in the formation but no longer run a worker
+        states = {
+            dyno: state
+            for dyno, state in self.env.get_drain_states().items()
+            if dyno.startswith(f"{self.worker_type}.")
+        }
+        drained = [dyno for dyno, state in states.items() if state == drain.DRAINED]
+        active_workers = self.count_workers() + len(drained)
+
+        if self.target_workers >= active_workers or not self.active_builds:
+            self.env.cancel_drain(list(states))
+            if active_workers > self.target_workers:
+                self._scale_down(num_workers=self.target_workers)
+            elif self.target_workers > active_workers:
+                self._scale_up(num_workers=self.target_workers)
+            return
+
+        # Heroku stops the highest numbered dynos when scaling down,
+        # so drain those and scale down once they have finished their builds.
+        retiring = [
+            f"{self.worker_type}.{number}"
+            for number in range(self.target_workers + 1, active_workers + 1)
+        ]
+        self.env.cancel_drain([dyno for dyno in states if dyno not in retiring])
+        self.env.request_drain(retiring)
+        if all(states.get(dyno) == drain.DRAINED for dyno in retiring):
+            self._scale_down(num_workers=self.target_workers)
+            # Until Heroku stops them, the dynos must not start working again
+            self.env.retire_drained(retiring)
 
     def _scale_down(self, num_workers):
         logger.info(
             f"Scaling app ({self.app_name}) down to {num_workers} workers of type: {self.worker_type}"
         )
-        resp = requests.patch(
-            self.url, json={"quantity": num_workers}, headers=self.headers
-        )
+        resp = self.env.patch_formation(self.url, num_workers)
         resp.raise_for_status()
 
     def _scale_up(self, num_workers):
         logger.info(
             f"Scaling app ({self.app_name}) up to {self.target_workers} workers"
         )
-        resp = requests.patch(
-            self.url, json={"quantity": self.target_workers}, headers=self.headers
-        )
+        resp = self.env.patch_formation(self.url, self.target_workers)
         if resp.json() and resp.json().get("id") == "cannot_update_above_limit":
             limit = resp.json()["limit"]
-            resp = self.scale_max(self.url, self.headers, self.worker_type, limit)
+            resp = self.scale_max(self.url, self.worker_type, limit)
 
         resp.raise_for_status()
 
-    def scale_max(self, url, headers, worker_type, limit):
+    def scale_max(self, url, worker_type, limit):
         base_url, _ = url.rsplit("/", 1)
-        dyno_types = requests.get(base_url, headers=headers).json()
+        dyno_types = self.env.get_formation(base_url).json()
         used_by_others = sum(
             x["quantity"] for x in dyno_types if x["type"] != worker_type
         )
         target_workers = limit - used_by_others
         assert target_workers >= 0
 
-        return requests.patch(url, json={"quantity": target_workers}, headers=headers)
+        return self.env.patch_formation(url, target_workers)
 
 
 class HerokuOneOffBuilder(OneOffBuilder):
@@ -237,7 +503,7 @@ class HerokuOneOffBuilder(OneOffBuilder):
 def get_autoscaler(app_name):
     """Fetches the appropriate autoscaler given the app name"""
     autoscaler_class = import_global(settings.METACI_WORKER_AUTOSCALER)
-    return autoscaler_class(settings.AUTOSCALERS[app_name])
+    return autoscaler_class({"name": app_name, **settings.AUTOSCALERS[app_name]})
 
 
 @django_rq.job("short")
@@ -251,6 +517,31 @@ def autoscale():
         autoscaler = get_autoscaler(app_name)
         autoscaler.measure()
         autoscaler.scale()
+        autoscaler.record()
         scaling_info[app_name] = autoscaler.target_workers
 
     return scaling_info
+
+
+@django_rq.job("short")
+def prune_autoscaling_decisions():
+    """Delete recorded autoscaling decisions past their retention period.
+
+    The latest decision of each app is kept, as it holds the current target.
+    """
+    from metaci.build.models import AutoscalingDecision
+
+    cutoff = timezone.now() - timedelta(
+        days=settings.METACI_AUTOSCALER_DECISION_RETENTION_DAYS
+    )
+    latest = (
+        AutoscalingDecision.objects.order_by("app_name", "-time")
+        .distinct("app_name")
+        .values("id")
+    )
+    deleted, _ = (
+        AutoscalingDecision.objects.filter(time__lt=cutoff)
+        .exclude(id__in=latest)
+        .delete()
+    )
+    return deleted
@@ -0,0 +1,99 @@
+"""Retire specific workers without interrupting their builds.
+
+The autoscaler asks a worker to drain by marking it in a Redis hash and
+sending it rq's shutdown command. A draining worker takes no new jobs,
+finishes the one it is running and exits. Workers are identified by
+their Heroku dyno name, or by their rq worker name when not on Heroku.
+
+A drained dyno doesn't restart its worker; it is marked as drained and
+waits until the formation is scaled down (Heroku stops the highest
+numbered dynos first) or until the drain is canceled. Once the formation
+is scaled down the dyno is retired: it stays drained until Heroku has
+stopped it, and a new dyno started under the same name starts afresh.
+"""
+import os
+
+from rq.command import send_shutdown_command
+
+from metaci.build.waitlist import get_connection
+
+DRAIN_KEY = "metaci:drain"
+WORKERS_KEY = "metaci:drain:workers"
+DRAINING = "draining"
+DRAINED = "drained"
+POLL_INTERVAL = 10
+# Seconds a retired dyno stays drained, which is ample for Heroku to stop it
+RETIRED_TIMEOUT = 10 * 60
+
+
+def get_worker_id(worker_name):
+    return os.environ.get("DYNO") or worker_name
+
+
+def register(worker_name):
+    """Remember which drain id a running rq worker answers to."""
+    get_connection().hset(WORKERS_KEY, worker_name, get_worker_id(worker_name))
+
+
+def unregister(worker_name):
+    get_connection().hdel(WORKERS_KEY, worker_name)
+
+
+def retired_key(worker_id):
+    return f"metaci:drain:retired:{worker_id}"
+
+
+def get_state(worker_id):
+    connection = get_connection()
+    state = connection.hget(DRAIN_KEY, worker_id) or connection.get(
+        retired_key(worker_id)
+    )
+    return state.decode() if state else None
+
+
+def get_states():
+    return {
+        worker_id.decode(): state.decode()
+        for worker_id, state in get_connection().hgetall(DRAIN_KEY).items()
+    }
+
+
+def request(worker_ids):
+    """Ask workers to drain. Returns the ids which weren't draining yet."""
+    connection = get_connection()
+    requested = [
+        worker_id
+        for worker_id in worker_ids
+        if connection.hsetnx(DRAIN_KEY, worker_id, DRAINING)
+    ]
+    if requested:
+        names = {
+            name.decode()
+            for name, worker_id in connection.hgetall(WORKERS_KEY).items()
+            if worker_id.decode() in requested
+        }
+        # Wake workers which are waiting for a job; busy ones stop afterwards
+        for name in names:
+            send_shutdown_command(connection, name)
+    return requested
+
+
+def mark_drained(worker_id):
+    get_connection().hset(DRAIN_KEY, worker_id, DRAINED)
+
+
+def retire(worker_ids):
+    """Keep drained dynos drained until the scaled down formation stops them."""
+    if worker_ids:
+        with get_connection().pipeline() as pipe:
+            for worker_id in worker_ids:
+                pipe.set(retired_key(worker_id), DRAINED, ex=RETIRED_TIMEOUT)
+            pipe.hdel(DRAIN_KEY, *worker_ids)
+            pipe.execute()
+
+
+def cancel(worker_ids):
+    if worker_ids:
+        connection = get_connection()
+        connection.hdel(DRAIN_KEY, *worker_ids)
+        connection.delete(*[retired_key(worker_id) for worker_id in worker_ids])
@@ -6,7 +6,7 @@ from crispy_forms.layout import Submit
 from django import forms
 from django.conf import settings
 from django.utils import timezone
-from metaci.build.tasks import set_github_status
+from metaci.build import statuses
 
 
 QA_CHOICES = (
@@ -59,5 +59,5 @@ class QATestingForm(forms.Form):
         if delete_org:
             build.org_instance.delete_org()
         if settings.GITHUB_STATUS_UPDATES_ENABLED:
-            set_github_status.delay(self.build.id)
+            statuses.request(self.build.id)
         return build
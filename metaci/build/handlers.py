@@ -1,9 +1,12 @@
+import django_rq
 from django.conf import settings
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from rq import Queue
 
+from metaci.build import statuses
 from metaci.build.models import Build, Rebuild
-from metaci.build.tasks import check_queued_build, set_github_status
+from metaci.build.tasks import CHECK_QUEUED_BUILD_TIMEOUT, check_queued_build
 
 
 @receiver(post_save, sender=Build)
@@ -15,14 +18,48 @@ def queue_build(sender, **kwargs):
 
     # Queue the pending status task
     if settings.GITHUB_STATUS_UPDATES_ENABLED:
-        res_status = set_github_status.delay(build.id)
-        build.task_id_status_start = res_status.id
+        build.task_id_status_start = statuses.request(build.id)
 
     # Queue the check build task
     res_check = check_queued_build.delay(build.id)
     build.task_id_check = res_check.id
 
-    build.save()
+    Build.objects.filter(id=build.id).update(
+        task_id_status_start=build.task_id_status_start,
+        task_id_check=build.task_id_check,
+    )
+
+
+def queue_builds(builds):
+    """Queue the jobs of builds created with bulk_create, which doesn't
+    send post_save.
+
+    The check jobs are enqueued in one Redis pipeline and their ids saved
+    with one query.
+    """
+    builds = [build for build in builds if build.build_type != "manual-command"]
+    if not builds:
+        return
+
+    if settings.GITHUB_STATUS_UPDATES_ENABLED:
+        job_id = statuses.request_many([build.id for build in builds])
+        for build in builds:
+            build.task_id_status_start = job_id
+
+    jobs = django_rq.get_queue("short").enqueue_many(
+        [
+            Queue.prepare_data(
+                check_queued_build,
+                args=(build.id,),
+                timeout=CHECK_QUEUED_BUILD_TIMEOUT,
+            )
+            for build in builds
+        ]
+    )
+    for build, job in zip(builds, jobs):
+        build.task_id_check = job.id
+
+    Build.objects.bulk_update(builds, ["task_id_status_start", "task_id_check"])
 
 
 @receiver(post_save, sender=Rebuild)
@@ -42,11 +79,14 @@ def queue_rebuild(sender, **kwargs):
 
     # Queue the pending status task
     if settings.GITHUB_STATUS_UPDATES_ENABLED:
-        res_status = set_github_status.delay(build.id)
-        build.task_id_status_start = res_status.id
+        build.task_id_status_start = statuses.request(build.id)
 
     # Queue the check build task
     res_check = check_queued_build.delay(build.id)
     build.task_id_check = res_check.id
 
-    build.save()
+    Build.objects.filter(id=build.id).update(
+        current_rebuild=rebuild,
+        task_id_status_start=build.task_id_status_start,
+        task_id_check=build.task_id_check,
+    )
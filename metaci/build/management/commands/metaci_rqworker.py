@@ -1,16 +1,25 @@
 import os
+import time
 
 from django.conf import settings
 from django_rq.management.commands.rqworker import Command as BaseCommand
 from rq.exceptions import ShutDownImminentException
 from rq.worker import HerokuWorker
 
+from metaci.build import drain
+
 
 class Command(BaseCommand):
     def handle(self, *args, **options):
+        # Workers which the autoscaler can drain
+        options["worker_class"] = "metaci.build.worker.DrainableWorker"
+
         # If the DYNO environment variable is set, we are probably on Heroku.
         dyno = os.environ.get("DYNO")
         if dyno:
+            # A dyno doesn't inherit the drain of a retired dyno of the same name
+            drain.cancel([dyno])
+
             # Reserve highest numbered dynos for high-priority builds only
             number = int(dyno.split(".")[-1])
             if number > settings.METACI_MAX_WORKERS - settings.METACI_WORKER_RESERVE:
@@ -18,9 +27,17 @@ class Command(BaseCommand):
 
             # Use the HerokuWorker.
             # This ensures that workers exit in a way that can requeue running jobs.
-            options["worker_class"] = "rq.worker.HerokuWorker"
-
-        return super().handle(*args, **options)
+            options["worker_class"] = "metaci.build.worker.DrainableHerokuWorker"
+
+        while True:
+            result = super().handle(*args, **options)
+            if not dyno or drain.get_state(dyno) != drain.DRAINED:
+                return result
+            # Heroku would restart the worker if we exited. Wait for the
+            # formation to be scaled down instead, or for the drain to be
+            # canceled because the worker is needed again.
+            while drain.get_state(dyno) == drain.DRAINED:
+                time.sleep(drain.POLL_INTERVAL)
 
 
 # Raise ShutDownImminentException immediately; no reason to dilly-dally
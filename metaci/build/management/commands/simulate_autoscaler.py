@@ -0,0 +1,87 @@
+import json
+from datetime import timedelta
+
+from cumulusci.core.utils import import_global
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from metaci.build.simulator import (
+    Simulation,
+    read_trace,
+    trace_from_builds,
+    write_trace,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays past builds against an autoscaler and reports queue waits, "
+        "worker hours and cost. Nothing is scaled for real."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=7, help="Replay the builds of the last N days"
+        )
+        parser.add_argument("--trace", help="Replay the builds in this CSV trace")
+        parser.add_argument(
+            "--export",
+            help="Write the builds of the last N days to this CSV trace and exit",
+        )
+        parser.add_argument(
+            "--autoscaler",
+            default="metaci.build.autoscaling.HerokuAutoscaler",
+            help="Autoscaler class to simulate",
+        )
+        parser.add_argument(
+            "--app",
+            help="Use the config of this entry of AUTOSCALERS (default: the first)",
+        )
+        parser.add_argument(
+            "--config", default="{}", help="JSON to override the autoscaler config"
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=60,
+            help="Seconds between autoscaler runs",
+        )
+        parser.add_argument(
+            "--startup", type=int, default=60, help="Seconds for a worker to boot"
+        )
+        parser.add_argument(
+            "--cost-per-hour", type=float, default=0, help="Cost of a worker hour"
+        )
+
+    def handle(self, *args, **options):
+        if options["trace"]:
+            with open(options["trace"], newline="") as f:
+                trace = read_trace(f)
+        else:
+            trace = trace_from_builds(timezone.now() - timedelta(days=options["days"]))
+
+        if options["export"]:
+            with open(options["export"], "w", newline="") as f:
+                write_trace(trace, f)
+            self.stdout.write(f"Wrote {len(trace)} builds to {options['export']}")
+            return
+
+        app = options["app"] or next(iter(settings.AUTOSCALERS), None)
+        if app not in settings.AUTOSCALERS:
+            raise CommandError(f"There is no autoscaler config for {app}")
+        config = {**settings.AUTOSCALERS[app], **json.loads(options["config"])}
+
+        simulation = Simulation(
+            import_global(options["autoscaler"]),
+            config,
+            trace,
+            interval=options["interval"],
+            startup=options["startup"],
+            cost_per_hour=options["cost_per_hour"],
+        )
+        try:
+            report = simulation.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(str(report))
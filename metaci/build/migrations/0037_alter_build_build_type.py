@@ -0,0 +1,29 @@
+# Generated by Django 3.2.13 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("build", "0036_update_jsonfield"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="build",
+            name="build_type",
+            field=models.CharField(
+                choices=[
+                    ("manual", "Manual"),
+                    ("auto", "Auto"),
+                    ("scheduled", "Scheduled"),
+                    ("legacy", "Legacy - Probably Automatic"),
+                    ("manual-command", "Created from command line"),
+                    ("pool", "Org pool preparation"),
+                ],
+                default="legacy",
+                max_length=16,
+            ),
+        ),
+    ]
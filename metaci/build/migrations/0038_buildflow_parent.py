@@ -0,0 +1,26 @@
+# Generated by Django 3.2.13 on 2026-10-19 11:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("build", "0037_alter_build_build_type"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildflow",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Set on robot shards run on their own worker and org for this flow.",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="shards",
+                to="build.buildflow",
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.13 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+BUILD_STATUSES = [
+    ("queued", "Queued"),
+    ("waiting", "Waiting"),
+    ("running", "Running"),
+    ("success", "Success"),
+    ("error", "Error"),
+    ("fail", "Failed"),
+    ("qa", "QA Testing"),
+    ("canceled", "Canceled"),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("build", "0038_buildflow_parent"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="build",
+            name="status",
+            field=models.CharField(
+                choices=BUILD_STATUSES, default="queued", max_length=16
+            ),
+        ),
+        migrations.AlterField(
+            model_name="rebuild",
+            name="status",
+            field=models.CharField(
+                choices=BUILD_STATUSES, default="queued", max_length=16
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.13 on 2026-10-19 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("build", "0039_canceled_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="build",
+            name="config_hash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="Hash of the plan configuration the build was queued with.",
+                max_length=64,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="build",
+            name="reused_from",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Earlier build of the same commit and configuration whose result this build reports.",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="reused_by",
+                to="build.build",
+            ),
+        ),
+    ]
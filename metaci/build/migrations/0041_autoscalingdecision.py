@@ -0,0 +1,53 @@
+# Generated by Django 3.2.13 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("build", "0040_build_reuse"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AutoscalingDecision",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("app_name", models.CharField(max_length=255)),
+                ("policy", models.CharField(max_length=32)),
+                ("time", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("active_builds", models.IntegerField()),
+                (
+                    "workers",
+                    models.IntegerField(help_text="Workers running before scaling"),
+                ),
+                (
+                    "demand",
+                    models.IntegerField(
+                        help_text="Workers the policy asked for", null=True
+                    ),
+                ),
+                ("target_workers", models.IntegerField()),
+                (
+                    "predicted_load",
+                    models.FloatField(
+                        help_text="Expected busy workers given the recent arrival rate",
+                        null=True,
+                    ),
+                ),
+                ("details", models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                "ordering": ["-time"],
+            },
+        ),
+    ]
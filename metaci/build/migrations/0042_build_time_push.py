@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("build", "0041_autoscalingdecision"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="build",
+            name="time_push",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the webhook event which triggered the build was received.",
+                null=True,
+            ),
+        ),
+    ]
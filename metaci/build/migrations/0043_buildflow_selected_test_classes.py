@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("build", "0042_build_time_push"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildflow",
+            name="selected_test_classes",
+            field=models.TextField(
+                blank=True,
+                null=True,
+                help_text="Apex test classes chosen by test impact analysis. Empty if the full suite ran.",
+            ),
+        ),
+    ]
@@ -1,10 +1,15 @@
+import hashlib
 import json
+import logging
+import multiprocessing
 import os
 import shutil
 import sys
 import tempfile
+import time
 import traceback
 import zipfile
+from datetime import timedelta
 from glob import iglob
 from io import BytesIO
 
@@ -19,17 +24,29 @@ from cumulusci.core.exceptions import (
 from cumulusci.core.flowrunner import FlowCoordinator
 from cumulusci.salesforce_api.exceptions import MetadataComponentFailure
 from cumulusci.utils import elementtree_parse_file
+from django import db
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.http import Http404
 from django.urls import reverse
 from django.utils import timezone
+from github3.exceptions import GitHubError
 from jinja2.sandbox import ImmutableSandboxedEnvironment
 
-from metaci.build.tasks import set_github_status
+from metaci.build import admission, statuses, waitlist
+from metaci.build.sharding import expand_robot_suites, get_robot_suites
+from metaci.build.signals import build_complete
+from metaci.build.tasks import (
+    cancel_build_job,
+    cancel_robot_shards,
+    delete_scratch_org,
+    dispatch_robot_shard,
+)
 from metaci.build.utils import format_log, set_build_info
 from metaci.cumulusci.config import MetaCIUniversalConfig
 from metaci.cumulusci.keychain import MetaCIProjectKeychain
@@ -38,7 +55,9 @@ from metaci.release.utils import (
     send_start_webhook,
     send_stop_webhook,
 )
+from metaci.testresults.impact import get_changed_paths, select_test_classes
 from metaci.testresults.importer import import_test_results
+from metaci.testresults.planner import plan_shards, robot_suite_name
 from metaci.utils import generate_hash
 
 BUILD_STATUSES = (
@@ -49,6 +68,7 @@ BUILD_STATUSES = (
     ("error", "Error"),
     ("fail", "Failed"),
     ("qa", "QA Testing"),
+    ("canceled", "Canceled"),
 )
 BUILD_FLOW_STATUSES = (
     ("queued", "Queued"),
@@ -69,6 +89,7 @@ BUILD_TYPES = (
     ("scheduled", "Scheduled"),
     ("legacy", "Legacy - Probably Automatic"),
     ("manual-command", "Created from command line"),
+    ("pool", "Org pool preparation"),
 )
 RELEASE_REL_TYPES = (
     ("test", "Release Test"),
@@ -81,6 +102,10 @@ FAIL_EXCEPTIONS = (
     MetadataComponentFailure,
     RobotTestFailure,
 )
+# Tasks which only install a build's dependencies. Org pool builds run just
+# these steps of the plan's first flow, and builds which claim a pooled org
+# skip them and run the rest of the flow against their own commit.
+POOL_DEPENDENCY_TASKS = ("update_dependencies",)
 
 jinja2_env = ImmutableSandboxedEnvironment()
 
@@ -110,6 +135,31 @@ class BuildQuerySet(models.QuerySet):
         except Build.DoesNotExist:
             raise Http404
 
+    def bulk_create(self, objs, *args, **kwargs):
+        """Like save(), fill in the plan repository and config hash, with one
+        query for all the builds."""
+        objs = list(objs)
+        missing = [
+            build
+            for build in objs
+            if build.plan_id and build.repo_id and not build.planrepo_id
+        ]
+        if missing:
+            PlanRepository = apps.get_model("plan.PlanRepository")
+            planrepos = {
+                (planrepo.plan_id, planrepo.repo_id): planrepo
+                for planrepo in PlanRepository.objects.filter(
+                    plan_id__in={build.plan_id for build in missing},
+                    repo_id__in={build.repo_id for build in missing},
+                )
+            }
+            for build in missing:
+                build.planrepo = planrepos.get((build.plan_id, build.repo_id))
+        for build in objs:
+            if build.config_hash is None and build.plan_id:
+                build.config_hash = build.plan.get_config_hash()
+        return super().bulk_create(objs, *args, **kwargs)
+
 
 class Build(models.Model):
     repo = models.ForeignKey(
@@ -188,6 +238,11 @@ class Build(models.Model):
         on_delete=models.SET_NULL,
     )
     time_queue = models.DateTimeField(auto_now_add=True)
+    time_push = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the webhook event which triggered the build was received.",
+    )
     time_start = models.DateTimeField(null=True, blank=True)
     time_end = models.DateTimeField(null=True, blank=True)
     time_qa_start = models.DateTimeField(null=True, blank=True)
@@ -206,29 +261,55 @@ class Build(models.Model):
     )
     org_note = models.CharField(max_length=255, default="", blank=True, null=True)
     org_api_version = models.CharField(max_length=5, blank=True, null=True)
+    config_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Hash of the plan configuration the build was queued with.",
+    )
+    reused_from = models.ForeignKey(
+        "build.Build",
+        related_name="reused_by",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        help_text="Earlier build of the same commit and configuration whose result this build reports.",
+    )
 
     objects = BuildQuerySet.as_manager()
 
+    # Set to the name of the flow whose dependency steps a claimed org pool
+    # org has already run
+    prepared_flow = None
+
     class Meta:
         ordering = ["-time_queue"]
         permissions = (("search_builds", "Search Builds"),)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._try_populate_planrepo()
+        # Builds loaded from the database are constructed with positional
+        # field values, and already have their plan repository if any.
+        # Callers which pass a plan repository have already looked it up.
+        if not args and "planrepo" not in kwargs and "planrepo_id" not in kwargs:
+            self._try_populate_planrepo()
 
     def save(self, *args, **kwargs):
-        self._try_populate_planrepo()
+        if self._state.adding:
+            self._try_populate_planrepo()
+            # Builds from before config hashes were recorded are left
+            # without one, so they are never reused
+            if self.config_hash is None and self.plan_id:
+                self.config_hash = self.plan.get_config_hash()
         super().save(*args, **kwargs)
 
     def _try_populate_planrepo(self):
-        if self.plan_id and self.repo_id and not self.planrepo:
+        if self.plan_id and self.repo_id and not self.planrepo_id:
             PlanRepository = apps.get_model("plan.PlanRepository")
-            matching_repo = PlanRepository.objects.filter(
-                plan=self.plan, repo=self.repo
-            )
-            if matching_repo.exists():
-                self.planrepo = matching_repo[0]
+            self.planrepo = PlanRepository.objects.filter(
+                plan_id=self.plan_id, repo_id=self.repo_id
+            ).first()
 
     def __str__(self):
         return f"{self.id}: {self.repo} - {self.commit}"
@@ -355,43 +436,21 @@ class Build(models.Model):
 
         # Run flows
         try:
-            flows = [flow.strip() for flow in self.plan.flows.split(",")]
-            for flow in flows:
-                self.logger = init_logger(self)
-                self.logger.info(f"Running flow: {flow}")
-                self.save()
-
-                build_flow = BuildFlow(
-                    build=self, rebuild=self.current_rebuild, flow=flow
-                )
-                build_flow.save()
-                build_flow.run(project_config, org_config, self.root_dir)
-
-                if build_flow.status != "success":
-                    self.logger = init_logger(self)
-                    self.logger.error(
-                        f"Build flow {flow} completed with status {build_flow.status}"
-                    )
-                    self.logger.error(
-                        f"    {build_flow.exception}: {build_flow.error_message}"
-                    )
-                    set_build_info(
-                        build,
-                        status=build_flow.status,
-                        exception=build_flow.exception,
-                        traceback=build_flow.traceback,
-                        error_message=build_flow.error_message,
-                        time_end=timezone.now(),
-                    )
-                    self.flush_log()
+            for stage in self.get_flow_stages():
+                build_flows = self.run_stage(stage, project_config, org_config)
+                failed = [bf for bf in build_flows if bf.status != "success"]
+                if failed:
+                    self.record_failed_flows(build, failed)
                     if org_config.created:
                         self.delete_org(org_config)
                     return
-                else:
-                    self.logger = init_logger(self)
-                    self.logger.info(f"Build flow {flow} completed successfully")
-                    self.flush_log()
-                    self.save()
+                self.logger = init_logger(self)
+                for build_flow in build_flows:
+                    self.logger.info(
+                        f"Build flow {build_flow.flow} completed successfully"
+                    )
+                self.flush_log()
+                self.save()
 
         except Exception as e:
             set_build_info(
@@ -407,36 +466,14 @@ class Build(models.Model):
             self.logger = init_logger(self)
             self.logger.error(str(e))
             self.delete_build_dir()
-            if self.plan.change_traffic_control:
-                try:
-                    send_stop_webhook(
-                        self.release,
-                        self.plan.role,
-                        self.org.configuration_item,
-                        "Failed - no impact",
-                    )
-                except Exception as err:
-                    self.logger.error(str(err))
+            self._send_stop_webhook("Failed - no impact")
             self.flush_log()
             return
 
-        if self.plan.role == "qa":
-            self.logger.info("Build complete, org is now ready for QA testing")
-        elif org_config.created:
-            self.delete_org(org_config)
-
+        self.release_org(org_config, project_config)
         self.delete_build_dir()
-        if self.plan.change_traffic_control:
-            try:
-                send_stop_webhook(
-                    self.release,
-                    self.plan.role,
-                    self.org.configuration_item,
-                    "Implemented - per plan",
-                )
-            except Exception as err:
-                self.logger.error(str(err))
-                return
+        if not self._send_stop_webhook("Implemented - per plan"):
+            return
         self.flush_log()
 
         if self.plan.role == "qa":
@@ -449,20 +486,161 @@ class Build(models.Model):
         else:
             set_build_info(build, status="success", time_end=timezone.now())
 
-    def checkout(self):
+    def release_org(self, org_config, project_config):
+        """Hand the org of a finished build over to QA or the pool, or delete it."""
+        if self.plan.role == "qa":
+            self.logger.info("Build complete, org is now ready for QA testing")
+        elif self.build_type == "pool" and org_config.created:
+            self.add_org_to_pool(org_config, project_config)
+        elif org_config.created:
+            self.delete_org(org_config)
+
+    def get_flow_stages(self):
+        """Return the stages of flows this build runs."""
+        stages = self.plan.get_flow_stages()
+        if self.build_type == "pool":
+            # Pool builds only run the preparation flow
+            stages = stages[:1]
+        return stages
+
+    def run_stage(self, stage, project_config, org_config):
+        """Run one stage of the plan's flows. Returns the BuildFlows it ran."""
+        if len(stage) > 1:
+            return self.run_parallel_flows(stage, project_config, org_config)
+
+        self.logger = init_logger(self)
+        self.logger.info(f"Running flow: {stage[0]}")
+        build_flow = BuildFlow(build=self, rebuild=self.current_rebuild, flow=stage[0])
+        if self.build_type == "pool":
+            build_flow.dependency_steps = "only"
+        elif stage[0] == self.prepared_flow:
+            self.logger.info(
+                f"Skipping the dependency steps of flow {stage[0]}: reused org "
+                f"{org_config.org_instance} prepared by build "
+                f"#{org_config.org_instance.build_id}"
+            )
+            build_flow.dependency_steps = "skip"
+            self.prepared_flow = None
+        self.save()
+        build_flow.save()
+        build_flow.run(project_config, org_config, self.root_dir)
+        return [build_flow]
+
+    def record_failed_flows(self, build, failed):
+        """Log the flows which didn't succeed and fail the build with them."""
+        self.logger = init_logger(self)
+        for build_flow in failed:
+            self.logger.error(
+                f"Build flow {build_flow.flow} completed with status {build_flow.status}"
+            )
+            self.logger.error(f"    {build_flow.exception}: {build_flow.error_message}")
+        # An error in any flow outranks a test failure in another
+        failed.sort(key=lambda bf: bf.status != "error")
+        set_build_info(
+            build,
+            status=failed[0].status,
+            exception=failed[0].exception,
+            traceback=failed[0].traceback,
+            error_message=failed[0].error_message,
+            time_end=timezone.now(),
+        )
+        self.flush_log()
+
+    def _send_stop_webhook(self, message):
+        """Tell change traffic control the build stopped. Returns False if that failed."""
+        if not self.plan.change_traffic_control:
+            return True
+        try:
+            send_stop_webhook(
+                self.release,
+                self.plan.role,
+                self.org.configuration_item,
+                message,
+            )
+        except Exception as err:
+            self.logger.error(str(err))
+            return False
+        return True
+
+    def run_parallel_flows(self, flows, project_config, org_config):
+        """Run a stage of flows concurrently, each in its own process.
+
+        Each flow gets its own copy of the build directory and its own
+        BuildFlow log. If the plan asks for it, each flow after the first
+        also gets its own scratch org, which is deleted when the stage ends.
+        """
+        self.logger = init_logger(self)
+        self.logger.info(f"Running flows in parallel: {', '.join(flows)}")
+
+        org_configs = [org_config]
+        for flow in flows[1:]:
+            if self.plan.parallel_flow_orgs and org_config.scratch:
+                self.logger.info(f"Creating a separate org for flow {flow}")
+                org_configs.append(project_config.keychain.get_org(self.org.name))
+            else:
+                org_configs.append(org_config)
+        self.logger = init_logger(self)
+        self.flush_log()
+        self.save()
+
+        build_flows = []
+        for flow in flows:
+            build_flow = BuildFlow(build=self, rebuild=self.current_rebuild, flow=flow)
+            build_flow.save()
+            build_flows.append(build_flow)
+
+        # Each child process must open its own database connection
+        db.connections.close_all()
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(
+                target=run_parallel_flow, args=(build_flow, flow_org_config)
+            )
+            for build_flow, flow_org_config in zip(build_flows, org_configs)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        for build_flow, process in zip(build_flows, processes):
+            build_flow.refresh_from_db()
+            if build_flow.status in ("queued", "running"):
+                set_build_info(
+                    build_flow,
+                    status="error",
+                    error_message=f"Flow process exited with code {process.exitcode}",
+                    time_end=timezone.now(),
+                )
+        # A flow may have set the commit status in its own process
+        self.refresh_from_db(fields=["commit_status"])
+
+        for build_flow, flow_org_config in zip(build_flows[1:], org_configs[1:]):
+            if flow_org_config is not org_config and flow_org_config.created:
+                self.delete_org(flow_org_config, flow_org_config.org_instance)
+
+        return build_flows
+
+    def checkout(self, flow=None):
+        """Extract the build's commit to a temp dir and return its path.
+
+        A robot shard passes its BuildFlow, which is logged to and saved
+        instead of the build its parent flow is running.
+        """
+        log_model = flow or self
         # get the ref
         zip_content = BytesIO()
         gh = self.repo.get_github_api()
         gh.archive("zipball", zip_content, ref=self.commit)
         build_dir = tempfile.mkdtemp()
         self.logger.info(f"-- Extracting zip to temp dir {build_dir}")
-        self.save()
+        log_model.save()
         zip_file = zipfile.ZipFile(zip_content)
         zip_file.extractall(build_dir)
         # assume the zipfile has a single child dir with the repo
         build_dir = os.path.join(build_dir, os.listdir(build_dir)[0])
         self.logger.info(f"-- Commit extracted to build dir: {build_dir}")
-        self.save()
+        log_model.save()
 
         if self.plan.sfdx_config:
             self.logger.info("-- Injecting custom sfdx-workspace.json from plan")
@@ -472,10 +650,10 @@ class Build(models.Model):
 
         return build_dir
 
-    def get_project_config(self):
+    def get_project_config(self, flow=None):
         universal_config = MetaCIUniversalConfig()
         project_config = universal_config.get_project_config(self)
-        keychain = MetaCIProjectKeychain(project_config, None, self)
+        keychain = MetaCIProjectKeychain(project_config, None, self, flow=flow)
         project_config.set_keychain(keychain)
         return project_config
 
@@ -487,10 +665,12 @@ class Build(models.Model):
             org_name = self.org.name
         else:
             org_name = self.plan.org
-        while True:
+        org_config = None
+        if self.plan.org_pool_size and self.build_type != "pool":
+            org_config = self.get_pooled_org(project_config, org_name)
+        while org_config is None:
             try:
                 org_config = project_config.keychain.get_org(org_name)
-                break
             except ScratchOrgException as e:
                 if (
                     str(e).startswith(FAILED_TO_CREATE_SCRATCH_ORG)
@@ -514,6 +694,66 @@ class Build(models.Model):
         self.save()
         return org_config
 
+    def get_pool_fingerprint(self, project_config):
+        """Hash the inputs of the plan's first flow, whose dependency steps
+        prepare the org.
+
+        Builds with the same fingerprint install the same dependencies
+        with the same steps, so they can share a prepared org.
+        """
+        flow = self.plan.flows.split(",")[0].strip()
+        inputs = {
+            "repo": self.repo_id,
+            "plan": self.plan_id,
+            "org": self.plan.org,
+            "flow": flow,
+            "steps": project_config.get_flow(flow).config.get("steps"),
+            "dependencies": project_config.project__dependencies,
+        }
+        return hashlib.sha256(
+            json.dumps(inputs, sort_keys=True, cls=GnarlyEncoder).encode()
+        ).hexdigest()
+
+    def get_pooled_org(self, project_config, org_name):
+        """Claim a prepared org from the org pool, if one matches this build."""
+        Org = apps.get_model("cumulusci", "Org")
+        ScratchOrgInstance = apps.get_model("cumulusci", "ScratchOrgInstance")
+        try:
+            org = Org.objects.get(repo=self.repo, name=org_name, scratch=True)
+        except Org.DoesNotExist:
+            return None
+
+        if len(self.plan.get_flow_stages()[0]) > 1:
+            # Only a single flow can be skipped
+            return None
+
+        fingerprint = self.get_pool_fingerprint(project_config)
+        org_instance = ScratchOrgInstance.claim_pooled(
+            org,
+            fingerprint,
+            min_expiration=timezone.now() + timedelta(seconds=self.plan.build_timeout),
+        )
+        if org_instance is None:
+            self.logger.info(f"No prepared org found for fingerprint {fingerprint}")
+            return None
+
+        self.logger.info(f"Using prepared org {org_instance} from the org pool")
+        self.prepared_flow = self.plan.flows.split(",")[0].strip()
+        if self.planrepo_id:
+            from metaci.build.tasks import fill_org_pool
+
+            fill_org_pool.delay(self.planrepo_id)
+        return project_config.keychain.get_prepared_org(org_instance)
+
+    def add_org_to_pool(self, org_config, project_config):
+        """Keep the org prepared by a pool build so a later build can claim it."""
+        org_instance = self.get_org_instance()
+        org_instance.pool_fingerprint = self.get_pool_fingerprint(project_config)
+        org_instance.save()
+        self.logger.info(
+            f"Added org {org_instance} to the org pool with fingerprint {org_instance.pool_fingerprint}"
+        )
+
     def get_org_instance(self):
         if self.current_rebuild and self.current_rebuild.org_instance:
             return self.current_rebuild.org_instance
@@ -543,8 +783,14 @@ class Build(models.Model):
     def get_org_username(self):
         return self.get_org_attr("username")
 
-    def delete_org(self, org_config):
-        self.logger = init_logger(self)
+    def delete_org(self, org_config, org_instance=None, flow=None):
+        """Delete a scratch org unless the plan or build asks to keep it.
+
+        A robot shard passes its BuildFlow, whose status decides and whose
+        log records what happens, so that the build isn't saved.
+        """
+        log_model = flow or self
+        self.logger = init_logger(log_model)
         if not org_config.scratch:
             return
         if self.keep_org:
@@ -552,29 +798,135 @@ class Build(models.Model):
                 "Skipping scratch org deletion since keep_org was requested"
             )
             return
-        if self.status == "error" and self.plan.keep_org_on_error:
+        if log_model.status == "error" and self.plan.keep_org_on_error:
             self.logger.info(
                 "Skipping scratch org deletion since keep_org_on_error is enabled"
             )
             return
-        if self.status == "fail" and self.plan.keep_org_on_fail:
+        if log_model.status == "fail" and self.plan.keep_org_on_fail:
             self.logger.info(
                 "Skipping scratch org deletion since keep_org_on_fail is enabled"
             )
             return
 
         try:
-            org_instance = self.get_org_instance()
+            org_instance = org_instance or self.get_org_instance()
             org_instance.delete_org(org_config)
         except Exception as e:
             self.logger.error(str(e))
-            self.save()
+            log_model.save()
+
+    def find_reusable_build(self):
+        """Find an earlier successful build of this commit with the same plan configuration."""
+        builds = Build.objects.filter(
+            repo_id=self.repo_id,
+            plan_id=self.plan_id,
+            commit=self.commit,
+            config_hash=self.plan.get_config_hash(),
+            status="success",
+            current_rebuild__isnull=True,
+        ).exclude(id=self.id)
+        # Pool builds only run the plan's first flow
+        builds = builds.exclude(build_type="pool")
+        if self.plan.test_impact_analysis:
+            # the tests which run depend on the branch
+            builds = builds.filter(branch_id=self.branch_id)
+        return builds.order_by("-time_end").first()
+
+    def reuse_result(self, previous):
+        """Report the result of an earlier build instead of running this one."""
+        now = timezone.now()
+        self.reused_from = previous
+        self.commit_status = previous.commit_status
+        self.log = (
+            f"Commit {self.commit} already passed plan {self.plan} with the same "
+            f"configuration in build #{previous.id}. Reusing its result.\n"
+        )
+        self.status = "success"
+        self.time_start = now
+        self.time_end = now
+        self.task_id_check = None
+        self.save()
+
+        if settings.GITHUB_STATUS_UPDATES_ENABLED:
+            statuses.request(self.id)
+        build_complete.send(sender=self.__class__, build=self, status=self.status)
 
-    def delete_build_dir(self):
+    def cancel(self, message):
+        """Cancel a build which hasn't finished.
+
+        Queued builds are removed from the rq queue and running builds are
+        stopped. Returns False if the build couldn't be stopped.
+        """
+        status = self.get_status()
+        if status not in ("queued", "waiting", "running"):
+            return False
+        if not cancel_build_job(self) and status == "running":
+            return False
+        cancel_robot_shards(
+            list(
+                self.flows.filter(
+                    parent__isnull=False, status__in=("queued", "running")
+                )
+            )
+        )
+
+        self.log = (self.log or "") + f"\n{message}\n"
+        self.save()
+        set_build_info(self.get_build(), status="canceled", time_end=timezone.now())
+        self.flows.filter(status__in=("queued", "running")).update(
+            status="error", error_message=message, time_end=timezone.now()
+        )
+
+        # Release the org for the next build
+        if self.org and not self.org.scratch:
+            if cache.get(self.org.lock_id) == f"build-{self.id}":
+                cache.delete(self.org.lock_id)
+            waitlist.wake(self.org)
+        if status == "running":
+            for org_instance in self.scratch_orgs.filter(deleted=False):
+                delete_scratch_org.delay(org_instance.id)
+        admission.wake()
+
+        if settings.GITHUB_STATUS_UPDATES_ENABLED:
+            statuses.request(self.id)
+        return True
+
+    def cancel_superseded_builds(self):
+        """Cancel older automatic builds of this plan on the same branch.
+
+        Builds are ordered by when their push was received rather than
+        when they were created, since webhook events may be processed out
+        of order.
+        """
+        cancelable = ["queued", "waiting"]
+        if self.plan.cancel_superseded == "running":
+            cancelable.append("running")
+        builds = (
+            Build.objects.annotate(pushed=Coalesce("time_push", "time_queue"))
+            .filter(
+                planrepo=self.planrepo,
+                branch=self.branch,
+                build_type="auto",
+                status__in=cancelable,
+                pushed__lt=self.time_push or self.time_queue,
+            )
+            .exclude(commit=self.commit)
+            .exclude(id=self.id)
+        )
+        canceled = []
+        for build in builds:
+            if build.cancel(
+                f"Canceled because build #{self.id} was queued for newer commit {self.commit}"
+            ):
+                canceled.append(build)
+        return canceled
+
+    def delete_build_dir(self, flow=None):
         if hasattr(self, "build_dir"):
             self.logger.info(f"Deleting build dir {self.build_dir}")
             shutil.rmtree(self.build_dir)
-            self.save()
+            (flow or self).save()
 
 
 class BuildFlow(models.Model):
@@ -603,6 +955,24 @@ class BuildFlow(models.Model):
     tests_pass = models.IntegerField(null=True, blank=True)
     tests_fail = models.IntegerField(null=True, blank=True)
     asset_hash = models.CharField(max_length=64, unique=True, default=generate_hash)
+    parent = models.ForeignKey(
+        "build.BuildFlow",
+        related_name="shards",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        help_text="Set on robot shards run on their own worker and org for this flow.",
+    )
+    selected_test_classes = models.TextField(
+        null=True,
+        blank=True,
+        help_text="Apex test classes chosen by test impact analysis. Empty if the full suite ran.",
+    )
+
+    robot_suites = None
+    # Set to "only" to run just the steps of the flow which install
+    # dependencies, or to "skip" to run all the others
+    dependency_steps = None
 
     def __str__(self):
         return f"{self.build.id}: {self.build.repo} - {self.build.commit} - {self.flow}"
@@ -624,12 +994,16 @@ class BuildFlow(models.Model):
 
         # Update github status
         if settings.GITHUB_STATUS_UPDATES_ENABLED:
-            set_github_status.delay(self.build_id)
+            statuses.request(self.build_id)
 
         # Set up logger
         self.logger = init_logger(self)
 
+        shards = []
         try:
+            # Hand off part of the robot suites to other workers
+            shards = self.dispatch_robot_shards(project_config, org_config)
+
             # Run the flow
             self.run_flow(project_config, org_config)
 
@@ -654,13 +1028,151 @@ class BuildFlow(models.Model):
             exception = e
             status = "error"
 
-        kwargs = {"status": status, "time_end": timezone.now()}
+        kwargs = {"status": status}
         if exception:
             kwargs["error_message"] = str(exception)
             kwargs["exception"] = exception.__class__.__name__
             kwargs["traceback"] = "".join(traceback.format_tb(exception.__traceback__))
+        if shards:
+            failed = [
+                shard
+                for shard in self.wait_for_robot_shards(shards)
+                if shard.status != "success"
+            ]
+            failed.sort(key=lambda shard: shard.status != "error")
+            if failed and (
+                status == "success"
+                or (status == "fail" and failed[0].status == "error")
+            ):
+                kwargs.update(
+                    status=failed[0].status,
+                    error_message=failed[0].error_message,
+                    exception=failed[0].exception,
+                    traceback=failed[0].traceback,
+                )
+        kwargs["time_end"] = timezone.now()
         set_build_info(self, **kwargs)
 
+    def dispatch_robot_shards(self, project_config, org_config):
+        """Queue robot shards for this flow if the plan asks for sharding.
+
+        The first shard runs in this flow. Each of the others is run by a
+        child BuildFlow on the robot queue, with its own checkout and org.
+        Returns (BuildFlow, job) pairs for the child shards.
+        """
+        plan = self.build.plan
+        if self.parent_id or plan.robot_shards < 2 or not org_config.scratch:
+            return []
+        if plan.queue == "robot":
+            # Waiting here would hold a robot worker which a shard needs
+            self.logger.warning(
+                "Not sharding robot suites since the plan runs on the robot queue"
+            )
+            return []
+        suites = get_robot_suites(project_config, self.flow)
+        shards = plan_shards(
+            self.build.repo,
+            suites,
+            plan.robot_shards,
+            plan=plan,
+            test_type="Robot",
+            key=robot_suite_name,
+        )
+        if len(shards) < 2:
+            return []
+
+        self.robot_suites = shards[0].tests
+        self.logger.info(
+            f"Splitting {len(suites)} robot suites into {len(shards)} shards"
+        )
+        jobs = []
+        for planned in shards[1:]:
+            shard = BuildFlow.objects.create(
+                build=self.build, rebuild=self.rebuild, flow=self.flow, parent=self
+            )
+            jobs.append((shard, dispatch_robot_shard(shard, planned.tests)))
+            self.logger.info(
+                f"Queued shard {shard.id} with {len(planned.tests)} suites "
+                f"(about {planned.duration:.0f}s) as job {jobs[-1][1].id}"
+            )
+        return jobs
+
+    def wait_for_robot_shards(self, jobs):
+        """Wait for child shards to finish, then merge their results into this flow."""
+        self.logger.info(f"Waiting for {len(jobs)} robot shards")
+        deadline = time.monotonic() + self.build.plan.build_timeout
+        pending = list(jobs)
+        while pending and time.monotonic() < deadline:
+            for shard, job in list(pending):
+                shard.refresh_from_db()
+                job_status = job.get_status()
+                if shard.status in ("success", "fail", "error"):
+                    pending.remove((shard, job))
+                elif job_status in ("failed", "stopped", "canceled", None):
+                    set_build_info(
+                        shard,
+                        status="error",
+                        error_message=f"Shard job {job.id} ended with status {job_status}",
+                        time_end=timezone.now(),
+                    )
+                    pending.remove((shard, job))
+            if pending:
+                time.sleep(settings.METACI_ROBOT_SHARD_POLL_INTERVAL)
+        # Stop the shards, so that they don't create orgs for nothing later
+        cancel_robot_shards([shard for shard, job in pending])
+        for shard, job in pending:
+            set_build_info(
+                shard,
+                status="error",
+                error_message="Timed out waiting for shard to finish",
+                time_end=timezone.now(),
+            )
+
+        shard_flows = [shard for shard, job in jobs]
+        TestResult = apps.get_model("testresults", "TestResult")
+        TestResult.objects.filter(build_flow__in=shard_flows).update(build_flow=self)
+        BuildFlowAsset.objects.filter(build_flow__in=shard_flows).update(
+            build_flow=self
+        )
+        for shard in shard_flows:
+            shard.count_test_results()
+            self.logger.info(f"Shard {shard.id} finished with status {shard.status}")
+        self.count_test_results()
+        return shard_flows
+
+    def run_shard(self, suites):
+        """Run the given robot suites as a shard of the parent flow.
+
+        The parent flow's worker owns the build, so the shard only writes
+        its own BuildFlow: it logs there, and its checkout, org and build
+        dir don't save the build.
+        """
+        build = self.build
+        build.logger = init_logger(self)
+        build.root_dir = os.getcwd()
+        org_config = None
+        try:
+            build.build_dir = build.checkout(flow=self)
+            os.chdir(build.build_dir)
+            project_config = build.get_project_config(flow=self)
+            org_config = project_config.keychain.get_org(build.org.name)
+            self.robot_suites = suites
+            self.run(project_config, org_config, build.root_dir)
+        except Exception as e:
+            set_build_info(
+                self,
+                status="error",
+                time_end=timezone.now(),
+                error_message=str(e),
+                exception=e.__class__.__name__,
+                traceback="".join(traceback.format_tb(e.__traceback__)),
+            )
+        finally:
+            if org_config is not None and org_config.created:
+                build.delete_org(org_config, org_config.org_instance, flow=self)
+            os.chdir(build.root_dir)
+            build.delete_build_dir(flow=self)
+
     def run_flow(self, project_config, org_config):
         # Add the repo root to syspath to allow for custom tasks and flows in
         # the repo
@@ -683,10 +1195,43 @@ class BuildFlow(models.Model):
             options=options,
             callbacks=callbacks,
         )
+        if self.dependency_steps:
+            self.skip_steps()
+        if self.robot_suites:
+            self.limit_robot_suites(project_config)
 
         # Run the flow
         return self.flow_instance.run(org_config)
 
+    def skip_steps(self):
+        """Skip the dependency steps of the flow, or all but those."""
+        skip_dependencies = self.dependency_steps == "skip"
+        for step in self.flow_instance.steps:
+            if (step.task_name in POOL_DEPENDENCY_TASKS) == skip_dependencies:
+                step.skip = True
+
+    def limit_robot_suites(self, project_config):
+        """Limit the robot steps of the flow to the suites of this shard.
+
+        Robot steps whose suites weren't split into shards, such as those
+        of nested flows, only run in the parent flow.
+        """
+        sharded = set(get_robot_suites(project_config, self.flow))
+        for step in self.flow_instance.steps:
+            if step.task_name != "robot":
+                continue
+            options = step.task_config.setdefault("options", {})
+            suites = expand_robot_suites(options.get("suites"))
+            if not sharded.intersection(suites):
+                if self.parent_id:
+                    step.skip = True
+                continue
+            suites = [suite for suite in suites if suite in self.robot_suites]
+            if suites:
+                options["suites"] = ",".join(suites)
+            else:
+                step.skip = True
+
     def _get_flow_options(self) -> dict:
         options = {}
 
@@ -723,14 +1268,41 @@ class BuildFlow(models.Model):
                 if push_time:
                     task_options["start_time"] = push_time.isoformat()
 
+        # Limit Apex tests to the classes affected by a feature branch
+        if self.build.plan.test_impact_analysis:
+            test_classes = self._get_impacted_test_classes()
+            if test_classes:
+                self.selected_test_classes = ",".join(test_classes)
+                options.setdefault("run_tests", {})[
+                    "test_name_match"
+                ] = self.selected_test_classes
+
         return options
 
+    def _get_impacted_test_classes(self):
+        """Select Apex test classes for feature branches.
+
+        Returns None, meaning the full suite, on the default branch, if
+        the changed files can't be determined or if a full run hasn't
+        covered some of them yet.
+        """
+        try:
+            paths = get_changed_paths(self.build)
+        except GitHubError:
+            return None
+        if paths is None:
+            return None
+        return select_test_classes(self.build, paths)
+
     def set_commit_status(self):
+        # Shards only run part of the flow; the parent flow sets the status
+        if self.parent_id:
+            return
         if self.build.plan.commit_status_template:
             template = jinja2_env.from_string(self.build.plan.commit_status_template)
             message = template.render(results=self.flow_instance.results)
             self.build.commit_status = message
-            self.build.save()
+            Build.objects.filter(id=self.build_id).update(commit_status=message)
 
     def record_result(self):
         self.status = "success"
@@ -772,6 +1344,9 @@ class BuildFlow(models.Model):
         if results:
             import_test_results(self, results, "Apex")
 
+        self.count_test_results()
+
+    def count_test_results(self):
         self.tests_total = self.test_results.count()
         self.tests_pass = self.test_results.filter(outcome="Pass").count()
         self.tests_fail = self.test_results.filter(
@@ -807,6 +1382,31 @@ class BuildFlow(models.Model):
         return results
 
 
+def run_parallel_flow(build_flow, org_config):
+    """Run one flow of a parallel stage in a forked child process."""
+    # The inherited log handler writes to the build, which the parent owns
+    logger = logging.getLogger("cumulusci")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    # Work in a private copy of the build directory, so that flows
+    # don't overwrite each other's test results
+    build = build_flow.build
+    build_dir = tempfile.mkdtemp()
+    build.build_dir = os.path.join(build_dir, os.path.basename(build.build_dir))
+    shutil.copytree(os.getcwd(), build.build_dir)
+    os.chdir(build.build_dir)
+    try:
+        # Load the project config from the copy, so that nothing it caches
+        # points into the shared directory
+        project_config = build.get_project_config()
+        build_flow.run(project_config, org_config, build.root_dir)
+    finally:
+        os.chdir(build.root_dir)
+        shutil.rmtree(build_dir)
+        db.connections.close_all()
+
+
 def asset_upload_to(instance, filename):
     folder = instance.build_flow.asset_hash
     return os.path.join(folder, filename)
@@ -905,3 +1505,25 @@ class FlowTask(models.Model):
         ordering = ["-build_flow", "stepnum"]
         verbose_name = "Flow Task"
         verbose_name_plural = "Flow Tasks"
+
+
+class AutoscalingDecision(models.Model):
+    """A worker count chosen by an autoscaler, kept for later analysis."""
+
+    app_name = models.CharField(max_length=255)
+    policy = models.CharField(max_length=32)
+    time = models.DateTimeField(auto_now_add=True, db_index=True)
+    active_builds = models.IntegerField()
+    workers = models.IntegerField(help_text="Workers running before scaling")
+    demand = models.IntegerField(null=True, help_text="Workers the policy asked for")
+    target_workers = models.IntegerField()
+    predicted_load = models.FloatField(
+        null=True, help_text="Expected busy workers given the recent arrival rate"
+    )
+    details = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ["-time"]
+
+    def __str__(self):
+        return f"{self.app_name} at {self.time}: {self.target_workers} workers"
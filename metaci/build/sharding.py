@@ -0,0 +1,47 @@
+import os
+from typing import List
+
+
+def get_robot_suites(project_config, flow_name: str) -> List[str]:
+    """List the .robot suite files run by the robot steps of a flow.
+
+    Paths are relative to the build directory, which is expected to be
+    the current working directory. Only top level steps of the flow are
+    considered since nested flows are not split.
+    """
+    flow_config = project_config.get_flow(flow_name)
+    task_options = (project_config.lookup("tasks__robot") or {}).get("options", {})
+
+    suites = []
+    for step in (flow_config.config.get("steps") or {}).values():
+        if step.get("task") != "robot":
+            continue
+        paths = (step.get("options") or {}).get("suites") or task_options.get("suites")
+        suites.extend(expand_robot_suites(paths))
+    return sorted(set(suites))
+
+
+def expand_robot_suites(paths) -> List[str]:
+    """List the .robot suite files of a robot task's suites option.
+
+    The option is a list or a comma separated string of suite files and
+    directories, which are searched for suite files.
+    """
+    if not paths:
+        return []
+    if isinstance(paths, str):
+        paths = paths.split(",")
+    suites = []
+    for path in paths:
+        path = path.strip()
+        if os.path.isfile(path):
+            suites.append(path)
+        elif os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                suites.extend(
+                    os.path.join(dirpath, filename)
+                    for filename in sorted(filenames)
+                    if filename.endswith(".robot")
+                )
+    return suites
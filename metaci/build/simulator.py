@@ -0,0 +1,400 @@
+"""Replay build history against an autoscaler to compare scaling policies.
+
+Builds are taken from the Build table or from a CSV trace exported with
+write_trace. The autoscaler runs unmodified, on a simulated clock, with
+the simulation as its environment: it stands in for the rq queues and
+workers, the Heroku formation API, local worker processes and the drain
+protocol. Workers take builds from the queues in the order of the
+autoscaler's queues, high first.
+"""
+import csv
+import heapq
+import itertools
+import math
+import typing as T
+from datetime import datetime, timedelta
+from statistics import median
+
+from django.utils.dateparse import parse_datetime
+
+from metaci.build import autoscaling, drain
+
+# How long the autoscaler is left to wind the formation down after the
+# last build, in seconds
+WIND_DOWN = 24 * 60 * 60
+
+
+class TraceBuild(T.NamedTuple):
+    arrival: datetime
+    duration: float
+    queue: str
+    plan_id: int
+
+
+TRACE_FIELDS = TraceBuild._fields
+
+
+def trace_from_builds(since, until=None):
+    """Return a trace of the builds queued between since and until."""
+    from metaci.build.models import Build
+
+    builds = Build.objects.filter(
+        time_queue__gte=since,
+        time_start__isnull=False,
+        time_end__isnull=False,
+    )
+    if until is not None:
+        builds = builds.filter(time_queue__lt=until)
+    builds = builds.order_by("time_queue").values_list(
+        "time_queue", "time_start", "time_end", "plan__queue", "plan_id"
+    )
+    return [
+        TraceBuild(time_queue, (time_end - time_start).total_seconds(), queue, plan)
+        for time_queue, time_start, time_end, queue, plan in builds.iterator()
+    ]
+
+
+def write_trace(trace, f):
+    writer = csv.writer(f)
+    writer.writerow(TRACE_FIELDS)
+    for build in trace:
+        writer.writerow(
+            [build.arrival.isoformat(), build.duration, build.queue, build.plan_id]
+        )
+
+
+def read_trace(f):
+    return sorted(
+        (
+            TraceBuild(
+                arrival=parse_datetime(row["arrival"]),
+                duration=float(row["duration"]),
+                queue=row["queue"],
+                plan_id=int(row["plan_id"]),
+            )
+            for row in csv.DictReader(f)
+        ),
+        key=lambda build: build.arrival,
+    )
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+class Report(T.NamedTuple):
+    builds: int
+    wait_p50: float
+    wait_p90: float
+    wait_p99: float
+    wait_max: float
+    worker_hours: float
+    cost: float
+    peak_workers: int
+    interrupted: int
+    decisions: T.List[T.Tuple[datetime, int]]
+
+    def __str__(self):
+        return "\n".join(
+            [
+                f"Builds: {self.builds}",
+                f"Queue wait p50: {self.wait_p50:.0f}s",
+                f"Queue wait p90: {self.wait_p90:.0f}s",
+                f"Queue wait p99: {self.wait_p99:.0f}s",
+                f"Queue wait max: {self.wait_max:.0f}s",
+                f"Worker hours: {self.worker_hours:.2f}",
+                f"Cost: {self.cost:.2f}",
+                f"Peak workers: {self.peak_workers}",
+                f"Interrupted builds: {self.interrupted}",
+            ]
+        )
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {}
+
+    def raise_for_status(self):
+        pass
+
+
+class SimulatedWorker:
+    def __init__(self, name, started, ready, burst=False):
+        self.name = name
+        self.started = started
+        self.ready = ready
+        self.burst = burst
+        self.build = None
+        self.build_started = None
+        self.assignment = 0
+        self.drain = None
+
+    def get_state(self):
+        return "idle" if self.build is None else "busy"
+
+
+class Simulation:
+    """Run a trace through an autoscaler class.
+
+    interval is how often the autoscaler runs and startup how long a new
+    worker takes to boot, both in seconds. Cost is charged per worker hour
+    from the moment a worker is started until it stops.
+    """
+
+    def __init__(
+        self,
+        autoscaler_class,
+        config,
+        trace,
+        interval=60,
+        startup=60,
+        cost_per_hour=0,
+    ):
+        self.autoscaler_class = autoscaler_class
+        self.config = {"app_name": "simulation", "worker_type": "worker", **config}
+        self.queue_names = list(self.config["queues"])
+        self.priority = sorted(
+            self.queue_names, key=lambda name: (name != "high", name != "medium")
+        )
+        self.trace = [build for build in trace if build.queue in self.queue_names]
+        self.interval = interval
+        self.startup = startup
+        self.cost_per_hour = cost_per_hour
+
+    # Simulated clock
+
+    def now(self):
+        return self.start + timedelta(seconds=self.clock)
+
+    def at(self, when):
+        return (when - self.start).total_seconds()
+
+    # The autoscaler's environment (see autoscaling.Environment)
+
+    def get_queue(self, name):
+        sim = self
+
+        class Queue:
+            @property
+            def count(self):
+                return len(sim.queued[name])
+
+        queue = Queue()
+        queue.name = name
+        return queue
+
+    def count_started(self, queue):
+        return sum(
+            1
+            for worker in self.workers
+            if worker.build is not None and worker.build.queue == queue.name
+        )
+
+    def all_workers(self, queue=None):
+        return [worker for worker in self.workers if worker.drain != drain.DRAINED]
+
+    def count_workers(self, queue=None):
+        return len(self.all_workers())
+
+    def get_drain_states(self):
+        return {worker.name: worker.drain for worker in self.workers if worker.drain}
+
+    def request_drain(self, names):
+        requested = []
+        for worker in list(self.workers):
+            if worker.name in names and not worker.drain:
+                worker.drain = drain.DRAINING
+                requested.append(worker.name)
+                self.settle(worker)
+        return requested
+
+    def cancel_drain(self, names):
+        for worker in self.workers:
+            if worker.name in names:
+                worker.drain = None
+
+    def retire_drained(self, names):
+        # Scaling the formation down has already stopped the dynos
+        pass
+
+    def get_plan_durations(self, queue_names):
+        samples = {}
+        for build, start, end in self.completed:
+            samples.setdefault(build.plan_id, []).append(build.duration)
+        return {plan_id: median(values) for plan_id, values in samples.items()}
+
+    def get_arrival_rates(self, queue_names, window):
+        counts = {}
+        for build in self.trace[: self.arrived]:
+            if self.at(build.arrival) >= self.clock - window:
+                counts[build.plan_id] = counts.get(build.plan_id, 0) + 1
+        return {plan_id: count / window for plan_id, count in counts.items()}
+
+    def patch_formation(self, url, quantity):
+        self.set_formation(quantity)
+        return FakeResponse()
+
+    def start_worker(self, args):
+        self.add_worker(burst=True)
+
+    def get_target_history(self, app_name):
+        if not self.decisions:
+            return None, None
+        previous = self.decisions[-1][1]
+        changed = self.decisions[0][0]
+        for when, target in reversed(self.decisions):
+            if target != previous:
+                break
+            changed = when
+        return previous, changed
+
+    # Workers
+
+    def add_worker(self, burst=False):
+        if burst:
+            name = f"local.{next(self.sequence)}"
+        else:
+            # Heroku numbers dynos from 1 and stops the highest numbers first
+            name = f"{self.config['worker_type']}.{len(self.workers) + 1}"
+        worker = SimulatedWorker(name, self.clock, self.clock + self.startup, burst)
+        self.workers.append(worker)
+        self.peak_workers = max(self.peak_workers, len(self.workers))
+        self.schedule(worker.ready, "ready", worker)
+
+    def stop_worker(self, worker):
+        self.workers.remove(worker)
+        self.worker_seconds += self.clock - worker.started
+        if worker.build is not None:
+            # Heroku stops the dyno whatever it is doing and rq requeues the job
+            self.interrupted += 1
+            self.queued[worker.build.queue].insert(0, worker.build)
+            worker.build = None
+
+    def set_formation(self, quantity):
+        while len(self.workers) < quantity:
+            self.add_worker()
+        # Like Heroku, stop the most recently started dynos
+        while len(self.workers) > quantity:
+            self.stop_worker(self.workers[-1])
+
+    def settle(self, worker):
+        """Retire a draining worker once it is idle."""
+        if worker.drain == drain.DRAINING and worker.build is None:
+            if worker.burst:
+                self.stop_worker(worker)
+            else:
+                # A drained dyno stays in the formation until it is scaled down
+                worker.drain = drain.DRAINED
+
+    def dispatch(self):
+        for worker in list(self.workers):
+            if worker.drain:
+                self.settle(worker)
+                continue
+            if worker.build is not None or worker.ready > self.clock:
+                continue
+            for name in self.priority:
+                if self.queued[name]:
+                    build = self.queued[name].pop(0)
+                    worker.build = build
+                    worker.build_started = self.clock
+                    worker.assignment += 1
+                    if id(build) not in self.started:
+                        self.started.add(id(build))
+                        self.waits.append(self.clock - self.at(build.arrival))
+                    self.schedule(
+                        self.clock + build.duration,
+                        "done",
+                        (worker, worker.assignment),
+                    )
+                    break
+            else:
+                if worker.burst:
+                    self.stop_worker(worker)
+
+    # Events
+
+    def schedule(self, when, kind, item=None):
+        heapq.heappush(self.events, (when, next(self.sequence), kind, item))
+
+    def autoscale(self):
+        autoscaler = self.autoscaler_class(self.config, environment=self)
+        autoscaler.measure()
+        autoscaler.scale()
+        self.decisions.append((self.now(), autoscaler.target_workers))
+
+    def run(self):
+        if not self.trace:
+            raise ValueError("There are no builds on the autoscaler's queues to replay")
+        self.start = self.trace[0].arrival
+        self.clock = 0
+        self.events = []
+        self.sequence = itertools.count()
+        self.queued = {name: [] for name in self.queue_names}
+        self.workers = []
+        self.arrived = 0
+        self.completed = []
+        self.waits = []
+        self.started = set()
+        self.decisions = []
+        self.worker_seconds = 0
+        self.peak_workers = 0
+        self.interrupted = 0
+        self.last_build = 0
+
+        for i, build in enumerate(self.trace):
+            self.schedule(self.at(build.arrival), "arrival", i)
+        self.schedule(0, "tick")
+
+        try:
+            self._run_events()
+        finally:
+            # Burst workers are tracked on the class, but these were simulated
+            autoscaling.LocalAutoscaler.processes = []
+
+        return Report(
+            builds=len(self.waits),
+            wait_p50=percentile(self.waits, 50),
+            wait_p90=percentile(self.waits, 90),
+            wait_p99=percentile(self.waits, 99),
+            wait_max=max(self.waits, default=0),
+            worker_hours=self.worker_seconds / 3600,
+            cost=self.worker_seconds / 3600 * self.cost_per_hour,
+            peak_workers=self.peak_workers,
+            interrupted=self.interrupted,
+            decisions=self.decisions,
+        )
+
+    def _run_events(self):
+        while self.events:
+            when, _, kind, item = heapq.heappop(self.events)
+            self.clock = when
+            if kind == "arrival":
+                build = self.trace[item]
+                self.arrived = item + 1
+                self.queued[build.queue].append(build)
+            elif kind == "done":
+                worker, assignment = item
+                # Skip builds which were interrupted since
+                if worker in self.workers and worker.assignment == assignment:
+                    self.completed.append(
+                        (worker.build, worker.build_started, self.clock)
+                    )
+                    worker.build = None
+            elif kind == "tick":
+                self.autoscale()
+                if self.arrived < len(self.trace) or any(self.queued.values()):
+                    self.last_build = self.clock
+                elif any(worker.build for worker in self.workers):
+                    self.last_build = self.clock
+                elif not self.workers or self.clock - self.last_build > WIND_DOWN:
+                    for worker in list(self.workers):
+                        self.stop_worker(worker)
+                    continue
+                self.schedule(self.clock + self.interval, "tick")
+            self.dispatch()
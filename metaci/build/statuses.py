@@ -0,0 +1,217 @@
+"""Publish build statuses to GitHub in batches.
+
+Builds ask for their commit status to be updated every time they change
+state, which during a big push adds up to more requests than GitHub's
+secondary rate limits allow. Asking only marks the build as pending in
+Redis; a single publish job on the github queue then posts the latest
+status of every pending build, one repository at a time:
+
+- builds for the same repository, commit and context are coalesced into
+  the one which asked most recently;
+- statuses matching the last one published for the commit and context
+  are skipped;
+- statuses are posted METACI_GITHUB_STATUS_INTERVAL seconds apart, at
+  most METACI_GITHUB_STATUS_BATCH_SIZE per job;
+- when GitHub reports a rate limit, the repository's statuses are held
+  back until the limit resets, for the Retry-After period, or else for a
+  backoff which doubles on each consecutive limit;
+- when anything but GitHub fails, the builds not yet published are kept
+  pending for a retry and the job fails.
+"""
+import json
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+import django_rq
+from django.conf import settings
+from github3.exceptions import GitHubError
+
+from metaci.build.waitlist import get_connection
+from metaci.repository.utils import get_status
+
+logger = logging.getLogger(__name__)
+
+# Publishing sleeps between posts, so it has a queue of its own
+QUEUE = "github"
+PENDING_KEY = "metaci:statuses:pending"
+SCHEDULED_KEY = "metaci:statuses:scheduled"
+RETRY_KEY = "metaci:statuses:retry"
+# Seconds until a publish job which never ran stops blocking new ones
+SCHEDULED_TIMEOUT = 5 * 60
+# Seconds the last published status of a commit is remembered
+PUBLISHED_TIMEOUT = 7 * 24 * 60 * 60
+BACKOFF = 60
+MAX_BACKOFF = 60 * 60
+
+
+class RateLimited(Exception):
+    def __init__(self, delay):
+        super().__init__(f"Rate limited for {delay} seconds")
+        self.delay = delay
+
+
+def published_key(repo_id, sha, context):
+    return f"metaci:statuses:published:{repo_id}:{sha}:{context}"
+
+
+def backoff_key(repo_id):
+    return f"metaci:statuses:backoff:{repo_id}"
+
+
+def limited_key(repo_id):
+    return f"metaci:statuses:limited:{repo_id}"
+
+
+def request(build_id):
+    """Ask for the build's status to be published.
+
+    Returns the id of the job which will publish it.
+    """
+    return request_many([build_id])
+
+
+def request_many(build_ids):
+    """Ask for the statuses of several builds to be published."""
+    now = time.time()
+    get_connection().zadd(PENDING_KEY, {build_id: now for build_id in build_ids})
+    return schedule()
+
+
+def schedule(delay=None):
+    """Queue a publish job unless one is waiting already.
+
+    With a delay, the job is scheduled to retry rate limited repositories.
+    """
+    from metaci.build.tasks import publish_github_statuses
+
+    connection = get_connection()
+    job_id = str(uuid.uuid4())
+    if delay is not None:
+        if connection.set(RETRY_KEY, job_id, nx=True, ex=delay):
+            django_rq.get_scheduler(QUEUE).enqueue_in(
+                timedelta(seconds=delay), publish_github_statuses, job_id=job_id
+            )
+        return None
+    if connection.set(SCHEDULED_KEY, job_id, nx=True, ex=SCHEDULED_TIMEOUT):
+        publish_github_statuses.delay(job_id=job_id)
+        return job_id
+    scheduled = connection.get(SCHEDULED_KEY)
+    return scheduled.decode() if scheduled else None
+
+
+def get_rate_limit_delay(response, limited):
+    """Return how many seconds to wait after a response, if rate limited.
+
+    limited is the number of consecutive limits hit before this one.
+    """
+    if response.status_code not in (403, 429):
+        return None
+    if "Retry-After" in response.headers:
+        return max(int(response.headers["Retry-After"]), 1)
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        reset = int(response.headers.get("X-RateLimit-Reset", 0))
+        return max(int(reset - time.time()), 1)
+    if response.status_code == 429 or "rate limit" in response.text.lower():
+        return min(BACKOFF * 2**limited, MAX_BACKOFF)
+    return None
+
+
+def publish():
+    """Publish the pending statuses. Returns how many were posted."""
+    from metaci.build.models import Build
+
+    connection = get_connection()
+    with connection.pipeline() as pipe:
+        # Builds which ask from now on are published by the next job
+        pipe.delete(SCHEDULED_KEY)
+        pipe.zrange(PENDING_KEY, 0, -1, withscores=True)
+        pipe.delete(PENDING_KEY)
+        _, pending, _ = pipe.execute()
+    requested = {int(build_id): score for build_id, score in pending}
+
+    posted = 0
+    more = False
+    retry = None
+    done = set()
+    try:
+        latest = {}
+        builds = Build.objects.filter(id__in=requested).select_related(
+            "repo", "plan", "current_rebuild", "user", "qa_user"
+        )
+        for build in sorted(builds, key=lambda build: requested[build.id]):
+            latest[build.repo_id, build.commit, build.plan.context] = build
+        # Superseded and deleted builds have nothing left to publish
+        done.update(set(requested) - {build.id for build in latest.values()})
+        repos = {}
+        for build in latest.values():
+            repos.setdefault(build.repo_id, []).append(build)
+
+        for repo_id, builds in repos.items():
+            backoff = connection.ttl(backoff_key(repo_id))
+            if backoff > 0:
+                retry = min(retry or backoff, backoff)
+                continue
+            for build in builds:
+                if posted >= settings.METACI_GITHUB_STATUS_BATCH_SIZE:
+                    more = True
+                    break
+                try:
+                    posted += publish_build(connection, build, pace=posted > 0)
+                except RateLimited as e:
+                    retry = min(retry or e.delay, e.delay)
+                    break
+                done.add(build.id)
+    finally:
+        # Builds left over by the batch size, a rate limit or an error
+        deferred = [build_id for build_id in requested if build_id not in done]
+        if deferred:
+            # Keep the time they asked, unless they have asked again since
+            connection.zadd(
+                PENDING_KEY,
+                {build_id: requested[build_id] for build_id in deferred},
+                nx=True,
+            )
+            if more:
+                schedule()
+            else:
+                schedule(retry or BACKOFF)
+    return posted
+
+
+def publish_build(connection, build, pace):
+    """Post the status of a build. Returns whether it was posted."""
+    status = get_status(build)
+    if status is None:
+        return False
+    key = published_key(build.repo_id, status["sha"], status["context"])
+    value = json.dumps(status, sort_keys=True)
+    if connection.get(key) == value.encode():
+        return False
+
+    if pace:
+        time.sleep(settings.METACI_GITHUB_STATUS_INTERVAL)
+    try:
+        build.repo.get_github_api().create_status(**status)
+    except GitHubError as e:
+        limited = int(connection.get(limited_key(build.repo_id)) or 0)
+        delay = get_rate_limit_delay(e.response, limited)
+        if delay is None:
+            logger.exception(f"Could not publish the status of build #{build.id}")
+            return False
+        logger.warning(
+            f"GitHub rate limit reached for {build.repo}, "
+            f"holding back statuses for {delay} seconds"
+        )
+        with connection.pipeline() as pipe:
+            pipe.set(backoff_key(build.repo_id), delay, ex=delay)
+            pipe.set(limited_key(build.repo_id), limited + 1, ex=2 * MAX_BACKOFF)
+            pipe.execute()
+        raise RateLimited(delay)
+
+    with connection.pipeline() as pipe:
+        pipe.set(key, value, ex=PUBLISHED_TIMEOUT)
+        pipe.delete(limited_key(build.repo_id))
+        pipe.execute()
+    return True
@@ -2,6 +2,7 @@ import time
 import traceback
 import typing as T
 from collections import namedtuple
+from datetime import timedelta
 
 import django_rq
 from cumulusci.core.utils import import_global
@@ -10,16 +11,19 @@ from django import db
 from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
-from rq.exceptions import ShutDownImminentException
+from rq.command import send_stop_job_command
+from rq.exceptions import NoSuchJobError, ShutDownImminentException
+from rq.job import Job
 
+from metaci.build import admission, statuses, waitlist
 from metaci.build.autoscaling import autoscale
 from metaci.build.exceptions import RequeueJob
 from metaci.build.signals import build_complete
 from metaci.build.utils import set_build_info
 from metaci.cumulusci.models import Org, sf_session
-from metaci.repository.utils import create_status
 
 ACTIVESCRATCHORGLIMITS_KEY = "metaci:activescratchorgs:limits"
+CHECK_QUEUED_BUILD_TIMEOUT = 60
 
 ActiveScratchOrgLimits = namedtuple("ActiveScratchOrgLimits", ["remaining", "max"])
 
@@ -43,6 +47,24 @@ def scratch_org_limits():
     return value
 
 
+def count_scratch_org_start(limits):
+    """Count the org a build is about to create until the limits are refreshed."""
+    # Keep the original expiry, so the limits are still fetched from the Dev
+    # Hub every 65 seconds however many builds start
+    ttl = cache.ttl(ACTIVESCRATCHORGLIMITS_KEY)
+    if ttl:
+        cache.set(
+            ACTIVESCRATCHORGLIMITS_KEY,
+            limits._replace(remaining=limits.remaining - 1),
+            ttl,
+        )
+
+
+def forget_scratch_org_limits():
+    """Fetch the limits from the Dev Hub next time, after an org was deleted."""
+    cache.delete(ACTIVESCRATCHORGLIMITS_KEY)
+
+
 def run_build(build_id, lock_id=None):
     reset_database_connection()
     from metaci.build.models import Build
@@ -53,17 +75,20 @@ def run_build(build_id, lock_id=None):
         time.sleep(1)
         build = Build.objects.get(id=build_id)
 
+    if build.get_status() == "canceled":
+        return build.get_status()
+
     try:
         build.run()
         if settings.GITHUB_STATUS_UPDATES_ENABLED:
-            res_status = set_github_status.delay(build_id)
-            build.task_id_status_end = res_status.id
+            build.task_id_status_end = statuses.request(build_id)
 
         build.save()
 
-        build_complete.send(
-            sender=build.__class__, build=build, status=build.get_status()
-        )
+        if build.build_type != "pool":
+            build_complete.send(
+                sender=build.__class__, build=build, status=build.get_status()
+            )
 
     except ShutDownImminentException:
         # The Heroku dyno is restarting.
@@ -79,8 +104,7 @@ def run_build(build_id, lock_id=None):
         if lock_id:
             cache.delete(lock_id)
         if settings.GITHUB_STATUS_UPDATES_ENABLED:
-            res_status = set_github_status.delay(build_id)
-            build.task_id_status_end = res_status.id
+            build.task_id_status_end = statuses.request(build_id)
 
         build.log += "\nERROR: The build raised an exception\n"
         build.log += str(e)
@@ -93,12 +117,19 @@ def run_build(build_id, lock_id=None):
             time_end=timezone.now(),
         )
 
-        build_complete.send(
-            sender=build.__class__, build=build, status=build.get_status()
-        )
+        if build.build_type != "pool":
+            build_complete.send(
+                sender=build.__class__, build=build, status=build.get_status()
+            )
 
     if lock_id:
         cache.delete(lock_id)
+    # The org lock or scratch org capacity was released
+    if build.org:
+        if build.org.scratch:
+            forget_scratch_org_limits()
+        waitlist.wake(build.org)
+    admission.wake()
 
     return build.get_status()
 
@@ -147,11 +178,76 @@ def dispatch_queued_build(build, lock_id: str = None):
     return result
 
 
+def run_robot_shard(build_flow_id, suites):
+    reset_database_connection()
+    from metaci.build.models import BuildFlow
+
+    build_flow = BuildFlow.objects.select_related("build__plan").get(id=build_flow_id)
+    build_flow.run_shard(suites)
+    return build_flow.status
+
+
+def robot_shard_job_id(build_flow):
+    return f"robot-shard-{build_flow.id}"
+
+
+def dispatch_robot_shard(build_flow, suites):
+    queue = django_rq.get_queue("robot")
+    result = queue.enqueue(
+        run_robot_shard,
+        build_flow.id,
+        suites,
+        job_id=robot_shard_job_id(build_flow),
+        job_timeout=build_flow.build.plan.build_timeout,
+    )
+    autoscale()
+    return result
+
+
+def cancel_robot_shards(shards):
+    """Remove the jobs of robot shards from the queue, or stop them."""
+    connection = django_rq.get_connection("robot")
+    for shard in shards:
+        try:
+            job = Job.fetch(robot_shard_job_id(shard), connection=connection)
+        except NoSuchJobError:
+            continue
+        stop_job(connection, job)
+
+
+def cancel_build_job(build):
+    """Remove the build's job from its queue, or stop it if it already started.
+
+    Returns True if the job won't run the build.
+    """
+    if not build.task_id_run:
+        return True
+    if build.plan.queue == "long-running":
+        # one-off dynos can't be stopped from here
+        return False
+    connection = django_rq.get_connection(build.plan.queue)
+    try:
+        job = Job.fetch(build.task_id_run, connection=connection)
+    except NoSuchJobError:
+        return True
+    stop_job(connection, job)
+    return True
+
+
+def stop_job(connection, job):
+    """Remove a job from its queue, or stop it if it already started."""
+    status = job.get_status()
+    if status == "started":
+        send_stop_job_command(connection, job.id)
+    elif status in ("queued", "deferred", "scheduled"):
+        job.cancel()
+
+
 def lock_org(org, build_id, timeout):
     return cache.add(org.lock_id, f"build-{build_id}", timeout=timeout)
 
 
-@django_rq.job("short", timeout=60)
+@django_rq.job("short", timeout=CHECK_QUEUED_BUILD_TIMEOUT)
 def check_queued_build(build_id):
     reset_database_connection()
 
@@ -163,6 +259,16 @@ def check_queued_build(build_id):
         time.sleep(1)
         build = Build.objects.get(id=build_id)
 
+    if build.get_status() == "canceled":
+        return f"Build {build_id} was canceled"
+
+    # Explicit rebuilds always run
+    if build.plan.reuse_build_results and not build.current_rebuild_id:
+        previous = build.find_reusable_build()
+        if previous:
+            build.reuse_result(previous)
+            return f"Reused the result of build {previous.id}"
+
     # Check for concurrency blocking
     try:
         org = build.org or Org.objects.get(name=build.plan.org, repo=build.repo)
@@ -173,69 +279,128 @@ def check_queued_build(build_id):
         build.save()
         return message
 
+    try:
+        reason = admission.check(build)
+        if reason:
+            build.task_id_check = None
+            build.set_status("waiting")
+            build.log = reason
+            build.save()
+            # Builds waiting for admission don't hold up others in the org's queue
+            waitlist.remove(org, build.id)
+            waitlist.wake(org)
+            admission.wake()
+            return reason
+        return _check_org_availability(build, org)
+    finally:
+        waitlist.done_checking(org, build.id)
+        cache.delete(admission.admitted_key(build.id))
+
+
+def _check_org_availability(build, org):
     if org.scratch:
         # For scratch orgs, we don't need concurrency blocking logic,
         # but we need to check capacity
 
-        if scratch_org_limits().remaining < settings.SCRATCH_ORG_RESERVE:
-            build.task_id_check = None
-            build.set_status("waiting")
-            msg = "DevHub does not have enough capacity to start this build. Requeueing task."
-            build.log = msg
-            build.save()
-            return msg
-        res_run = dispatch_build(build)
-        return (
-            "DevHub has scratch org capacity, running the build "
-            + f"as task {res_run.id}"
-        )
+        limits = scratch_org_limits()
+        if (
+            waitlist.can_start(org, build.id)
+            and limits.remaining >= settings.SCRATCH_ORG_RESERVE
+        ):
+            count_scratch_org_start(limits)
+            _leave_waitlist(build, org)
+            res_run = dispatch_build(build)
+            # There may be capacity for the next waiting build too
+            waitlist.wake(org)
+            admission.wake()
+            return (
+                "DevHub has scratch org capacity, running the build "
+                + f"as task {res_run.id}"
+            )
+        build.task_id_check = None
+        build.set_status("waiting")
+        msg = "DevHub does not have enough capacity to start this build. Waiting for an org to be deleted."
+        build.log = msg
+        build.save()
+        waitlist.add(org, build)
+        waitlist.wake(org)
+        return msg
     else:
         # For persistent orgs, use the cache to lock the org
-        status = lock_org(org, build_id, build.plan.build_timeout)
+        # but let builds which were waiting first go ahead
+        if waitlist.can_start(org, build.id):
+            status = lock_org(org, build.id, build.plan.build_timeout)
+        else:
+            status = False
 
         if status is True:
             # Lock successful, run the build
+            _leave_waitlist(build, org)
             res_run = dispatch_build(build, org.lock_id)
+            admission.wake()
             return f"Got a lock on the org, running as task {res_run.id}"
         else:
-            # Failed to get lock, queue next check
+            # Failed to get lock, wait for it to be released
             build.task_id_check = None
             build.set_status("waiting")
             build.log = f"Waiting on build #{cache.get(org.lock_id)} to complete"
             build.save()
+            waitlist.add(org, build)
+            waitlist.wake(org)
             return (
                 "Failed to get lock on org. "
-                + f"{cache.get(org.lock_id)} has the org locked. Queueing next check."
+                + f"{cache.get(org.lock_id)} has the org locked. Waiting for it to be released."
             )
 
 
+def _leave_waitlist(build, org):
+    waitlist.remove(org, build.id)
+    # Keep the build from being picked up again before it starts running
+    if build.get_status() == "waiting":
+        build.set_status("queued")
+
+
 @django_rq.job("short", timeout=60)
 def check_waiting_builds():
+    """Wake the first build waiting on each org.
+
+    Builds are normally woken as soon as their org is released. This
+    catches up on releases we didn't see, like expired locks or scratch
+    orgs deleted outside of MetaCI.
+    """
     reset_database_connection()
 
     from metaci.build.models import Build
 
     builds = []
+    orgs = {}
     for build in Build.objects.filter(status="waiting").order_by("time_queue"):
+        if admission.is_waiting(build.id):
+            # Woken by admission.wake() instead
+            continue
+        try:
+            org = build.org or Org.objects.get(name=build.plan.org, repo=build.repo)
+        except Org.DoesNotExist:
+            continue
+        waitlist.add(org, build)
+        orgs[waitlist.waitlist_key(org)] = org
         builds.append(build.id)
-        res_check = check_queued_build.delay(build.id)
-        build.task_id_check = res_check.id
-        build.save()
+
+    woken = [waitlist.wake(org) for org in orgs.values()] + [admission.wake()]
+    woken = [build_id for build_id in woken if build_id is not None]
 
     if builds:
-        return f"Checked waiting builds: {builds}"
+        return f"Checked waiting builds: {builds}, woke {woken}"
     else:
         return "No queued builds to check"
 
 
-@django_rq.job("short")
-def set_github_status(build_id):
+@django_rq.job("github")
+def publish_github_statuses():
     reset_database_connection()
 
-    from metaci.build.models import Build
-
-    build = Build.objects.get(id=build_id)
-    create_status(build)
+    posted = statuses.publish()
+    return f"Published {posted} GitHub statuses"
 
 
 @django_rq.job("short")
@@ -269,11 +434,88 @@ def delete_scratch_org(org_instance_id):
 
     org.delete_org()
     if org.deleted:
+        forget_scratch_org_limits()
+        waitlist.wake(org.org)
         return f"Deleted org instance #{org.id}"
     else:
         return f"Failed to delete org instance #{ord.id}"
 
 
+@django_rq.job("short")
+def fill_org_pools():
+    reset_database_connection()
+
+    from metaci.plan.models import PlanRepository
+
+    results = []
+    for planrepo in PlanRepository.objects.should_run().filter(
+        plan__org_pool_size__gt=0
+    ):
+        try:
+            results.append(fill_org_pool(planrepo.id))
+        except Exception as e:
+            results.append(f"{planrepo}: failed to fill org pool:\n{str(e)}")
+
+    if not results:
+        return "No plans use an org pool"
+
+    return "\n".join(results)
+
+
+@django_rq.job("short")
+def fill_org_pool(planrepo_id):
+    """Queue pool builds to prepare orgs until the plan's org pool is full.
+
+    Prepared orgs which have waited longer than METACI_ORG_POOL_MAX_AGE
+    are deleted, since their dependencies may be out of date.
+    """
+    from metaci.build.models import Build
+    from metaci.cumulusci.models import ScratchOrgInstance
+    from metaci.plan.models import PlanRepository
+    from metaci.repository.models import Branch
+
+    planrepo = PlanRepository.objects.select_related("plan", "repo").get(id=planrepo_id)
+    plan = planrepo.plan
+    try:
+        org = Org.objects.get(repo=planrepo.repo, name=plan.org, scratch=True)
+    except Org.DoesNotExist:
+        return f"{planrepo}: org pools are only supported for scratch orgs"
+
+    pooled = ScratchOrgInstance.pooled.filter(org=org, build__plan=plan)
+    stale = pooled.filter(
+        time_created__lte=timezone.now()
+        - timedelta(seconds=settings.METACI_ORG_POOL_MAX_AGE)
+    )
+    for org_instance in stale:
+        org_instance.delete_org()
+
+    available = pooled.exclude(id__in=stale.values("id")).count()
+    pending = Build.objects.filter(
+        planrepo=planrepo,
+        build_type="pool",
+        status__in=("queued", "waiting", "running"),
+    ).count()
+    needed = plan.org_pool_size - available - pending
+    if needed <= 0:
+        return f"{planrepo}: org pool is full ({available} ready, {pending} preparing)"
+
+    gh_repo = planrepo.repo.get_github_api()
+    branch_name = gh_repo.default_branch
+    commit = gh_repo.branch(branch_name).commit.sha
+    branch, _ = Branch.objects.get_or_create(repo=planrepo.repo, name=branch_name)
+    for _ in range(needed):
+        Build(
+            repo=planrepo.repo,
+            plan=plan,
+            planrepo=planrepo,
+            branch=branch,
+            commit=commit,
+            build_type="pool",
+        ).save()
+
+    return f"{planrepo}: queued {needed} builds to prepare orgs"
+
+
 def launch_one_off_build_worker(build, lock_id: str):
     """Immediately launch a one-off-build with env-appropriate autoscaler"""
     config = settings.METACI_LONG_RUNNING_BUILD_CONFIG
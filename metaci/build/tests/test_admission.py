@@ -0,0 +1,98 @@
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.utils import timezone
+
+from metaci.build import admission
+from metaci.conftest import BuildFactory, PlanRepositoryFactory
+
+
+@pytest.fixture(autouse=True)
+def clear_admission():
+    yield
+    admission.get_connection().delete(admission.ADMISSION_KEY)
+
+
+def waiting_build(planrepo, **kwargs):
+    build = BuildFactory(planrepo=planrepo, **kwargs)
+    build.status = "waiting"
+    build.save()
+    admission.add(build)
+    return build
+
+
+@pytest.mark.django_db
+class TestAdmission:
+    def test_blocked_reason__plan_limit(self):
+        planrepo = PlanRepositoryFactory(plan__max_concurrent_builds=1)
+        BuildFactory(planrepo=planrepo, status="running")
+        build = BuildFactory(planrepo=planrepo, status="queued")
+
+        assert "plan" in admission.blocked_reason(build)
+
+    def test_blocked_reason__repo_limit(self, settings):
+        settings.METACI_MAX_CONCURRENT_BUILDS_PER_REPO = 2
+        planrepo = PlanRepositoryFactory()
+        BuildFactory(planrepo=planrepo, status="running")
+        BuildFactory(planrepo=planrepo, status="queued", task_id_run="job")
+        build = BuildFactory(planrepo=planrepo, status="queued")
+
+        assert "repository" in admission.blocked_reason(build)
+        assert admission.blocked_reason(BuildFactory(status="queued")) is None
+
+    def test_blocked_reason__no_limits(self):
+        planrepo = PlanRepositoryFactory()
+        BuildFactory(planrepo=planrepo, status="running")
+        assert admission.blocked_reason(BuildFactory(planrepo=planrepo)) is None
+
+    def test_check__waits_behind_queued_builds(self):
+        waiting_build(PlanRepositoryFactory())
+        build = BuildFactory(status="queued")
+
+        assert admission.check(build)
+        assert admission.get_connection().zscore(admission.ADMISSION_KEY, build.id)
+
+    def test_priority(self, settings):
+        settings.METACI_ADMISSION_AGING_SECONDS = 60
+        now = timezone.now()
+        busy = BuildFactory(planrepo__priority_weight=1)
+        busy.time_queue = now
+        quiet = BuildFactory(planrepo__priority_weight=1)
+        quiet.time_queue = now
+        weighted = BuildFactory(planrepo__priority_weight=4)
+        weighted.time_queue = now
+        running = Counter({busy.repo_id: 3, weighted.repo_id: 3})
+
+        assert admission.priority(quiet, running, now) == 1
+        assert admission.priority(busy, running, now) == 4
+        assert admission.priority(weighted, running, now) == 1
+
+        # builds gain priority while they wait
+        busy.time_queue = now - timedelta(minutes=4)
+        assert admission.priority(busy, running, now) == 0
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_wake__fair_across_repos(self, delay):
+        busy_repo = PlanRepositoryFactory()
+        quiet_repo = PlanRepositoryFactory()
+        BuildFactory(planrepo=busy_repo, status="running")
+        BuildFactory(planrepo=busy_repo, status="running")
+        waiting_build(busy_repo)
+        quiet = waiting_build(quiet_repo)
+        delay.reset_mock()
+
+        assert admission.wake() == quiet.id
+        delay.assert_called_once_with(quiet.id)
+        assert admission.check(quiet) is None
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_wake__skips_blocked_builds(self, delay):
+        capped = PlanRepositoryFactory(max_concurrent_builds=1)
+        BuildFactory(planrepo=capped, status="running")
+        waiting_build(capped)
+        delay.reset_mock()
+
+        assert admission.wake() is None
+        assert not delay.called
@@ -1,17 +1,24 @@
 import json
 import os
+from datetime import timedelta
 from unittest import mock
 
 import pytest
 import responses
+from django.utils import timezone
 
 from metaci.build.autoscaling import (
     Autoscaler,
     HerokuAutoscaler,
     LocalAutoscaler,
     autoscale,
+    get_arrival_rates,
     get_autoscaler,
+    get_plan_durations,
+    prune_autoscaling_decisions,
 )
+from metaci.build.models import AutoscalingDecision
+from metaci.conftest import BuildFactory
 from metaci.exceptions import ConfigError
 
 
@@ -67,6 +74,153 @@ class TestAutoscaler:
         assert scale_info["test-app"] == 1
 
 
+class TestPredictiveAutoscaler:
+    @pytest.fixture
+    def predictive_config(self, non_scaler_config):
+        return {**non_scaler_config, "policy": "predictive", "drain_horizon": 1800}
+
+    def measure(self, config, counts, durations, rates):
+        high_priority_queue = mock.Mock()
+        high_priority_queue.name = "high"
+        with mock.patch("django_rq.get_queue") as get_queue:
+            get_queue.side_effect = [high_priority_queue, mock.Mock(), mock.Mock()]
+            autoscaler = Autoscaler(config)
+        with mock.patch(
+            "metaci.build.autoscaling.Autoscaler.count_builds", side_effect=counts
+        ), mock.patch(
+            "metaci.build.autoscaling.StartedJobRegistry", return_value=[mock.Mock()]
+        ), mock.patch(
+            "metaci.build.autoscaling.get_plan_durations", return_value=durations
+        ), mock.patch(
+            "metaci.build.autoscaling.get_arrival_rates", return_value=rates
+        ):
+            autoscaler.measure()
+        return autoscaler
+
+    def test_measure(self, predictive_config):
+        # 3 running and 2 queued builds of 10 minutes, one arriving every 10 minutes
+        autoscaler = self.measure(predictive_config, [1, 0, 4], {1: 600}, {1: 1 / 600})
+
+        assert autoscaler.running_builds == 3
+        assert autoscaler.predicted_load == pytest.approx(1)
+        # The 2 queued builds can share a worker within the 30 minute horizon
+        assert autoscaler.target_workers == 4
+
+    def test_measure__arrivals(self, predictive_config):
+        autoscaler = self.measure(
+            predictive_config, [0, 0, 0], {1: 600, 2: 1200}, {1: 3 / 600, 2: 0.001}
+        )
+
+        assert autoscaler.target_workers == 5
+
+    def test_measure__no_history(self, predictive_config):
+        autoscaler = self.measure(predictive_config, [1, 0, 4], {}, {})
+
+        assert autoscaler.target_workers == 5
+        assert autoscaler.predicted_load is None
+
+    def test_unknown_policy(self, non_scaler_config):
+        with pytest.raises(ConfigError):
+            Autoscaler({**non_scaler_config, "policy": "psychic"})
+
+    @pytest.mark.django_db
+    def test_smooth(self, predictive_config):
+        autoscaler = Autoscaler({**predictive_config, "name": "test-app"})
+        decision = AutoscalingDecision.objects.create(
+            app_name="test-app",
+            policy="predictive",
+            active_builds=1,
+            workers=4,
+            target_workers=3,
+        )
+        AutoscalingDecision.objects.filter(id=decision.id).update(
+            time=timezone.now() - timedelta(minutes=5)
+        )
+
+        # Scaling up is immediate
+        assert autoscaler.smooth(5) == 5
+        # The last step down was 5 minutes ago, which is too recent
+        assert autoscaler.smooth(0) == 3
+
+        AutoscalingDecision.objects.filter(id=decision.id).update(
+            time=timezone.now() - timedelta(minutes=20)
+        )
+        assert autoscaler.smooth(0) == 2
+
+    @pytest.mark.django_db
+    def test_record(self, predictive_config):
+        autoscaler = Autoscaler({**predictive_config, "name": "test-app"})
+        autoscaler.active_builds = 2
+        autoscaler.target_workers = 3
+        autoscaler.count_workers = mock.Mock(return_value=1)
+
+        decision = autoscaler.record()
+
+        assert decision.app_name == "test-app"
+        assert decision.policy == "predictive"
+        assert decision.workers == 1
+        assert decision.target_workers == 3
+
+    @pytest.mark.django_db
+    def test_record__unchanged(self, predictive_config):
+        autoscaler = Autoscaler({**predictive_config, "name": "test-app"})
+        autoscaler.target_workers = 3
+        autoscaler.count_workers = mock.Mock(return_value=1)
+        autoscaler.record()
+
+        assert autoscaler.record() is None
+        assert AutoscalingDecision.objects.count() == 1
+
+
+@pytest.mark.django_db
+class TestBuildHistory:
+    @mock.patch("metaci.build.autoscaling.cache")
+    def test_get_plan_durations(self, cache):
+        cache.get.return_value = None
+        now = timezone.now()
+        build = BuildFactory(
+            status="success",
+            time_start=now - timedelta(minutes=10),
+            time_end=now,
+            planrepo__plan__queue="default",
+        )
+        BuildFactory(
+            status="success",
+            time_start=now - timedelta(minutes=10),
+            time_end=now,
+            planrepo__plan__queue="long-running",
+        )
+
+        assert get_plan_durations(["default"]) == {build.plan_id: 600}
+        cache.set.assert_called_once()
+
+    def test_get_arrival_rates(self):
+        build = BuildFactory(planrepo__plan__queue="default")
+        BuildFactory(planrepo__plan__queue="default", planrepo__plan=build.plan)
+
+        assert get_arrival_rates(["default"], 100) == {build.plan_id: 0.02}
+
+    def test_prune_autoscaling_decisions(self):
+        decisions = [
+            AutoscalingDecision.objects.create(
+                app_name="test-app",
+                policy="queue_depth",
+                active_builds=0,
+                workers=0,
+                target_workers=target,
+            )
+            for target in (1, 0)
+        ]
+        for days, decision in zip((366, 365), decisions):
+            AutoscalingDecision.objects.filter(id=decision.id).update(
+                time=timezone.now() - timedelta(days=days)
+            )
+
+        assert prune_autoscaling_decisions() == 1
+        # The latest decision holds the current target
+        assert list(AutoscalingDecision.objects.all()) == [decisions[1]]
+
+
 class TestLocalAutoscaler:
     @mock.patch("subprocess.Popen")
     def test_scale__up(self, Popen, non_scaler_config):
@@ -114,6 +268,23 @@ class TestHerokuAutoscaler:
         autoscaler.count_workers = mock.Mock(return_value=1)
         autoscaler.scale()
 
+    @responses.activate
+    def test_scale__down_to_target(self, scaler_config):
+        responses.add(
+            "PATCH",
+            "https://api.heroku.com/apps/test-app/formation/worker",
+            status=200,
+            json={},
+        )
+
+        autoscaler = HerokuAutoscaler(scaler_config)
+        autoscaler.active_builds = 0
+        autoscaler.target_workers = 2
+        autoscaler.count_workers = mock.Mock(return_value=3)
+        autoscaler.scale()
+
+        assert json.loads(responses.calls[0].request.body) == {"quantity": 2}
+
     @responses.activate
     def test_scale__overask(self, scaler_config):
         def request_callback(request):
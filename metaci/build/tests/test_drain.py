@@ -0,0 +1,181 @@
+import json
+from unittest import mock
+
+import pytest
+import responses
+
+from metaci.build import drain
+from metaci.build.autoscaling import HerokuAutoscaler, LocalAutoscaler
+from metaci.build.worker import DrainableWorker
+
+FORMATION_URL = "https://api.heroku.com/apps/test-app/formation/worker"
+
+
+@pytest.fixture(autouse=True)
+def clean_drain():
+    yield
+    connection = drain.get_connection()
+    connection.delete(drain.DRAIN_KEY, drain.WORKERS_KEY)
+    for key in connection.scan_iter(drain.retired_key("*")):
+        connection.delete(key)
+
+
+@pytest.fixture
+def scaler_config():
+    return {
+        "app_name": "test-app",
+        "worker_type": "worker",
+        "max_workers": 5,
+        "worker_reserve": 1,
+        "queues": ["default", "medium", "high"],
+    }
+
+
+class TestDrain:
+    @mock.patch("metaci.build.drain.send_shutdown_command")
+    def test_request(self, send_shutdown_command):
+        with mock.patch.dict("os.environ", {"DYNO": "worker.2"}):
+            drain.register("abc")
+
+        assert drain.request(["worker.2", "worker.3"]) == ["worker.2", "worker.3"]
+        assert drain.request(["worker.2"]) == []
+        assert drain.get_states() == {
+            "worker.2": drain.DRAINING,
+            "worker.3": drain.DRAINING,
+        }
+        send_shutdown_command.assert_called_once_with(mock.ANY, "abc")
+
+    def test_mark_drained_and_cancel(self):
+        drain.mark_drained("worker.2")
+        assert drain.get_state("worker.2") == drain.DRAINED
+
+        drain.cancel(["worker.2"])
+        assert drain.get_state("worker.2") is None
+
+    def test_retire(self):
+        drain.mark_drained("worker.2")
+        drain.retire(["worker.2"])
+
+        assert drain.get_states() == {}
+        assert drain.get_state("worker.2") == drain.DRAINED
+        ttl = drain.get_connection().ttl(drain.retired_key("worker.2"))
+        assert 0 < ttl <= drain.RETIRED_TIMEOUT
+
+        drain.cancel(["worker.2"])
+        assert drain.get_state("worker.2") is None
+
+
+class TestDrainableWorker:
+    def worker(self):
+        worker = DrainableWorker(["default"], connection=drain.get_connection())
+        worker.log = mock.Mock()
+        return worker
+
+    def test_dequeue__draining(self):
+        worker = self.worker()
+        drain.request([worker.name])
+
+        assert worker.dequeue_job_and_maintain_ttl(1) is None
+
+    @mock.patch("rq.worker.Worker.handle_warm_shutdown_request")
+    def test_warm_shutdown__draining(self, handle_warm_shutdown_request):
+        worker = self.worker()
+        drain.request([worker.name])
+
+        worker.handle_warm_shutdown_request()
+
+        handle_warm_shutdown_request.assert_not_called()
+
+    def test_register_death__clears_drain(self):
+        worker = self.worker()
+        worker.register_birth()
+        drain.request([worker.name])
+
+        worker.register_death()
+
+        assert drain.get_state(worker.name) is None
+        assert not drain.get_connection().hexists(drain.WORKERS_KEY, worker.name)
+
+    @mock.patch.dict("os.environ", {"DYNO": "worker.3"})
+    def test_register_death__dyno_stays_drained(self):
+        worker = self.worker()
+        worker.register_birth()
+        drain.request(["worker.3"])
+
+        worker.register_death()
+
+        assert drain.get_state("worker.3") == drain.DRAINED
+
+
+class TestHerokuDrain:
+    def autoscaler(self, scaler_config, workers, target, active_builds=2):
+        autoscaler = HerokuAutoscaler(scaler_config)
+        autoscaler.active_builds = active_builds
+        autoscaler.target_workers = target
+        autoscaler.count_workers = mock.Mock(return_value=workers)
+        return autoscaler
+
+    @responses.activate
+    def test_scale__drains_highest_dynos(self, scaler_config):
+        self.autoscaler(scaler_config, 4, 2).scale()
+
+        assert drain.get_states() == {
+            "worker.3": drain.DRAINING,
+            "worker.4": drain.DRAINING,
+        }
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_scale__waits_for_drain(self, scaler_config):
+        drain.request(["worker.3"])
+        drain.mark_drained("worker.4")
+
+        self.autoscaler(scaler_config, 3, 2).scale()
+
+        assert len(responses.calls) == 0
+
+    @responses.activate
+    def test_scale__down_once_drained(self, scaler_config):
+        responses.add("PATCH", FORMATION_URL, status=200, json={})
+        drain.mark_drained("worker.3")
+        drain.mark_drained("worker.4")
+
+        self.autoscaler(scaler_config, 2, 2).scale()
+
+        assert json.loads(responses.calls[0].request.body) == {"quantity": 2}
+        assert drain.get_states() == {}
+        # The dynos don't start working again before Heroku stops them
+        assert drain.get_state("worker.3") == drain.DRAINED
+        assert drain.get_state("worker.4") == drain.DRAINED
+
+    @responses.activate
+    def test_scale__up_cancels_drain(self, scaler_config):
+        drain.mark_drained("worker.4")
+        drain.request(["worker.3"])
+
+        self.autoscaler(scaler_config, 3, 4).scale()
+
+        assert drain.get_states() == {}
+        assert len(responses.calls) == 0
+
+
+class TestLocalDrain:
+    @mock.patch("metaci.build.autoscaling.Worker")
+    @mock.patch("metaci.build.drain.send_shutdown_command")
+    def test_scale__retires_idle_workers_first(
+        self, send_shutdown_command, Worker, scaler_config
+    ):
+        busy = mock.Mock(get_state=mock.Mock(return_value="busy"))
+        busy.name = "busy"
+        idle = mock.Mock(get_state=mock.Mock(return_value="idle"))
+        idle.name = "idle"
+        Worker.all.return_value = [busy, idle]
+        Worker.count.return_value = 2
+        autoscaler = LocalAutoscaler(scaler_config)
+        autoscaler.active_builds = 1
+        autoscaler.target_workers = 1
+
+        autoscaler.scale()
+        autoscaler.scale()
+
+        assert drain.get_states() == {"idle": drain.DRAINING}
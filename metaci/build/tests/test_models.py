@@ -5,17 +5,24 @@ from unittest import mock
 
 import pytest
 from cumulusci.core.config import OrgConfig
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from metaci.build.models import Build
+from metaci.build.models import Build, run_parallel_flow
+from metaci.build.utils import set_build_info
 from metaci.conftest import (
     BranchFactory,
     BuildFactory,
     BuildFlowFactory,
+    OrgFactory,
     PlanFactory,
     PlanRepositoryFactory,
     PlanScheduleFactory,
     RepositoryFactory,
     ScratchOrgInstanceFactory,
+    TestResultFactory,
 )
 from metaci.release.models import ChangeCaseTemplate, Release
 
@@ -51,6 +58,44 @@ class TestBuild:
         build = Build(repo=repo, plan=plan)
         assert build.planrepo == planrepo
 
+    def test_planrepo_given_on_build_init(self, django_assert_num_queries):
+        repo = RepositoryFactory()
+        plan = PlanFactory()
+        PlanRepositoryFactory(plan=plan, repo=repo)
+
+        with django_assert_num_queries(0):
+            build = Build(repo=repo, plan=plan, planrepo=None)
+        assert build.planrepo is None
+
+    def test_planrepo_not_looked_up_on_load(self, django_assert_num_queries):
+        build = BuildFactory()
+        build.planrepo = None
+        build.save()
+
+        with django_assert_num_queries(1):
+            assert Build.objects.get(id=build.id).planrepo_id is None
+
+    def test_bulk_create__populates_planrepo(self):
+        repo = RepositoryFactory()
+        plans = [PlanFactory(), PlanFactory()]
+        planrepos = [PlanRepositoryFactory(plan=plan, repo=repo) for plan in plans]
+        builds = [Build(repo=repo, plan=plan, commit="abc") for plan in plans]
+        for build in builds:
+            build.planrepo = None
+
+        with CaptureQueriesContext(connection) as queries:
+            builds = Build.objects.bulk_create(builds)
+
+        lookups = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith("SELECT")
+            and "plan_planrepository" in query["sql"]
+        ]
+        assert len(lookups) == 1
+        assert [build.planrepo for build in builds] == planrepos
+        assert builds[0].config_hash == plans[0].get_config_hash()
+
     @mock.patch("metaci.repository.models.Repository.get_github_api")
     @mock.patch("metaci.cumulusci.keychain.MetaCIProjectKeychain.get_org")
     def test_run(self, get_org, get_gh_api):
@@ -79,6 +124,40 @@ class TestBuild:
         assert "Build flow test completed successfully" in build.log
         assert "running test flow" in build.flows.get().log
 
+    @mock.patch("metaci.build.models.Build.run_parallel_flows")
+    @mock.patch("metaci.repository.models.Repository.get_github_api")
+    @mock.patch("metaci.cumulusci.keychain.MetaCIProjectKeychain.get_org")
+    def test_run__parallel_flows(self, get_org, get_gh_api, run_parallel_flows):
+        def archive(format, zip_content, ref):
+            with open(Path(__file__).parent / "testproject.zip", "rb") as f:
+                zip_content.write(f.read())
+
+        mock_api = mock.Mock()
+        mock_api.archive.side_effect = archive
+        get_gh_api.return_value = mock_api
+        org_config = OrgConfig({}, "test")
+        org_config.refresh_oauth_token = mock.Mock()
+        get_org.return_value = org_config
+
+        build = BuildFactory()
+        build.plan.flows = "test | other"
+        run_parallel_flows.side_effect = lambda flows, *args: [
+            BuildFlowFactory(build=build, flow="test", status="success"),
+            BuildFlowFactory(
+                build=build, flow="other", status="fail", error_message="Boom"
+            ),
+        ]
+        try:
+            build.run()
+        finally:
+            detach_logger(build)
+
+        run_parallel_flows.assert_called_once()
+        assert run_parallel_flows.call_args[0][0] == ["test", "other"]
+        assert build.status == "fail"
+        assert build.error_message == "Boom"
+        assert "Build flow other completed with status fail" in build.log
+
     def test_delete_org(self):
         build = BuildFactory()
         build.org_instance = ScratchOrgInstanceFactory(org__repo=build.repo)
@@ -129,6 +208,166 @@ class TestBuild:
         org.delete_org.assert_not_called()
         detach_logger(build)
 
+    @mock.patch("metaci.build.models.cancel_build_job")
+    def test_cancel(self, cancel_build_job):
+        cancel_build_job.return_value = True
+        build = BuildFactory(status="waiting")
+        flow = BuildFlowFactory(build=build, status="queued")
+
+        assert build.cancel("Canceled for testing")
+
+        build.refresh_from_db()
+        flow.refresh_from_db()
+        assert build.status == "canceled"
+        assert "Canceled for testing" in build.log
+        assert flow.status == "error"
+        cancel_build_job.assert_called_once_with(build)
+
+    @mock.patch("metaci.build.models.cancel_robot_shards")
+    @mock.patch("metaci.build.models.cancel_build_job")
+    def test_cancel__robot_shards(self, cancel_build_job, cancel_robot_shards):
+        cancel_build_job.return_value = True
+        build = BuildFactory(status="running")
+        parent = BuildFlowFactory(build=build, status="running")
+        shard = BuildFlowFactory(build=build, parent=parent, status="queued")
+        BuildFlowFactory(build=build, parent=parent, status="success")
+
+        assert build.cancel("Canceled for testing")
+
+        assert list(cancel_robot_shards.call_args[0][0]) == [shard]
+        shard.refresh_from_db()
+        assert shard.status == "error"
+
+    @mock.patch("metaci.build.models.cancel_build_job")
+    def test_cancel__releases_org_lock(self, cancel_build_job):
+        cancel_build_job.return_value = True
+        build = BuildFactory(status="running")
+        cache.set(build.org.lock_id, f"build-{build.id}")
+
+        assert build.cancel("Canceled for testing")
+        assert not build.org.is_locked
+
+    @mock.patch("metaci.build.models.cancel_build_job")
+    def test_cancel__running_job_not_stopped(self, cancel_build_job):
+        cancel_build_job.return_value = False
+        build = BuildFactory(status="running")
+
+        assert not build.cancel("Canceled for testing")
+        assert build.status == "running"
+
+    def test_cancel__finished(self):
+        build = BuildFactory(status="success")
+        assert not build.cancel("Canceled for testing")
+
+    @mock.patch("metaci.build.models.cancel_build_job", return_value=True)
+    def test_cancel_superseded_builds(self, cancel_build_job):
+        planrepo = PlanRepositoryFactory(plan__cancel_superseded="queued")
+        branch = BranchFactory(repo=planrepo.repo)
+        older = BuildFactory(
+            planrepo=planrepo, branch=branch, build_type="auto", status="queued"
+        )
+        running = BuildFactory(
+            planrepo=planrepo, branch=branch, build_type="auto", status="running"
+        )
+        manual = BuildFactory(
+            planrepo=planrepo, branch=branch, build_type="manual", status="queued"
+        )
+        newer = BuildFactory(
+            planrepo=planrepo,
+            branch=branch,
+            build_type="auto",
+            status="queued",
+            commit="newer",
+        )
+
+        assert newer.cancel_superseded_builds() == [older]
+        for build in (older, running, manual, newer):
+            build.refresh_from_db()
+        assert older.status == "canceled"
+        assert running.status == "running"
+        assert manual.status == "queued"
+        assert newer.status == "queued"
+
+    @mock.patch("metaci.build.models.cancel_build_job", return_value=True)
+    def test_cancel_superseded_builds__by_push_time(self, cancel_build_job):
+        planrepo = PlanRepositoryFactory(plan__cancel_superseded="queued")
+        branch = BranchFactory(repo=planrepo.repo)
+        pushed = timezone.now()
+        # The newer push's event was processed first
+        newer = BuildFactory(
+            planrepo=planrepo,
+            branch=branch,
+            build_type="auto",
+            status="queued",
+            commit="newer",
+            time_push=pushed,
+        )
+        older = BuildFactory(
+            planrepo=planrepo,
+            branch=branch,
+            build_type="auto",
+            status="queued",
+            time_push=pushed - datetime.timedelta(minutes=1),
+        )
+
+        assert older.cancel_superseded_builds() == []
+        assert newer.cancel_superseded_builds() == [older]
+
+    def test_config_hash(self):
+        build = BuildFactory()
+        assert build.config_hash == build.plan.get_config_hash()
+
+        build.plan.flows = "other_flow"
+        assert build.plan.get_config_hash() != build.config_hash
+
+    def test_find_reusable_build(self):
+        planrepo = PlanRepositoryFactory()
+        previous = BuildFactory(planrepo=planrepo, commit="abc", status="success")
+        BuildFactory(planrepo=planrepo, commit="abc", status="fail")
+        BuildFactory(planrepo=planrepo, commit="def", status="success")
+        build = BuildFactory(planrepo=planrepo, commit="abc", status="queued")
+
+        assert build.find_reusable_build() == previous
+
+        planrepo.plan.flows = "changed_flow"
+        planrepo.plan.save()
+        assert build.find_reusable_build() is None
+
+    def test_find_reusable_build__not_pool(self):
+        planrepo = PlanRepositoryFactory()
+        BuildFactory(
+            planrepo=planrepo, commit="abc", status="success", build_type="pool"
+        )
+        build = BuildFactory(planrepo=planrepo, commit="abc", status="queued")
+
+        assert build.find_reusable_build() is None
+
+    def test_save__keeps_missing_config_hash(self):
+        build = BuildFactory(status="success")
+        Build.objects.filter(id=build.id).update(config_hash=None)
+        build.refresh_from_db()
+
+        build.save()
+
+        build.refresh_from_db()
+        assert build.config_hash is None
+
+    @mock.patch("metaci.build.models.build_complete")
+    def test_reuse_result(self, build_complete):
+        previous = BuildFactory(status="success", commit_status="All good")
+        build = BuildFactory(planrepo=previous.planrepo, status="queued")
+
+        build.reuse_result(previous)
+
+        build.refresh_from_db()
+        assert build.status == "success"
+        assert build.reused_from == previous
+        assert build.commit_status == "All good"
+        assert f"#{previous.id}" in build.log
+        build_complete.send.assert_called_once_with(
+            sender=Build, build=build, status="success"
+        )
+
     @mock.patch.dict(os.environ, clear=True)
     def test_no_worker_id(self):
         build = BuildFactory()
@@ -139,12 +378,174 @@ class TestBuild:
         build = BuildFactory()
         assert build.worker_id == "faker.1"
 
+    def test_get_pool_fingerprint(self):
+        build = BuildFactory()
+        build.plan.flows = "dependencies, ci_feature"
+        project_config = mock.Mock(project__dependencies=[{"github": "foo/bar"}])
+        project_config.get_flow.return_value.config = {"steps": {1: {"task": "x"}}}
+
+        fingerprint = build.get_pool_fingerprint(project_config)
+
+        project_config.get_flow.assert_called_once_with("dependencies")
+        assert fingerprint == build.get_pool_fingerprint(project_config)
+        project_config.project__dependencies = [{"github": "foo/baz"}]
+        assert fingerprint != build.get_pool_fingerprint(project_config)
+
+    @mock.patch("metaci.build.tasks.fill_org_pool")
+    @mock.patch("metaci.build.models.Build.get_pool_fingerprint")
+    def test_get_org__pooled(self, get_pool_fingerprint, fill_org_pool):
+        get_pool_fingerprint.return_value = "fingerprint"
+        build = BuildFactory(build_type="auto")
+        build.plan.org_pool_size = 1
+        build.plan.flows = "dependencies, ci_feature"
+        org = OrgFactory(repo=build.repo, name=build.plan.org, scratch=True)
+        org_instance = ScratchOrgInstanceFactory(
+            org=org,
+            pool_fingerprint="fingerprint",
+            expiration_date=timezone.now() + datetime.timedelta(days=1),
+        )
+        project_config = mock.Mock()
+        project_config.keychain.get_prepared_org.return_value = OrgConfig(
+            {"scratch": True}, build.plan.org
+        )
+        try:
+            build.get_org(project_config)
+        finally:
+            detach_logger(build)
+
+        org_instance.refresh_from_db()
+        assert org_instance.time_claimed is not None
+        assert build.prepared_flow == "dependencies"
+        project_config.keychain.get_prepared_org.assert_called_once_with(org_instance)
+        project_config.keychain.get_org.assert_not_called()
+        fill_org_pool.delay.assert_called_once_with(build.planrepo_id)
+
+    @mock.patch("metaci.build.models.Build.get_pool_fingerprint")
+    def test_get_org__pool_empty(self, get_pool_fingerprint):
+        get_pool_fingerprint.return_value = "fingerprint"
+        build = BuildFactory(build_type="auto")
+        build.plan.org_pool_size = 1
+        OrgFactory(repo=build.repo, name=build.plan.org, scratch=True)
+        project_config = mock.Mock()
+        project_config.keychain.get_org.return_value = OrgConfig({}, build.plan.org)
+        try:
+            build.get_org(project_config)
+        finally:
+            detach_logger(build)
+
+        assert build.prepared_flow is None
+        project_config.keychain.get_org.assert_called_once_with(build.plan.org)
+
+    @mock.patch("metaci.build.models.BuildFlow.run", autospec=True)
+    def test_run_stage__prepared_flow(self, run):
+        build = BuildFactory(build_type="auto")
+        build.prepared_flow = "dependencies"
+        org_config = OrgConfig({}, build.plan.org)
+        org_config.org_instance = ScratchOrgInstanceFactory()
+
+        try:
+            build_flows = build.run_stage(["dependencies"], mock.Mock(), org_config)
+        finally:
+            detach_logger(build)
+
+        # The flow still runs, deploying the build's own commit
+        run.assert_called_once()
+        assert build_flows[0].dependency_steps == "skip"
+        assert build.prepared_flow is None
+
+    @mock.patch("metaci.build.models.BuildFlow.run", autospec=True)
+    def test_run_stage__pool(self, run):
+        build = BuildFactory(build_type="pool")
+
+        try:
+            build_flows = build.run_stage(["dependencies"], mock.Mock(), mock.Mock())
+        finally:
+            detach_logger(build)
+
+        assert build_flows[0].dependency_steps == "only"
+
     def test_get_commit(self):
         build = BuildFactory()
         commit_sha = build.commit
         truncated_commit = build.get_commit()
         assert f"{commit_sha[:8]}" == truncated_commit
 
+    @mock.patch("metaci.build.models.run_parallel_flow")
+    @mock.patch("metaci.build.models.multiprocessing.get_context")
+    @mock.patch("django.db.connections.close_all")
+    def test_run_parallel_flows(self, close_all, get_context, run_parallel_flow):
+        class Process:
+            def __init__(self, target, args):
+                self.target = target
+                self.args = args
+
+            def start(self):
+                self.exitcode = self.target(*self.args)
+
+            def join(self):
+                pass
+
+        def run_flow(build_flow, org_config):
+            if build_flow.flow == "test":
+                set_build_info(build_flow, status="success")
+                return 0
+            # the other process dies before it finishes the flow
+            return 1
+
+        get_context.return_value.Process = Process
+        run_parallel_flow.side_effect = run_flow
+        build = BuildFactory(status="running")
+        org_config = OrgConfig({}, "test")
+
+        try:
+            build_flows = build.run_parallel_flows(
+                ["test", "other"], mock.Mock(), org_config
+            )
+        finally:
+            detach_logger(build)
+
+        assert [build_flow.flow for build_flow in build_flows] == ["test", "other"]
+        assert build_flows[0].status == "success"
+        assert build_flows[1].status == "error"
+        assert build_flows[1].error_message == "Flow process exited with code 1"
+        assert run_parallel_flow.call_args_list == [
+            mock.call(build_flow, org_config) for build_flow in build_flows
+        ]
+
+    @mock.patch("django.db.connections.close_all")
+    @mock.patch("metaci.build.models.BuildFlow.run", autospec=True)
+    @mock.patch("metaci.build.models.Build.get_project_config")
+    def test_run_parallel_flow(
+        self, get_project_config, run, close_all, tmp_path, monkeypatch
+    ):
+        shared_dir = tmp_path / "build"
+        shared_dir.mkdir()
+        (shared_dir / "cumulusci.yml").write_text("project: {}")
+        monkeypatch.chdir(shared_dir)
+        build_flow = BuildFlowFactory(flow="test")
+        build = build_flow.build
+        build.root_dir = str(tmp_path)
+        build.build_dir = str(shared_dir)
+        org_config = OrgConfig({}, "test")
+
+        def run_flow(build_flow, project_config, org_config, root_dir):
+            # the flow runs in its own copy of the build directory
+            assert os.getcwd() == build.build_dir != str(shared_dir)
+            assert os.path.basename(build.build_dir) == "build"
+            assert os.listdir(build.build_dir) == ["cumulusci.yml"]
+
+        run.side_effect = run_flow
+
+        run_parallel_flow(build_flow, org_config)
+
+        get_project_config.assert_called_once_with()
+        run.assert_called_once_with(
+            build_flow, get_project_config.return_value, org_config, str(tmp_path)
+        )
+        assert os.getcwd() == str(tmp_path)
+        assert not os.path.exists(build.build_dir)
+        assert os.listdir(shared_dir) == ["cumulusci.yml"]
+
 
 @pytest.mark.django_db
 class TestBuildFlow:
@@ -278,6 +679,208 @@ class TestBuildFlow:
         expected = f"{datetime.date.today().isoformat()}T21:00:00+00:00"
         assert options["push_all"]["start_time"] == expected
 
+    def test_limit_robot_suites(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        for name in ("a", "b", "c", "nested"):
+            (tmp_path / f"{name}.robot").write_text("")
+        project_config = mock.Mock()
+        project_config.lookup.return_value = None
+        project_config.get_flow.return_value.config = {
+            "steps": {
+                1: {"task": "robot", "options": {"suites": "a.robot,b.robot"}},
+                2: {"task": "robot", "options": {"suites": "c.robot"}},
+            }
+        }
+
+        def flow_steps():
+            return [
+                mock.Mock(
+                    task_name="robot",
+                    task_config={"options": {"suites": suites}},
+                    skip=False,
+                )
+                for suites in ("a.robot,b.robot", "c.robot", "nested.robot")
+            ] + [mock.Mock(task_name="deploy", task_config={}, skip=False)]
+
+        parent = BuildFlowFactory()
+        parent.robot_suites = ["a.robot"]
+        parent.flow_instance = mock.Mock(steps=flow_steps())
+        parent.limit_robot_suites(project_config)
+        steps = parent.flow_instance.steps
+        assert steps[0].task_config["options"]["suites"] == "a.robot"
+        assert [step.skip for step in steps] == [False, True, False, False]
+
+        # Suites of nested flows aren't split, so only the parent runs them
+        shard = BuildFlowFactory(build=parent.build, parent=parent)
+        shard.robot_suites = ["b.robot", "c.robot"]
+        shard.flow_instance = mock.Mock(steps=flow_steps())
+        shard.limit_robot_suites(project_config)
+        steps = shard.flow_instance.steps
+        assert steps[0].task_config["options"]["suites"] == "b.robot"
+        assert steps[1].task_config["options"]["suites"] == "c.robot"
+        assert [step.skip for step in steps] == [False, False, True, False]
+
+    @mock.patch("metaci.build.models.select_test_classes")
+    @mock.patch("metaci.build.models.get_changed_paths")
+    def test_get_flow_options__test_impact_analysis(
+        self, get_changed_paths, select_test_classes
+    ):
+        get_changed_paths.return_value = ["src/Foo.cls"]
+        select_test_classes.return_value = ["FooTest", "Foo_Test"]
+        build_flow = BuildFlowFactory(build__planrepo__plan__test_impact_analysis=True)
+        options = build_flow._get_flow_options()
+        assert options["run_tests"]["test_name_match"] == "FooTest,Foo_Test"
+        assert build_flow.selected_test_classes == "FooTest,Foo_Test"
+
+    @mock.patch("metaci.build.models.get_changed_paths")
+    def test_get_flow_options__test_impact_analysis_default_branch(
+        self, get_changed_paths
+    ):
+        get_changed_paths.return_value = None
+        build_flow = BuildFlowFactory(build__planrepo__plan__test_impact_analysis=True)
+        assert "run_tests" not in build_flow._get_flow_options()
+        assert build_flow.selected_test_classes is None
+
+    @mock.patch("metaci.build.models.dispatch_robot_shard")
+    @mock.patch("metaci.build.models.get_robot_suites")
+    def test_dispatch_robot_shards(self, get_robot_suites, dispatch_robot_shard):
+        get_robot_suites.return_value = ["a.robot", "b.robot", "c.robot"]
+        build_flow = BuildFlowFactory(
+            build__planrepo__plan__robot_shards=2, status="running"
+        )
+        build_flow.logger = mock.Mock()
+        org_config = OrgConfig({"scratch": True}, "dev")
+
+        shards = build_flow.dispatch_robot_shards(mock.Mock(), org_config)
+
+        assert build_flow.robot_suites == ["a.robot", "c.robot"]
+        assert len(shards) == 1
+        shard = shards[0][0]
+        assert shard.parent == build_flow
+        assert shard.flow == build_flow.flow
+        dispatch_robot_shard.assert_called_once_with(shard, ["b.robot"])
+
+    def test_dispatch_robot_shards__robot_queue(self):
+        build_flow = BuildFlowFactory(
+            build__planrepo__plan__robot_shards=2,
+            build__planrepo__plan__queue="robot",
+        )
+        build_flow.logger = mock.Mock()
+        org_config = OrgConfig({"scratch": True}, "dev")
+        assert build_flow.dispatch_robot_shards(mock.Mock(), org_config) == []
+
+    def test_dispatch_robot_shards__persistent_org(self):
+        build_flow = BuildFlowFactory(build__planrepo__plan__robot_shards=2)
+        org_config = OrgConfig({}, "dev")
+        assert build_flow.dispatch_robot_shards(mock.Mock(), org_config) == []
+
+    def test_wait_for_robot_shards(self):
+        build_flow = BuildFlowFactory(build__planrepo__plan__build_timeout=60)
+        build_flow.logger = mock.Mock()
+        shard = BuildFlowFactory(build=build_flow.build, parent=build_flow)
+        shard.status = "fail"
+        shard.save()
+        TestResultFactory(build_flow=shard, outcome="Fail")
+        job = mock.Mock()
+        job.get_status.return_value = "finished"
+
+        shards = build_flow.wait_for_robot_shards([(shard, job)])
+
+        assert shards == [shard]
+        assert shard.tests_total == 0
+        assert build_flow.tests_total == 1
+        assert build_flow.tests_fail == 1
+
+    def test_wait_for_robot_shards__job_failed(self):
+        build_flow = BuildFlowFactory(build__planrepo__plan__build_timeout=60)
+        build_flow.logger = mock.Mock()
+        shard = BuildFlowFactory(
+            build=build_flow.build, parent=build_flow, status="running"
+        )
+        job = mock.Mock(id="job-1")
+        job.get_status.return_value = "failed"
+
+        build_flow.wait_for_robot_shards([(shard, job)])
+
+        shard.refresh_from_db()
+        assert shard.status == "error"
+        assert "job-1" in shard.error_message
+
+    @mock.patch("metaci.build.models.cancel_robot_shards")
+    def test_wait_for_robot_shards__timeout(self, cancel_robot_shards):
+        build_flow = BuildFlowFactory(build__planrepo__plan__build_timeout=0)
+        build_flow.logger = mock.Mock()
+        shard = BuildFlowFactory(
+            build=build_flow.build, parent=build_flow, status="queued"
+        )
+
+        build_flow.wait_for_robot_shards([(shard, mock.Mock())])
+
+        cancel_robot_shards.assert_called_once_with([shard])
+        shard.refresh_from_db()
+        assert shard.status == "error"
+        assert shard.error_message == "Timed out waiting for shard to finish"
+
+    @mock.patch("metaci.build.models.BuildFlow.run", autospec=True)
+    @mock.patch("metaci.repository.models.Repository.get_github_api")
+    @mock.patch("metaci.cumulusci.keychain.MetaCIProjectKeychain.get_org")
+    def test_run_shard(self, get_org, get_gh_api, run):
+        def archive(format, zip_content, ref):
+            with open(Path(__file__).parent / "testproject.zip", "rb") as f:
+                zip_content.write(f.read())
+
+        get_gh_api.return_value.archive.side_effect = archive
+        get_org.return_value = OrgConfig({}, "test")
+        run.side_effect = lambda build_flow, *args: set_build_info(
+            build_flow, status="success"
+        )
+        parent = BuildFlowFactory(status="running", build__status="running")
+        shard = BuildFlowFactory(build=parent.build, parent=parent, flow="test")
+        build = shard.build
+        # Meanwhile the parent flow's worker writes to the build
+        Build.objects.filter(id=build.id).update(
+            log="Running flow: test", commit_status="Parent status"
+        )
+
+        try:
+            shard.run_shard(["robot/tests/a.robot"])
+        finally:
+            detach_logger(build)
+
+        assert shard.robot_suites == ["robot/tests/a.robot"]
+        assert shard.status == "success"
+        assert "Extracting zip" in shard.log
+        build.refresh_from_db()
+        assert build.log == "Running flow: test"
+        assert build.commit_status == "Parent status"
+
+    def test_skip_steps(self):
+        build_flow = BuildFlowFactory()
+        steps = [
+            mock.Mock(task_name="update_dependencies", skip=False),
+            mock.Mock(task_name="deploy", skip=False),
+            mock.Mock(task_name="run_tests", skip=False),
+        ]
+        build_flow.flow_instance = mock.Mock(steps=steps)
+
+        build_flow.dependency_steps = "skip"
+        build_flow.skip_steps()
+        assert [step.skip for step in steps] == [True, False, False]
+
+        for step in steps:
+            step.skip = False
+        build_flow.dependency_steps = "only"
+        build_flow.skip_steps()
+        assert [step.skip for step in steps] == [False, True, True]
+
+    def test_set_commit_status__shard(self):
+        parent = BuildFlowFactory()
+        shard = BuildFlowFactory(build=parent.build, parent=parent)
+        shard.build.plan.commit_status_template = "{{ 2 + 2 }}"
+        shard.flow_instance = mock.Mock()
+        shard.set_commit_status()
+        assert shard.build.commit_status is None
+
 
 def detach_logger(model):
     for handler in model.logger.handlers:
@@ -1,17 +1,22 @@
 # Lots of work to be done here!!!!
 import json
+from datetime import timedelta
 from unittest import mock
 
 import responses
 from django.test import TestCase
+from django.utils import timezone
 
-from metaci.build.tasks import check_queued_build
+from metaci.build.models import Build
+from metaci.build.tasks import cancel_robot_shards, check_queued_build, fill_org_pool
 from metaci.conftest import (
     BuildFactory,
+    BuildFlowFactory,
     OrgFactory,
     PlanFactory,
     PlanRepositoryFactory,
     RepositoryFactory,
+    ScratchOrgInstanceFactory,
 )
 
 
@@ -118,3 +123,57 @@ class TestLongRunningBuild(TestCase):
         check_queued_build(build.id)
 
         assert fake_lock_org.was_called
+
+
+class TestFillOrgPool(TestCase):
+    @mock.patch("metaci.repository.models.Repository.get_github_api")
+    def test_fill_org_pool(self, get_github_api):
+        gh_repo = get_github_api.return_value
+        gh_repo.default_branch = "main"
+        gh_repo.branch.return_value.commit.sha = "abc123"
+        repo = RepositoryFactory(name="myrepo")
+        org = OrgFactory(name="myorg", repo=repo, scratch=True)
+        plan = PlanFactory(name="myplan", org="myorg", org_pool_size=3)
+        planrepo = PlanRepositoryFactory(repo=repo, plan=plan)
+        ScratchOrgInstanceFactory(
+            org=org,
+            build=BuildFactory(planrepo=planrepo, build_type="pool", status="success"),
+            pool_fingerprint="fingerprint",
+            expiration_date=timezone.now() + timedelta(days=1),
+        )
+
+        result = fill_org_pool(planrepo.id)
+
+        assert result == f"{planrepo}: queued 2 builds to prepare orgs"
+        pool_builds = Build.objects.filter(build_type="pool", commit="abc123")
+        assert pool_builds.count() == 2
+        assert pool_builds[0].branch.name == "main"
+
+    def test_fill_org_pool__persistent_org(self):
+        repo = RepositoryFactory(name="myrepo")
+        OrgFactory(name="myorg", repo=repo, scratch=False)
+        plan = PlanFactory(name="myplan", org="myorg", org_pool_size=3)
+        planrepo = PlanRepositoryFactory(repo=repo, plan=plan)
+
+        result = fill_org_pool(planrepo.id)
+
+        assert "only supported for scratch orgs" in result
+
+
+class TestCancelRobotShards(TestCase):
+    @mock.patch("metaci.build.tasks.send_stop_job_command")
+    @mock.patch("metaci.build.tasks.Job.fetch")
+    def test_cancel_robot_shards(self, fetch, send_stop_job_command):
+        queued, started = BuildFlowFactory(), BuildFlowFactory()
+        jobs = {
+            f"robot-shard-{queued.id}": mock.Mock(id="queued-job"),
+            f"robot-shard-{started.id}": mock.Mock(id="started-job"),
+        }
+        jobs[f"robot-shard-{queued.id}"].get_status.return_value = "queued"
+        jobs[f"robot-shard-{started.id}"].get_status.return_value = "started"
+        fetch.side_effect = lambda job_id, connection: jobs[job_id]
+
+        cancel_robot_shards([queued, started])
+
+        jobs[f"robot-shard-{queued.id}"].cancel.assert_called_once_with()
+        send_stop_job_command.assert_called_once_with(mock.ANY, "started-job")
@@ -0,0 +1,37 @@
+from unittest import mock
+
+from metaci.build.sharding import get_robot_suites
+
+
+def test_get_robot_suites(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tests_dir = tmp_path / "robot" / "tests"
+    (tests_dir / "nested").mkdir(parents=True)
+    (tests_dir / "b.robot").write_text("")
+    (tests_dir / "nested" / "a.robot").write_text("")
+    (tests_dir / "resources.py").write_text("")
+    project_config = mock.Mock()
+    project_config.lookup.return_value = {"options": {"suites": "robot/tests"}}
+    project_config.get_flow.return_value.config = {
+        "steps": {
+            1: {"task": "deploy"},
+            2: {"task": "robot"},
+        }
+    }
+
+    assert get_robot_suites(project_config, "robot") == [
+        "robot/tests/b.robot",
+        "robot/tests/nested/a.robot",
+    ]
+
+
+def test_get_robot_suites__step_options(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "smoke.robot").write_text("")
+    project_config = mock.Mock()
+    project_config.lookup.return_value = None
+    project_config.get_flow.return_value.config = {
+        "steps": {1: {"task": "robot", "options": {"suites": ["smoke.robot"]}}}
+    }
+
+    assert get_robot_suites(project_config, "robot") == ["smoke.robot"]
@@ -0,0 +1,157 @@
+import io
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from metaci.build.autoscaling import Autoscaler, HerokuAutoscaler, LocalAutoscaler
+from metaci.build.simulator import (
+    Simulation,
+    TraceBuild,
+    percentile,
+    read_trace,
+    trace_from_builds,
+    write_trace,
+)
+from metaci.conftest import BuildFactory
+
+START = datetime(2022, 1, 3, 9, tzinfo=timezone.utc)
+CONFIG = {"max_workers": 3, "worker_reserve": 1, "queues": ["default", "high"]}
+
+
+def make_trace(count, every=600, duration=1200, queue="default"):
+    return [
+        TraceBuild(START + timedelta(seconds=i * every), duration, queue, 1)
+        for i in range(count)
+    ]
+
+
+class TestSimulation:
+    def test_run__heroku(self):
+        report = Simulation(
+            HerokuAutoscaler, CONFIG, make_trace(6), cost_per_hour=2
+        ).run()
+
+        assert report.builds == 6
+        # Builds wait for the autoscaler to run and the worker to boot
+        assert report.wait_max <= 120
+        assert report.peak_workers <= 3
+        assert report.worker_hours > 6 * 1200 / 3600
+        assert report.cost == pytest.approx(report.worker_hours * 2)
+        assert report.interrupted == 0
+
+    def test_run__max_workers(self):
+        trace = make_trace(6, every=0)
+
+        report = Simulation(HerokuAutoscaler, CONFIG, trace).run()
+
+        # One of the 3 workers is held in reserve for high priority builds
+        assert report.peak_workers == 2
+        # The last builds wait for the first ones to finish
+        assert report.wait_max >= 1200
+
+    def test_run__local(self):
+        report = Simulation(LocalAutoscaler, CONFIG, make_trace(3)).run()
+
+        assert report.builds == 3
+        assert LocalAutoscaler.processes == []
+
+    def test_run__predictive(self):
+        config = {**CONFIG, "policy": "predictive", "scale_down_delay": 600}
+
+        report = Simulation(HerokuAutoscaler, config, make_trace(12)).run()
+
+        assert report.builds == 12
+        targets = [target for when, target in report.decisions]
+        # The formation is wound down one worker at a time
+        assert all(a - b <= 1 for a, b in zip(targets, targets[1:]))
+        assert targets[-1] == 0
+
+    def test_run__priority(self):
+        trace = make_trace(3, every=0) + make_trace(1, every=0, queue="high")
+        config = {**CONFIG, "max_workers": 1, "worker_reserve": 0}
+
+        simulation = Simulation(HerokuAutoscaler, config, trace)
+        simulation.run()
+
+        assert simulation.completed[0][0].queue == "high"
+
+    def test_run__ignores_other_queues(self):
+        trace = make_trace(2, queue="long-running")
+
+        with pytest.raises(ValueError):
+            Simulation(Autoscaler, CONFIG, trace).run()
+
+    def test_interrupted_builds_are_requeued(self):
+        simulation = Simulation(HerokuAutoscaler, CONFIG, make_trace(1))
+        simulation.run()
+        simulation.clock = 0
+        simulation.add_worker()
+        simulation.clock = 60
+        simulation.queued["default"].append(simulation.trace[0])
+        simulation.dispatch()
+
+        simulation.set_formation(0)
+
+        assert simulation.interrupted == 1
+        assert simulation.queued["default"] == [simulation.trace[0]]
+
+
+class TestTrace:
+    def test_write_and_read(self):
+        trace = make_trace(2)
+        f = io.StringIO()
+        write_trace(trace, f)
+        f.seek(0)
+
+        assert read_trace(f) == trace
+
+    @pytest.mark.django_db
+    def test_trace_from_builds(self):
+        build = BuildFactory(
+            time_start=timezone.now(),
+            time_end=timezone.now() + timedelta(minutes=5),
+            planrepo__plan__queue="high",
+        )
+        BuildFactory(time_start=None, time_end=None)
+
+        trace = trace_from_builds(timezone.now() - timedelta(days=1))
+
+        assert trace == [TraceBuild(build.time_queue, 300, "high", build.plan_id)]
+
+    def test_percentile(self):
+        assert percentile([], 50) == 0
+        assert percentile([3, 1, 2, 4], 50) == 2
+        assert percentile([3, 1, 2, 4], 99) == 4
+
+
+class TestSimulateAutoscalerCommand:
+    def test_simulate(self, tmp_path):
+        path = tmp_path / "trace.csv"
+        with open(path, "w", newline="") as f:
+            write_trace(make_trace(3), f)
+        out = io.StringIO()
+
+        call_command(
+            "simulate_autoscaler",
+            trace=str(path),
+            app="test-app",
+            cost_per_hour=1,
+            stdout=out,
+        )
+
+        assert "Builds: 3" in out.getvalue()
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.build.management.commands.simulate_autoscaler.write_trace")
+    def test_export(self, write_trace, tmp_path):
+        out = io.StringIO()
+
+        call_command(
+            "simulate_autoscaler", export=str(tmp_path / "trace.csv"), stdout=out
+        )
+
+        assert "Wrote 0 builds" in out.getvalue()
+        write_trace.assert_called_once()
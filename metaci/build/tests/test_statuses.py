@@ -0,0 +1,158 @@
+from unittest import mock
+
+import pytest
+from github3.exceptions import ForbiddenError
+
+from metaci.build import statuses
+from metaci.conftest import BuildFactory
+
+
+@pytest.fixture(autouse=True)
+def clean_statuses(settings):
+    settings.SITE_URL = "initech.co"
+    settings.METACI_GITHUB_STATUS_INTERVAL = 0
+    yield
+    connection = statuses.get_connection()
+    for key in connection.scan_iter("metaci:statuses:*"):
+        connection.delete(key)
+
+
+@pytest.fixture
+def github():
+    github = mock.Mock()
+    with mock.patch(
+        "metaci.repository.models.Repository.get_github_api", return_value=github
+    ):
+        yield github
+
+
+def rate_limit_response(**headers):
+    response = mock.Mock(status_code=403, headers=headers)
+    response.json.return_value = {"message": "You have exceeded a rate limit"}
+    response.text = "You have exceeded a rate limit"
+    return response
+
+
+@mock.patch("metaci.build.tasks.publish_github_statuses")
+def test_request__one_job(publish_github_statuses):
+    job_id = statuses.request(1)
+
+    assert statuses.request(2) == job_id
+    publish_github_statuses.delay.assert_called_once_with(job_id=job_id)
+
+
+@mock.patch("metaci.build.tasks.publish_github_statuses")
+def test_request_many(publish_github_statuses):
+    job_id = statuses.request_many([1, 2])
+
+    connection = statuses.get_connection()
+    assert connection.zrange(statuses.PENDING_KEY, 0, -1) == [b"1", b"2"]
+    publish_github_statuses.delay.assert_called_once_with(job_id=job_id)
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.build.tasks.publish_github_statuses")
+class TestPublish:
+    def test_publish__coalesces(self, publish_github_statuses, github):
+        older = BuildFactory(planrepo__plan__context="ci")
+        newer = BuildFactory(
+            planrepo=older.planrepo, commit=older.commit, status="running"
+        )
+        other = BuildFactory(planrepo=older.planrepo)
+        for build in (older, newer, other):
+            statuses.request(build.id)
+
+        assert statuses.publish() == 2
+
+        assert github.create_status.call_count == 2
+        github.create_status.assert_any_call(
+            sha=older.commit,
+            state="pending",
+            target_url=f"initech.co/builds/{newer.id}",
+            description="The build is running",
+            context="ci",
+        )
+
+    def test_publish__skips_unchanged(self, publish_github_statuses, github):
+        build = BuildFactory(planrepo__plan__context="ci")
+        statuses.request(build.id)
+        statuses.publish()
+
+        statuses.request(build.id)
+        assert statuses.publish() == 0
+
+        github.create_status.assert_called_once()
+
+    def test_publish__batch_size(self, publish_github_statuses, github, settings):
+        settings.METACI_GITHUB_STATUS_BATCH_SIZE = 1
+        first = BuildFactory(planrepo__plan__context="ci")
+        second = BuildFactory(planrepo=first.planrepo)
+        statuses.request(first.id)
+        statuses.request(second.id)
+        publish_github_statuses.delay.reset_mock()
+
+        assert statuses.publish() == 1
+
+        connection = statuses.get_connection()
+        assert connection.zrange(statuses.PENDING_KEY, 0, -1) == [b"%d" % second.id]
+        publish_github_statuses.delay.assert_called_once()
+
+    @mock.patch("metaci.build.statuses.django_rq.get_scheduler")
+    def test_publish__rate_limited(
+        self, get_scheduler, publish_github_statuses, github
+    ):
+        build = BuildFactory(planrepo__plan__context="ci")
+        github.create_status.side_effect = ForbiddenError(
+            rate_limit_response(**{"Retry-After": "30"})
+        )
+        statuses.request(build.id)
+
+        assert statuses.publish() == 0
+
+        connection = statuses.get_connection()
+        assert connection.zrange(statuses.PENDING_KEY, 0, -1) == [b"%d" % build.id]
+        assert 0 < connection.ttl(statuses.backoff_key(build.repo_id)) <= 30
+        get_scheduler.return_value.enqueue_in.assert_called_once()
+
+        # Held back until the backoff expires
+        github.create_status.reset_mock()
+        statuses.publish()
+        github.create_status.assert_not_called()
+
+    @mock.patch("metaci.build.statuses.django_rq.get_scheduler")
+    def test_publish__error(self, get_scheduler, publish_github_statuses, github):
+        first = BuildFactory(planrepo__plan__context="ci")
+        second = BuildFactory(planrepo=first.planrepo)
+        github.create_status.side_effect = [None, ConnectionError("Reset by peer")]
+        statuses.request_many([first.id, second.id])
+
+        with pytest.raises(ConnectionError):
+            statuses.publish()
+
+        connection = statuses.get_connection()
+        assert connection.zrange(statuses.PENDING_KEY, 0, -1) == [b"%d" % second.id]
+        get_scheduler.assert_called_once_with("github")
+        get_scheduler.return_value.enqueue_in.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "status_code,headers,limited,delay",
+    [
+        (403, {"Retry-After": "30"}, 0, 30),
+        (403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"}, 0, 1),
+        (429, {}, 2, 4 * statuses.BACKOFF),
+        (429, {}, 10, statuses.MAX_BACKOFF),
+        (404, {}, 0, None),
+    ],
+)
+def test_get_rate_limit_delay(status_code, headers, limited, delay):
+    response = rate_limit_response(**headers)
+    response.status_code = status_code
+
+    assert statuses.get_rate_limit_delay(response, limited) == delay
+
+
+def test_get_rate_limit_delay__forbidden():
+    response = mock.Mock(status_code=403, headers={}, text="Resource not accessible")
+
+    assert statuses.get_rate_limit_delay(response, 0) is None
@@ -0,0 +1,203 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from metaci.build import admission, waitlist
+from metaci.build.tasks import (
+    ACTIVESCRATCHORGLIMITS_KEY,
+    ActiveScratchOrgLimits,
+    check_queued_build,
+    check_waiting_builds,
+    count_scratch_org_start,
+    delete_scratch_org,
+)
+from metaci.conftest import BuildFactory, OrgFactory, ScratchOrgInstanceFactory
+
+
+@pytest.fixture
+def org():
+    org = OrgFactory(scratch=False)
+    yield org
+    waitlist.get_connection().delete(waitlist.waitlist_key(org))
+    admission.get_connection().delete(admission.ADMISSION_KEY)
+    cache.delete(org.lock_id)
+
+
+def waiting_build(org, **kwargs):
+    build = BuildFactory(
+        org=org, planrepo__repo=org.repo, planrepo__plan__org=org.name, **kwargs
+    )
+    build.status = "waiting"
+    build.save()
+    waitlist.add(org, build)
+    return build
+
+
+@pytest.mark.django_db
+class TestWaitlist:
+    def test_fifo(self, org):
+        first = waiting_build(org)
+        second = waiting_build(org)
+
+        assert waitlist.head(org) == first.id
+        assert waitlist.can_start(org, first.id)
+        assert not waitlist.can_start(org, second.id)
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_wake(self, delay, org):
+        first = waiting_build(org)
+        waiting_build(org)
+        delay.reset_mock()
+
+        assert waitlist.wake(org) == first.id
+        delay.assert_called_once_with(first.id)
+
+        # the check is already pending
+        assert waitlist.wake(org) is None
+        assert delay.call_count == 1
+
+        # ...and wakes the queue again once it's done
+        waitlist.done_checking(org, first.id)
+        assert delay.call_count == 2
+        waitlist.done_checking(org, first.id)
+        assert delay.call_count == 2
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_wake__skips_builds_no_longer_waiting(self, delay, org):
+        first = waiting_build(org)
+        second = waiting_build(org)
+        first.status = "running"
+        first.save()
+
+        assert waitlist.wake(org) == second.id
+        assert waitlist.head(org) == second.id
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_wake__skips_builds_waiting_for_admission(self, delay, org):
+        blocked = waiting_build(org)
+        admission.add(blocked)
+        second = waiting_build(org)
+        delay.reset_mock()
+
+        assert waitlist.wake(org) == second.id
+        assert waitlist.head(org) == second.id
+        delay.assert_called_once_with(second.id)
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_unlock_wakes_waiting_build(self, delay, org):
+        build = waiting_build(org)
+        delay.reset_mock()
+        org.lock()
+        org.unlock()
+        delay.assert_called_once_with(build.id)
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.build.tasks.reset_database_connection", lambda: None)
+class TestCheckQueuedBuild:
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    @mock.patch("metaci.build.tasks.dispatch_build")
+    def test_waits_behind_earlier_build(self, dispatch_build, delay, org):
+        first = waiting_build(org)
+        build = BuildFactory(
+            org=org, planrepo__repo=org.repo, planrepo__plan__org=org.name
+        )
+        delay.reset_mock()
+
+        check_queued_build(build.id)
+
+        build.refresh_from_db()
+        assert build.status == "waiting"
+        assert not dispatch_build.called
+        assert waitlist.head(org) == first.id
+        delay.assert_called_once_with(first.id)
+
+    @mock.patch("metaci.build.tasks.dispatch_build")
+    def test_head_of_waitlist_gets_lock(self, dispatch_build, org):
+        build = waiting_build(org)
+
+        check_queued_build(build.id)
+
+        build.refresh_from_db()
+        assert build.status == "queued"
+        assert waitlist.head(org) is None
+        dispatch_build.assert_called_once_with(build, org.lock_id)
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_check_waiting_builds(self, delay, org):
+        build = waiting_build(org)
+        waitlist.remove(org, build.id)
+        delay.reset_mock()
+
+        check_waiting_builds()
+
+        assert waitlist.head(org) == build.id
+        delay.assert_called_once_with(build.id)
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    def test_check_waiting_builds__admission(self, delay, org):
+        blocked = waiting_build(org)
+        admission.add(blocked)
+        waiting = waiting_build(org)
+        for build in (blocked, waiting):
+            waitlist.remove(org, build.id)
+        delay.reset_mock()
+
+        check_waiting_builds()
+
+        assert waitlist.head(org) == waiting.id
+        assert (
+            waitlist.get_connection().zscore(waitlist.waitlist_key(org), blocked.id)
+            is None
+        )
+        assert mock.call(waiting.id) in delay.call_args_list
+
+    @mock.patch("metaci.build.tasks.check_queued_build.delay")
+    @mock.patch("metaci.build.tasks.admission.check")
+    def test_admission_blocked_build_leaves_waitlist(self, check, delay, org):
+        check.return_value = "Waiting for one of the 1 builds running for MetaCI"
+        blocked = waiting_build(org)
+        waiting = waiting_build(org)
+        delay.reset_mock()
+
+        check_queued_build(blocked.id)
+
+        blocked.refresh_from_db()
+        assert blocked.status == "waiting"
+        assert waitlist.head(org) == waiting.id
+        assert mock.call(waiting.id) in delay.call_args_list
+
+
+@pytest.mark.django_db
+class TestScratchOrgLimits:
+    def test_count_scratch_org_start__keeps_expiry(self):
+        limits = ActiveScratchOrgLimits(remaining=10, max=20)
+        cache.set(ACTIVESCRATCHORGLIMITS_KEY, limits, 30)
+
+        count_scratch_org_start(limits)
+
+        assert cache.get(ACTIVESCRATCHORGLIMITS_KEY).remaining == 9
+        assert cache.ttl(ACTIVESCRATCHORGLIMITS_KEY) <= 30
+        cache.delete(ACTIVESCRATCHORGLIMITS_KEY)
+
+    def test_count_scratch_org_start__expired(self):
+        cache.delete(ACTIVESCRATCHORGLIMITS_KEY)
+
+        count_scratch_org_start(ActiveScratchOrgLimits(remaining=10, max=20))
+
+        assert cache.get(ACTIVESCRATCHORGLIMITS_KEY) is None
+
+    @mock.patch("metaci.build.tasks.reset_database_connection", lambda: None)
+    @mock.patch("metaci.build.tasks.waitlist.wake")
+    @mock.patch("metaci.cumulusci.models.ScratchOrgInstance.delete_org")
+    def test_delete_scratch_org__forgets_limits(self, delete_org, wake):
+        instance = ScratchOrgInstanceFactory(deleted=True)
+        cache.set(
+            ACTIVESCRATCHORGLIMITS_KEY, ActiveScratchOrgLimits(remaining=0, max=20)
+        )
+
+        delete_scratch_org(instance.id)
+
+        assert cache.get(ACTIVESCRATCHORGLIMITS_KEY) is None
+        wake.assert_called_once_with(instance.org)
@@ -35,7 +35,9 @@ def view_queryset(request, query=None, status=None, filterset_class=None):
         query = {}
 
     Build = apps.get_model("build", "Build")
-    builds = Build.objects.for_user(request.user, "plan.view_builds")
+    builds = Build.objects.for_user(request.user, "plan.view_builds").select_related(
+        "repo", "plan", "branch", "current_rebuild"
+    )
     if query:
         builds = builds.filter(**query)
     if status:
@@ -0,0 +1,98 @@
+"""FIFO wait queues for builds blocked on an org.
+
+Builds that can't start because a persistent org is locked, or because
+the Dev Hub is short on scratch org capacity, are added to a Redis
+sorted set scored by the time they were queued. When the lock is
+released or a scratch org is deleted, the build at the head of the
+queue is checked again straight away instead of waiting for the
+check_waiting_builds cron.
+"""
+import django_rq
+from django.core.cache import cache
+
+SCRATCH_WAITLIST_KEY = "metaci:waitlist:scratch"
+CHECK_TIMEOUT = 60
+
+
+def get_connection():
+    return django_rq.get_connection("short")
+
+
+def waitlist_key(org):
+    if org.scratch:
+        return SCRATCH_WAITLIST_KEY
+    return f"metaci:waitlist:{org.lock_id}"
+
+
+def add(org, build):
+    """Add a build to the org's wait queue, keeping its original position."""
+    get_connection().zadd(
+        waitlist_key(org), {build.id: build.time_queue.timestamp()}, nx=True
+    )
+
+
+def remove(org, build_id):
+    get_connection().zrem(waitlist_key(org), build_id)
+
+
+def checking_key(build_id):
+    return f"metaci:waitlist:checking:{build_id}"
+
+
+def missed_key(build_id):
+    return f"metaci:waitlist:missed:{build_id}"
+
+
+def done_checking(org, build_id):
+    """Let the build be woken again, waking the org's queue if a wake was
+    missed while the build was being checked."""
+    cache.delete(checking_key(build_id))
+    if cache.delete(missed_key(build_id)):
+        wake(org)
+
+
+def head(org):
+    """Return the id of the build which is next in line for the org."""
+    ids = get_connection().zrange(waitlist_key(org), 0, 0)
+    return int(ids[0]) if ids else None
+
+
+def can_start(org, build_id):
+    """Builds only start ahead of the queue when nobody is waiting."""
+    first = head(org)
+    return first is None or first == build_id
+
+
+def wake(org):
+    """Check the build at the head of the org's wait queue.
+
+    Builds which are no longer waiting, or which are waiting to be
+    admitted rather than for the org, are dropped from the queue, and a
+    build whose check is already pending is left alone.
+    Returns the id of the build which was checked, if any.
+    """
+    from metaci.build import admission
+    from metaci.build.models import Build
+    from metaci.build.tasks import check_queued_build
+
+    while True:
+        build_id = head(org)
+        if build_id is None:
+            return None
+        build = Build.objects.filter(id=build_id).first()
+        if (
+            build is None
+            or build.get_status() != "waiting"
+            or admission.is_waiting(build_id)
+        ):
+            remove(org, build_id)
+            continue
+        if not cache.add(checking_key(build.id), True, timeout=CHECK_TIMEOUT):
+            # The check may have looked at the org before it freed up, so
+            # have it wake the queue again when it's done
+            cache.set(missed_key(build.id), True, timeout=CHECK_TIMEOUT)
+            return None
+        res_check = check_queued_build.delay(build.id)
+        build.task_id_check = res_check.id
+        build.save()
+        return build.id
@@ -0,0 +1,50 @@
+"""rq workers which the autoscaler can retire one at a time.
+
+See metaci.build.drain for the protocol.
+"""
+import os
+
+from rq.worker import HerokuWorker, Worker
+
+from metaci.build import drain
+
+
+class DrainableWorkerMixin:
+    @property
+    def drain_id(self):
+        return drain.get_worker_id(self.name)
+
+    def register_birth(self):
+        super().register_birth()
+        drain.register(self.name)
+
+    def register_death(self):
+        if drain.get_state(self.drain_id):
+            if os.environ.get("DYNO"):
+                # The dyno stays drained until the formation is scaled down
+                drain.mark_drained(self.drain_id)
+            else:
+                drain.cancel([self.drain_id])
+        drain.unregister(self.name)
+        super().register_death()
+
+    def dequeue_job_and_maintain_ttl(self, timeout):
+        if drain.get_state(self.drain_id):
+            self.log.info("Worker %s: drained, quitting", self.key)
+            return None
+        return super().dequeue_job_and_maintain_ttl(timeout)
+
+    def handle_warm_shutdown_request(self):
+        if drain.get_state(self.drain_id):
+            # Let the current job finish, which rq does when the worker is busy
+            self.log.info("Worker %s: draining after the current job", self.key)
+            return
+        super().handle_warm_shutdown_request()
+
+
+class DrainableWorker(DrainableWorkerMixin, Worker):
+    pass
+
+
+class DrainableHerokuWorker(DrainableWorkerMixin, HerokuWorker):
+    pass
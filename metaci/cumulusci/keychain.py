@@ -9,8 +9,10 @@ from metaci.cumulusci.models import Org, ScratchOrgInstance, Service
 
 
 class MetaCIProjectKeychain(BaseProjectKeychain):
-    def __init__(self, project_config, key, build):
+    def __init__(self, project_config, key, build, flow=None):
         self.build = build
+        # A robot shard's BuildFlow, which logs instead of the build
+        self.flow = flow
         super(MetaCIProjectKeychain, self).__init__(project_config, key)
 
     def get_service(self, service_type, alias=None):
@@ -63,13 +65,21 @@ class MetaCIProjectKeychain(BaseProjectKeychain):
 
         return config
 
+    def get_prepared_org(self, org_instance):
+        """Get an org config for a scratch org that was already created and prepared."""
+        config = org_instance.get_org_config()
+        config.keychain = self
+        config.org = org_instance.org
+        config.org_instance = org_instance
+        return config
+
     def _init_scratch_org(self, org_config):
         if not org_config.scratch:
             # Only run against scratch orgs
             return
 
         # Set up the logger to output to the build.log field
-        init_logger(self.build)
+        init_logger(self.flow or self.build)
 
         # Create the scratch org and get its info
         info = org_config.scratch_info
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.13 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cumulusci", "0015_json_encoder"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scratchorginstance",
+            name="pool_fingerprint",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="Set when this org was prepared ahead of time for builds with the same dependency fingerprint.",
+                max_length=64,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="scratchorginstance",
+            name="time_claimed",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
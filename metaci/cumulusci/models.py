@@ -1,10 +1,12 @@
+from datetime import timedelta
+
 from cumulusci.core.config import OrgConfig, ScratchOrgConfig
 from cumulusci.oauth.salesforce import jwt_session
 from django.apps import apps
 from django.conf import settings
 from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
+from django.db import models, transaction
 from django.http import Http404
 from django.urls import reverse
 from django.utils import timezone
@@ -93,6 +95,10 @@ class Org(models.Model):
     def unlock(self):
         if not self.scratch:
             cache.delete(self.lock_id)
+            # avoid import cycle
+            from metaci.build import waitlist
+
+            waitlist.wake(self)
 
 
 class ActiveOrgManager(models.Manager):
@@ -113,6 +119,17 @@ class ExpiredOrgManager(models.Manager):
         )
 
 
+class PooledOrgManager(ActiveOrgManager):
+    """Prepared scratch orgs which are waiting to be claimed by a build."""
+
+    def get_queryset(self):
+        return (
+            super(PooledOrgManager, self)
+            .get_queryset()
+            .filter(pool_fingerprint__isnull=False, time_claimed__isnull=True)
+        )
+
+
 class ScratchOrgInstance(models.Model):
     id: int
 
@@ -135,10 +152,19 @@ class ScratchOrgInstance(models.Model):
     time_created = models.DateTimeField(auto_now_add=True)
     time_deleted = models.DateTimeField(null=True, blank=True)
     expiration_date = models.DateTimeField(null=True, blank=True)
+    pool_fingerprint = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Set when this org was prepared ahead of time for builds with the same dependency fingerprint.",
+    )
+    time_claimed = models.DateTimeField(null=True, blank=True)
 
     objects = models.Manager()  # the first manager is used by admin
     active = ActiveOrgManager()
     expired = ExpiredOrgManager()
+    pooled = PooledOrgManager()
 
     def __str__(self):
         if self.username:
@@ -169,6 +195,32 @@ class ScratchOrgInstance(models.Model):
         org_config["date_created"] = parse_datetime(org_config["date_created"])
         return ScratchOrgConfig(org_config, self.org.name)
 
+    @classmethod
+    def claim_pooled(cls, org, fingerprint, min_expiration):
+        """Claim the oldest prepared org matching the fingerprint, if any.
+
+        Rows locked by a concurrent claim are skipped so that two builds
+        can never be handed the same org.
+        """
+        with transaction.atomic():
+            instance = (
+                cls.pooled.select_for_update(skip_locked=True)
+                .filter(
+                    org=org,
+                    pool_fingerprint=fingerprint,
+                    expiration_date__gt=min_expiration,
+                    time_created__gt=timezone.now()
+                    - timedelta(seconds=settings.METACI_ORG_POOL_MAX_AGE),
+                )
+                .order_by("time_created")
+                .first()
+            )
+            if instance is None:
+                return None
+            instance.time_claimed = timezone.now()
+            instance.save()
+        return instance
+
     def get_jwt_based_session(self):
         config = self.json
         return jwt_session(
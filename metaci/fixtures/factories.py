@@ -239,7 +239,7 @@ class ReleaseFactory(factory.django.DjangoModelFactory):
 
     change_case_template = factory.SubFactory(ChangeCaseTemplateFactory)
     repo = factory.SubFactory(RepositoryFactory)
-    git_tag = "release/1.0"
+    git_tag = factory.Sequence("release/1.{}".format)
 
 
 class ReleaseCohortFactory(factory.django.DjangoModelFactory):
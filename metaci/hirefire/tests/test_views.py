@@ -0,0 +1,102 @@
+import json
+import time
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from django_rq.queues import get_queue
+from rq.registry import StartedJobRegistry
+
+from metaci.hirefire.views import CACHE_KEY, count_jobs, get_quantities
+
+PROCESSES = {
+    "worker": {
+        "queues": ["high", "medium", "default"],
+        "max_workers": 3,
+        "worker_reserve": 1,
+    },
+    "robot_worker": {"queues": ["robot"]},
+    "worker_short": {"queues": ["short"], "min_workers": 1},
+}
+
+
+@pytest.fixture
+def robot_queue():
+    queue = get_queue("robot")
+    registry = StartedJobRegistry(queue=queue)
+    yield queue, registry
+    queue.connection.delete(queue.key, registry.key)
+
+
+def test_count_jobs(robot_queue):
+    queue, registry = robot_queue
+    queue.connection.rpush(queue.key, "queued-1", "queued-2")
+    queue.connection.zadd(
+        registry.key, {"started": time.time() + 60, "no-timeout": -1, "expired": 1}
+    )
+
+    assert count_jobs(["robot"]) == {"robot": 4}
+
+
+@override_settings(HIREFIRE_PROCESSES=PROCESSES)
+@mock.patch("metaci.hirefire.views.count_jobs")
+def test_get_quantities(count_jobs):
+    count_jobs.return_value = {
+        "high": 0,
+        "medium": 1,
+        "default": 5,
+        "robot": 4,
+        "short": 0,
+    }
+
+    assert get_quantities() == [
+        # One worker is held in reserve for the high queue
+        {"name": "worker", "quantity": 2},
+        {"name": "robot_worker", "quantity": 4},
+        {"name": "worker_short", "quantity": 1},
+    ]
+
+
+@override_settings(HIREFIRE_PROCESSES=PROCESSES)
+@mock.patch("metaci.hirefire.views.count_jobs")
+def test_get_quantities__reserve(count_jobs):
+    count_jobs.return_value = {
+        "high": 1,
+        "medium": 0,
+        "default": 5,
+        "robot": 0,
+        "short": 3,
+    }
+
+    assert get_quantities() == [
+        {"name": "worker", "quantity": 3},
+        {"name": "robot_worker", "quantity": 0},
+        {"name": "worker_short", "quantity": 3},
+    ]
+
+
+@pytest.mark.django_db
+@override_settings(HIREFIRE_TOKEN="token", HIREFIRE_CACHE_SECONDS=5)
+@mock.patch("metaci.hirefire.views.get_quantities")
+def test_info(get_quantities, client):
+    cache.delete(CACHE_KEY)
+    get_quantities.return_value = [{"name": "worker", "quantity": 2}]
+    url = reverse("info", kwargs={"token": "token"})
+
+    response = client.get(url)
+    client.get(url)
+
+    assert json.loads(response.content) == [{"name": "worker", "quantity": 2}]
+    # The second request is answered from the cache
+    get_quantities.assert_called_once()
+    cache.delete(CACHE_KEY)
+
+
+@pytest.mark.django_db
+@override_settings(HIREFIRE_TOKEN="token")
+def test_info__invalid_token(client):
+    response = client.get(reverse("info", kwargs={"token": "wrong"}))
+
+    assert response.status_code == 403
@@ -1,12 +1,16 @@
 import json
+import time
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponse, HttpResponseBadRequest
-from django_rq.queues import get_connection, get_queue_by_index
-from django_rq.settings import QUEUES_LIST
-from rq import Worker
-from rq.registry import DeferredJobRegistry, FinishedJobRegistry, StartedJobRegistry
+from django_rq.queues import get_connection, get_queue
+from rq.registry import StartedJobRegistry
+
+from metaci.build.autoscaling import allocate_workers
+
+CACHE_KEY = "metaci:hirefire:info"
 
 
 def test(request):
@@ -16,6 +20,49 @@ def test(request):
     return HttpResponse("OK")
 
 
+def count_jobs(queue_names):
+    """Return the number of queued plus started jobs on each queue.
+
+    All the counts are fetched in one round-trip. Started jobs whose
+    registry entry has expired are not counted, as if rq had cleaned up
+    the registry.
+    """
+    queues = [get_queue(name) for name in queue_names]
+    now = time.time()
+    pipeline = get_connection(queue_names[0]).pipeline(transaction=False)
+    for queue in queues:
+        registry = StartedJobRegistry(queue=queue)
+        pipeline.llen(queue.key)
+        pipeline.zcard(registry.key)
+        pipeline.zcount(registry.key, 0, now)
+    counts = pipeline.execute()
+    jobs = {}
+    for i, queue in enumerate(queues):
+        queued, started, expired = counts[3 * i : 3 * i + 3]
+        jobs[queue.name] = queued + started - expired
+    return jobs
+
+
+def get_quantities():
+    """Return how many workers each process type in HIREFIRE_PROCESSES needs."""
+    processes = settings.HIREFIRE_PROCESSES
+    jobs = count_jobs(
+        sorted({name for process in processes.values() for name in process["queues"]})
+    )
+
+    quantities = []
+    for name, process in processes.items():
+        active = sum(jobs[queue] for queue in process["queues"])
+        high = jobs["high"] if "high" in process["queues"] else 0
+        reserve = process.get("worker_reserve", 0)
+        _, quantity = allocate_workers(
+            active, high, process.get("max_workers") or active + reserve, reserve
+        )
+        quantity = max(quantity, process.get("min_workers", 0))
+        quantities.append({"name": name, "quantity": quantity})
+    return quantities
+
+
 def info(request, token):
     """
     Return the HireFire json data needed to scale worker dynos
@@ -27,43 +74,8 @@ def info(request, token):
     if token != settings.HIREFIRE_TOKEN:
         raise PermissionDenied("Invalid token")
 
-    current_tasks = 0
-
-    queues = []
-    for index, config in enumerate(QUEUES_LIST):
-
-        queue = get_queue_by_index(index)
-        connection = queue.connection
-
-        # Only look at the default queue
-        if queue.name != "default":
-            continue
-
-        queue_data = {
-            "name": queue.name,
-            "jobs": queue.count,
-            "index": index,
-            "connection_kwargs": connection.connection_pool.connection_kwargs,
-        }
-
-        connection = get_connection(queue.name)
-        all_workers = Worker.all(connection=connection)
-        queue_workers = [worker for worker in all_workers if queue in worker.queues]
-        queue_data["workers"] = len(queue_workers)
-
-        finished_job_registry = FinishedJobRegistry(queue.name, connection)
-        started_job_registry = StartedJobRegistry(queue.name, connection)
-        deferred_job_registry = DeferredJobRegistry(queue.name, connection)
-        queue_data["finished_jobs"] = len(finished_job_registry)
-        queue_data["started_jobs"] = len(started_job_registry)
-        queue_data["deferred_jobs"] = len(deferred_job_registry)
-
-        current_tasks += queue_data["jobs"]
-        current_tasks += queue_data["started_jobs"]
-
-        queues.append(queue_data)
-
-    payload = [{"quantity": current_tasks, "name": "worker"}]
-
-    payload = json.dumps(payload)
+    payload = cache.get(CACHE_KEY)
+    if payload is None:
+        payload = json.dumps(get_quantities())
+        cache.set(CACHE_KEY, payload, settings.HIREFIRE_CACHE_SECONDS)
     return HttpResponse(payload, content_type="application/json")
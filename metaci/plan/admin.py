@@ -39,5 +39,6 @@ class PlanRepositoryTriggerAdmin(GuardedModelAdmin):
 
 @admin.register(PlanSchedule)
 class PlanScheduleAdmin(GuardedModelAdmin):
-    list_display = ("plan", "branch", "schedule")
-    list_filter = ("plan", "branch", "schedule")
+    list_display = ("plan", "branch", "schedule", "time_last_skipped")
+    list_filter = ("plan", "branch", "schedule", "build_unchanged")
+    readonly_fields = ("last_skip_reason", "time_last_skipped")
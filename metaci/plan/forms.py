@@ -3,13 +3,17 @@ from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Field, Fieldset, Layout, Submit
 from django import forms
 from django.conf import settings
+from django.db.models import F, Max
 
 from metaci.build.models import Build
 from metaci.repository.models import Branch
 
 
 class RunPlanForm(forms.Form):
-    branch = forms.ChoiceField(choices=(), label="Branch")
+    branch = forms.CharField(
+        label="Branch",
+        widget=forms.TextInput(attrs={"list": "branch-choices", "autocomplete": "off"}),
+    )
     commit = forms.CharField(required=False)
     keep_org = forms.BooleanField(required=False)
     release = forms.ModelChoiceField(None, required=False)
@@ -21,7 +25,8 @@ class RunPlanForm(forms.Form):
         self.repo = planrepo.repo
         self.user = user
         super(RunPlanForm, self).__init__(*args, **kwargs)
-        self.fields["branch"].choices = self._get_branch_choices()
+        self.branch_choices = self._get_branch_choices()
+        self.fields["branch"].initial = self.branch_choices[0]
         self.fields["release"].queryset = self.repo.releases
         self.helper = FormHelper()
         self.helper.form_class = "form-vertical"
@@ -82,12 +87,31 @@ class RunPlanForm(forms.Form):
         )
 
     def _get_branch_choices(self):
-        gh_repo = self.repo.get_github_api()
-        choices = [(gh_repo.default_branch, gh_repo.default_branch)]
-        for branch in gh_repo.branches():
-            if branch.name != gh_repo.default_branch:
-                choices.append((branch.name, branch.name))
-        return tuple(choices)
+        """Offer the default branch and the most recently built branches.
+
+        Other branches are looked up as the user types, in the
+        repo_branch_search view.
+        """
+        default_branch = self.repo.get_default_branch()
+        names = (
+            self.repo.branches.exclude(name=default_branch)
+            .annotate(last_build=Max("builds__time_queue"))
+            .order_by(F("last_build").desc(nulls_last=True), "name")
+            .values_list("name", flat=True)
+        )
+        limit = settings.METACI_BRANCH_CHOICES_LIMIT
+        return (default_branch, *names[: limit - 1])
+
+    def clean_branch(self):
+        name = self.cleaned_data["branch"]
+        # The default branch is offered before it has been synced or built;
+        # create_build adds its Branch. Only the stored default branch is
+        # checked, so that validating the form never calls GitHub.
+        if name == self.repo.default_branch:
+            return name
+        if not self.repo.branches.filter(name=name).exists():
+            raise forms.ValidationError(f"Branch {name} was not found.")
+        return name
 
     def clean(self):
         if is_release_plan(self.plan):
@@ -105,9 +129,7 @@ class RunPlanForm(forms.Form):
     def create_build(self):
         commit = self.cleaned_data.get("commit")
         if not commit:
-            gh_repo = self.repo.get_github_api()
-            gh_branch = gh_repo.branch(self.cleaned_data["branch"])
-            commit = gh_branch.commit.sha
+            commit = self.repo.get_branch_head(self.cleaned_data["branch"])
 
         release = self.cleaned_data.get("release")
 
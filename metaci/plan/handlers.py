@@ -1,7 +1,10 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from metaci.build.signals import build_complete
-from metaci.plan.models import PlanRepositoryTrigger
+from metaci.plan import triggers
+from metaci.plan.models import Plan, PlanRepository, PlanRepositoryTrigger
 
 
 @receiver(build_complete)
@@ -24,3 +27,14 @@ def trigger_dependent_builds(sender, **kwargs):
             build.save()
             # Intentionally swallow the exception,
             # so that we don't error the trigger build or block other triggers.
+
+
+@receiver(post_save, sender=Plan)
+@receiver(post_delete, sender=Plan)
+@receiver(post_save, sender=PlanRepository)
+@receiver(post_delete, sender=PlanRepository)
+def invalidate_trigger_index(sender, **kwargs):
+    # Right away for this process, and again once other processes can
+    # see the change, in case they rebuilt the index in the meantime.
+    triggers.invalidate()
+    transaction.on_commit(triggers.invalidate)
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.13 on 2026-10-19 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0041_plan_org_pool_size"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="parallel_flow_orgs",
+            field=models.BooleanField(
+                default=False,
+                help_text="Give each flow that runs in parallel its own scratch org.",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="plan",
+            name="flows",
+            field=models.CharField(
+                help_text="Comma-separated flows to run in order. "
+                "Separate flows with | to run them in parallel, e.g. ci_feature, robot_a | robot_b",
+                max_length=255,
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-19 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0042_plan_parallel_flows"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="robot_shards",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Split robot suites across this many shards. "
+                "Each extra shard runs on the robot queue with its own scratch org.",
+            ),
+        ),
+    ]
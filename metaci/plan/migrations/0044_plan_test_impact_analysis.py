@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0043_plan_robot_shards"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="test_impact_analysis",
+            field=models.BooleanField(
+                default=False,
+                help_text="Outside the default branch, only run the Apex test classes "
+                "affected by the changed files or which failed recently.",
+            ),
+        ),
+    ]
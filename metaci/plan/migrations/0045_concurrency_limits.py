@@ -0,0 +1,37 @@
+# Generated by Django 3.2.13 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0044_plan_test_impact_analysis"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="max_concurrent_builds",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Maximum number of builds of this plan running at once across all repositories. 0 for no limit.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="planrepository",
+            name="max_concurrent_builds",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Maximum number of builds of this plan running at once for this repository. 0 for no limit.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="planrepository",
+            name="priority_weight",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Share of build capacity this repository gets relative to others when builds are waiting.",
+            ),
+        ),
+    ]
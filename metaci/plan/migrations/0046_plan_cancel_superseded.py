@@ -0,0 +1,27 @@
+# Generated by Django 3.2.13 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0045_concurrency_limits"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="cancel_superseded",
+            field=models.CharField(
+                choices=[
+                    ("none", "Never"),
+                    ("queued", "Queued and waiting builds"),
+                    ("running", "Queued, waiting and running builds"),
+                ],
+                default="none",
+                help_text="Cancel automatic builds of this plan on a branch when a newer commit is pushed to it.",
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0046_plan_cancel_superseded"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="plan",
+            name="reuse_build_results",
+            field=models.BooleanField(
+                default=False,
+                help_text="Report the result of an earlier successful build of the same commit "
+                "with the same plan configuration instead of running the plan again.",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.13 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0047_plan_reuse_build_results"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="planschedule",
+            name="build_unchanged",
+            field=models.BooleanField(
+                default=False,
+                help_text="Build even if the branch hasn't changed since the last scheduled build.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="planschedule",
+            name="last_skip_reason",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="planschedule",
+            name="time_last_skipped",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.13 on 2026-10-19 16:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plan", "0048_planschedule_skip_unchanged"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="plan",
+            name="org_pool_size",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Number of scratch orgs to keep prepared by installing the dependencies of this plan's first flow ahead of time. "
+                "Builds whose first flow has the same dependency fingerprint reuse a prepared org and skip its dependency steps.",
+            ),
+        ),
+    ]
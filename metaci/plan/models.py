@@ -1,3 +1,6 @@
+import functools
+import hashlib
+import json
 import re
 
 import yaml
@@ -6,6 +9,7 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.http import Http404
 from django.urls import reverse
+from django.utils import timezone
 from guardian.shortcuts import get_objects_for_user
 
 from metaci.build.models import Build
@@ -48,6 +52,17 @@ QUEUES = (
     ("long-running", "long-running"),
 )
 
+CANCEL_SUPERSEDED_CHOICES = (
+    ("none", "Never"),
+    ("queued", "Queued and waiting builds"),
+    ("running", "Queued, waiting and running builds"),
+)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_regex(pattern):
+    return re.compile(pattern)
+
 
 def validate_yaml_field(value):
     try:
@@ -92,7 +107,25 @@ class Plan(models.Model):
         blank=True,
         help_text="For Plans that use the trigger Commit Status, run builds when the commit status matches this regex.",
     )
-    flows = models.CharField(max_length=255)
+    flows = models.CharField(
+        max_length=255,
+        help_text="Comma-separated flows to run in order. "
+        "Separate flows with | to run them in parallel, e.g. ci_feature, robot_a | robot_b",
+    )
+    parallel_flow_orgs = models.BooleanField(
+        default=False,
+        help_text="Give each flow that runs in parallel its own scratch org.",
+    )
+    robot_shards = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Split robot suites across this many shards. "
+        "Each extra shard runs on the robot queue with its own scratch org.",
+    )
+    test_impact_analysis = models.BooleanField(
+        default=False,
+        help_text="Outside the default branch, only run the Apex test classes "
+        "affected by the changed files or which failed recently.",
+    )
     org = models.CharField(max_length=255)
     context = models.CharField(
         max_length=255,
@@ -122,6 +155,26 @@ class Plan(models.Model):
         null=True, blank=True, validators=[validate_yaml_field]
     )
     build_timeout = models.IntegerField(default=8 * 60 * 60)
+    max_concurrent_builds = models.PositiveIntegerField(
+        default=0,
+        help_text="Maximum number of builds of this plan running at once across all repositories. 0 for no limit.",
+    )
+    cancel_superseded = models.CharField(
+        max_length=16,
+        choices=CANCEL_SUPERSEDED_CHOICES,
+        default="none",
+        help_text="Cancel automatic builds of this plan on a branch when a newer commit is pushed to it.",
+    )
+    reuse_build_results = models.BooleanField(
+        default=False,
+        help_text="Report the result of an earlier successful build of the same commit "
+        "with the same plan configuration instead of running the plan again.",
+    )
+    org_pool_size = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of scratch orgs to keep prepared by installing the dependencies of this plan's first flow ahead of time. "
+        "Builds whose first flow has the same dependency fingerprint reuse a prepared org and skip its dependency steps.",
+    )
 
     objects = PlanQuerySet.as_manager()
 
@@ -141,6 +194,10 @@ class Plan(models.Model):
             raise ValidationError(
                 "Plans with a Commit Status trigger must specify a Commit Status Regex."
             )
+        if self.robot_shards > 1 and self.queue == "robot":
+            raise ValidationError(
+                "Robot shards run on the robot queue, so Plans which shard their robot suites must use another queue."
+            )
 
     def get_absolute_url(self):
         return reverse("plan_detail", kwargs={"plan_id": self.id})
@@ -148,6 +205,26 @@ class Plan(models.Model):
     def __str__(self):
         return self.name
 
+    def get_flow_stages(self):
+        """Split flows into stages, each a list of flows to run in parallel."""
+        return [
+            [flow.strip() for flow in stage.split("|")]
+            for stage in self.flows.split(",")
+        ]
+
+    def get_config_hash(self):
+        """Hash the plan settings which can change the outcome of a build."""
+        config = {
+            "flows": self.flows,
+            "org": self.org,
+            "yaml_config": self.yaml_config,
+            "sfdx_config": self.sfdx_config,
+            "junit_path": self.junit_path,
+            "commit_status_template": self.commit_status_template,
+            "test_impact_analysis": self.test_impact_analysis,
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
     def get_repos(self):
         for repo in self.repos.all():
             yield repo
@@ -158,11 +235,11 @@ class Plan(models.Model):
         branch = payload["ref"][11:]
 
         # Check the branch against regex
-        return re.match(self.regex, branch)
+        return compile_regex(self.regex).match(branch)
 
     def _check_status_event_branch_regex(self, payload):
         return any(
-            re.match(self.regex, branch["name"])
+            compile_regex(self.regex).match(branch["name"])
             for branch in payload.get("branches", [])
         )
 
@@ -203,7 +280,7 @@ class Plan(models.Model):
                 tag = payload["ref"][10:]
 
                 # Check the tag against regex
-                if not re.match(self.regex, tag):
+                if not compile_regex(self.regex).match(tag):
                     return run_build, commit, commit_message
 
                 run_build = True
@@ -214,7 +291,7 @@ class Plan(models.Model):
             and self.trigger == "status"
             and payload["state"] == "success"
         ):
-            if not re.match(self.commit_status_regex, payload["context"]):
+            if not compile_regex(self.commit_status_regex).match(payload["context"]):
                 return run_build, commit, commit_message
 
             # If we also have a branch regex filter, run it.
@@ -257,6 +334,14 @@ class PlanRepository(models.Model):
     plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
     repo = models.ForeignKey(Repository, on_delete=models.CASCADE)
     active = models.BooleanField(default=True)
+    max_concurrent_builds = models.PositiveIntegerField(
+        default=0,
+        help_text="Maximum number of builds of this plan running at once for this repository. 0 for no limit.",
+    )
+    priority_weight = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Share of build capacity this repository gets relative to others when builds are waiting.",
+    )
 
     objects = PlanRepositoryQuerySet.as_manager()
 
@@ -341,19 +426,71 @@ class PlanSchedule(models.Model):
     plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
     branch = models.ForeignKey("repository.branch", on_delete=models.CASCADE)
     schedule = models.CharField(max_length=16, choices=SCHEDULE_CHOICES)
+    build_unchanged = models.BooleanField(
+        default=False,
+        help_text="Build even if the branch hasn't changed since the last scheduled build.",
+    )
+    last_skip_reason = models.CharField(max_length=255, null=True, blank=True)
+    time_last_skipped = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name_plural = "Plan Schedules"
 
     def run(self):
+        """Create a build of the branch HEAD.
+
+        Returns None if the build was skipped because the last scheduled
+        build of the plan already ran on that commit.
+        """
+        commit = self.branch.get_github_api().commit.sha
+        reason = self.get_skip_reason(commit, self.get_last_build())
+        if reason:
+            self.skip(reason)
+            self.save(update_fields=["last_skip_reason", "time_last_skipped"])
+            return None
+        build = self.new_build(commit)
+        build.save()
+        return build
+
+    def get_last_build(self):
         Build = apps.get_model("build", "Build")
-        build = Build(
+        return (
+            Build.objects.filter(
+                plan=self.plan, branch=self.branch, build_type="scheduled"
+            )
+            .order_by("-time_queue")
+            .first()
+        )
+
+    def get_skip_reason(self, commit, last_build):
+        """Return why no build is needed for the commit, or None."""
+        if self.build_unchanged or last_build is None:
+            return None
+        # Builds which errored or were canceled didn't test the commit
+        if last_build.commit == commit and last_build.get_status() not in (
+            "error",
+            "canceled",
+        ):
+            return (
+                f"Branch {self.branch.name} is still at commit {commit[:8]} "
+                f"built by #{last_build.id}"
+            )
+        return None
+
+    def skip(self, reason):
+        self.last_skip_reason = reason
+        self.time_last_skipped = timezone.now()
+
+    def new_build(self, commit, planrepo=None):
+        """Return an unsaved build of the commit."""
+        Build = apps.get_model("build", "Build")
+        return Build(
             repo=self.branch.repo,
             plan=self.plan,
+            planrepo=planrepo,
             branch=self.branch,
-            commit=self.branch.get_github_api().commit.sha,
+            commit=commit,
             schedule=self,
             build_type="scheduled",
+            config_hash=self.plan.get_config_hash(),
         )
-        build.save()
-        return build
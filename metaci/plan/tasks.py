@@ -1,30 +1,117 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
 import django_rq
 from django import db
+from django.conf import settings
 
-from metaci.plan.models import PlanSchedule
+from metaci.build.handlers import queue_builds
+from metaci.build.models import Build
+from metaci.plan.models import PlanRepository, PlanSchedule
 
 
 def reset_database_connection():
     db.connection.close()
 
 
+def get_branch_heads(branches):
+    """Fetch the HEAD commit of each branch from GitHub.
+
+    Repositories are fetched concurrently, sharing one API client for
+    the branches of each repository. Returns a dict of branch id to
+    commit sha, or to the exception raised while fetching it.
+    """
+    by_repo = defaultdict(list)
+    for branch in branches:
+        by_repo[branch.repo].append(branch)
+
+    def fetch(repo, branches):
+        heads = {}
+        try:
+            gh_repo = repo.get_github_api()
+            for branch in branches:
+                try:
+                    heads[branch.id] = gh_repo.branch(branch.name).commit.sha
+                except Exception as e:
+                    heads[branch.id] = e
+        except Exception as e:
+            return {branch.id: e for branch in branches}
+        finally:
+            # Each thread opens its own database connection
+            db.connection.close()
+        return heads
+
+    heads = {}
+    with ThreadPoolExecutor(max_workers=settings.METACI_SCHEDULE_WORKERS) as pool:
+        for result in pool.map(lambda item: fetch(*item), by_repo.items()):
+            heads.update(result)
+    return heads
+
+
+def get_last_scheduled_builds(schedules):
+    """Return the latest scheduled build for each (plan, branch) of the schedules."""
+    builds = (
+        Build.objects.filter(
+            build_type="scheduled",
+            plan_id__in={sched.plan_id for sched in schedules},
+            branch_id__in={sched.branch_id for sched in schedules},
+        )
+        .select_related("current_rebuild")
+        .order_by("plan_id", "branch_id", "-time_queue")
+        .distinct("plan_id", "branch_id")
+    )
+    return {(build.plan_id, build.branch_id): build for build in builds}
+
+
 def run_scheduled(schedule):
     reset_database_connection()
 
-    schedules = PlanSchedule.objects.filter(schedule=schedule)
+    schedules = list(
+        PlanSchedule.objects.filter(schedule=schedule).select_related(
+            "plan", "branch__repo"
+        )
+    )
 
     log = []
-    log.append(f"Found {schedules.count()} {schedule} schedules to run")
-
+    log.append(f"Found {len(schedules)} {schedule} schedules to run")
+
+    heads = get_branch_heads({sched.branch for sched in schedules})
+    last_builds = get_last_scheduled_builds(schedules)
+    planrepos = {
+        (planrepo.plan_id, planrepo.repo_id): planrepo
+        for planrepo in PlanRepository.objects.filter(
+            plan_id__in={sched.plan_id for sched in schedules}
+        )
+    }
+
+    skipped = []
+    builds = []
     for sched in schedules:
-        try:
-            build = sched.run()
-            log.append(
-                f"Created build #{build.id} from Plan {sched.plan} on branch {sched.branch}"
-            )
-
-        except Exception as e:
-            log.append(f"Schedule {sched} failed with error:\n{str(e)}")
+        commit = heads.get(sched.branch_id)
+        if isinstance(commit, Exception):
+            log.append(f"Schedule {sched} failed with error:\n{str(commit)}")
+            continue
+        reason = sched.get_skip_reason(
+            commit, last_builds.get((sched.plan_id, sched.branch_id))
+        )
+        if reason:
+            sched.skip(reason)
+            skipped.append(sched)
+            log.append(f"Skipped Plan {sched.plan} on branch {sched.branch}: {reason}")
+            continue
+        planrepo = planrepos.get((sched.plan_id, sched.branch.repo_id))
+        builds.append(sched.new_build(commit, planrepo))
+
+    PlanSchedule.objects.bulk_update(skipped, ["last_skip_reason", "time_last_skipped"])
+    builds = Build.objects.bulk_create(builds)
+    for build in builds:
+        log.append(
+            f"Created build #{build.id} from Plan {build.plan} on branch {build.branch}"
+        )
+    try:
+        queue_builds(builds)
+    except Exception as e:
+        log.append(f"Builds could not be queued:\n{str(e)}")
 
     return "\n".join(log)
 
@@ -1,7 +1,10 @@
+from unittest import mock
+
 import pytest
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
+from metaci.conftest import PlanRepositoryFactory, PlanScheduleFactory
 from metaci.plan.models import Plan
 from metaci.repository.models import Repository
 
@@ -193,3 +196,59 @@ class PlanTestCase(TestCase):
             match="Only Plans with a Commit Status trigger may specify a Commit Status Regex.",
         ):
             self.commit_plan.clean()
+
+    def test_robot_shards_on_robot_queue(self):
+        self.commit_plan.robot_shards = 2
+        self.commit_plan.queue = "robot"
+        with pytest.raises(ValidationError, match="must use another queue"):
+            self.commit_plan.clean()
+
+    def test_get_flow_stages(self):
+        self.commit_plan.flows = "ci_feature, robot_a | robot_b,ci_beta"
+        assert self.commit_plan.get_flow_stages() == [
+            ["ci_feature"],
+            ["robot_a", "robot_b"],
+            ["ci_beta"],
+        ]
+
+
+@pytest.mark.django_db
+class TestPlanSchedule:
+    def schedule_with_head(self, sha, **kwargs):
+        schedule = PlanScheduleFactory(**kwargs)
+        PlanRepositoryFactory(plan=schedule.plan, repo=schedule.branch.repo)
+        github = mock.Mock()
+        github.commit.sha = sha
+        schedule.branch.get_github_api = mock.Mock(return_value=github)
+        return schedule
+
+    def test_run(self):
+        schedule = self.schedule_with_head("abc123")
+
+        build = schedule.run()
+
+        assert build.commit == "abc123"
+        assert build.build_type == "scheduled"
+        assert build.schedule == schedule
+
+    def test_run__skips_unchanged_branch(self):
+        schedule = self.schedule_with_head("abc123")
+        previous = schedule.run()
+        previous.set_status("success")
+
+        assert schedule.run() is None
+        schedule.refresh_from_db()
+        assert f"#{previous.id}" in schedule.last_skip_reason
+        assert schedule.time_last_skipped is not None
+
+    def test_run__reruns_after_error(self):
+        schedule = self.schedule_with_head("abc123")
+        schedule.run().set_status("error")
+
+        assert schedule.run() is not None
+
+    def test_run__build_unchanged(self):
+        schedule = self.schedule_with_head("abc123", build_unchanged=True)
+        schedule.run().set_status("success")
+
+        assert schedule.run() is not None
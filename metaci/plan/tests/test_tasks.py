@@ -0,0 +1,92 @@
+from unittest import mock
+
+import pytest
+
+from metaci.build.models import Build
+from metaci.conftest import PlanRepositoryFactory, PlanScheduleFactory
+from metaci.plan.tasks import run_scheduled
+
+
+def github_heads(heads):
+    def get_github_api(repo):
+        gh_repo = mock.Mock()
+
+        def branch(name):
+            if isinstance(heads[name], Exception):
+                raise heads[name]
+            return mock.Mock(commit=mock.Mock(sha=heads[name]))
+
+        gh_repo.branch.side_effect = branch
+        return gh_repo
+
+    return mock.patch(
+        "metaci.repository.models.Repository.get_github_api",
+        autospec=True,
+        side_effect=get_github_api,
+    )
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.plan.tasks.reset_database_connection", lambda: None)
+class TestRunScheduled:
+    def schedule(self, branch_name, **kwargs):
+        schedule = PlanScheduleFactory(
+            schedule="daily", branch__name=branch_name, **kwargs
+        )
+        PlanRepositoryFactory(plan=schedule.plan, repo=schedule.branch.repo)
+        return schedule
+
+    @mock.patch("metaci.plan.tasks.queue_builds")
+    def test_run_scheduled(self, queue_builds):
+        first = self.schedule("main")
+        second = self.schedule("feature/one")
+
+        with github_heads({"main": "abc", "feature/one": "def"}):
+            log = run_scheduled("daily")
+
+        assert "Found 2 daily schedules to run" in log
+        builds = Build.objects.filter(build_type="scheduled")
+        assert {(b.schedule_id, b.commit) for b in builds} == {
+            (first.id, "abc"),
+            (second.id, "def"),
+        }
+        assert all(b.planrepo is not None for b in builds)
+        queue_builds.assert_called_once()
+        assert {b.id for b in queue_builds.call_args[0][0]} == {b.id for b in builds}
+
+    @mock.patch("metaci.plan.tasks.queue_builds")
+    def test_run_scheduled__queue_error(self, queue_builds):
+        queue_builds.side_effect = Exception("Redis is down")
+        self.schedule("main")
+
+        with github_heads({"main": "abc"}):
+            log = run_scheduled("daily")
+
+        assert "Builds could not be queued:\nRedis is down" in log
+        assert Build.objects.filter(build_type="scheduled").count() == 1
+
+    @mock.patch("metaci.plan.tasks.queue_builds")
+    def test_run_scheduled__skips_unchanged(self, queue_builds):
+        schedule = self.schedule("main")
+        with github_heads({"main": "abc"}):
+            run_scheduled("daily")
+        Build.objects.get(schedule=schedule).set_status("success")
+
+        with github_heads({"main": "abc"}):
+            log = run_scheduled("daily")
+
+        assert f"Skipped Plan {schedule.plan} on branch {schedule.branch}" in log
+        assert Build.objects.filter(schedule=schedule).count() == 1
+        schedule.refresh_from_db()
+        assert schedule.time_last_skipped is not None
+
+    @mock.patch("metaci.plan.tasks.queue_builds")
+    def test_run_scheduled__error(self, queue_builds):
+        broken = self.schedule("broken")
+        self.schedule("main")
+
+        with github_heads({"broken": Exception("Not Found"), "main": "abc"}):
+            log = run_scheduled("daily")
+
+        assert f"Schedule {broken} failed with error:\nNot Found" in log
+        assert Build.objects.filter(build_type="scheduled").count() == 1
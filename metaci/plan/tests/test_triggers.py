@@ -0,0 +1,64 @@
+import pytest
+from django.core.cache import cache
+
+from metaci.conftest import PlanRepositoryFactory, RepositoryFactory
+from metaci.plan import triggers
+
+PUSH = {"ref": "refs/heads/feature/test", "after": "abc123", "commits": []}
+
+
+@pytest.fixture
+def repo():
+    repo = RepositoryFactory()
+    yield repo
+    cache.delete_pattern("metaci:plan_triggers:*")
+
+
+@pytest.mark.django_db
+class TestGetTriggeredBuilds:
+    def test_matches(self, repo):
+        commit = PlanRepositoryFactory(
+            repo=repo, plan__trigger="commit", plan__regex="feature/"
+        )
+        PlanRepositoryFactory(repo=repo, plan__trigger="commit", plan__regex="main")
+        PlanRepositoryFactory(repo=repo, plan__trigger="tag", plan__regex="beta/")
+
+        builds = triggers.get_triggered_builds(repo, "push", PUSH)
+
+        assert builds == [(commit, "abc123", None)]
+
+    def test_index(self, repo):
+        PlanRepositoryFactory(repo=repo, plan__trigger="commit", plan__regex=None)
+        PlanRepositoryFactory(repo=repo, plan__trigger="commit", plan__regex="(")
+        PlanRepositoryFactory(repo=repo, plan__trigger="manual", plan__regex=".*")
+        PlanRepositoryFactory(
+            repo=repo, active=False, plan__trigger="commit", plan__regex=".*"
+        )
+        status = PlanRepositoryFactory(
+            repo=repo, plan__trigger="status", plan__commit_status_regex="ci"
+        )
+
+        index = triggers.get_index(repo)
+
+        assert index["push"] == []
+        assert [entry["planrepo_id"] for entry in index["status"]] == [status.id]
+
+    def test_cached(self, repo, django_assert_num_queries):
+        PlanRepositoryFactory(repo=repo, plan__trigger="commit", plan__regex="main")
+        triggers.get_triggered_builds(repo, "push", PUSH)
+
+        with django_assert_num_queries(0):
+            assert triggers.get_triggered_builds(repo, "push", PUSH) == []
+
+    def test_invalidated(self, repo):
+        planrepo = PlanRepositoryFactory(
+            repo=repo, plan__trigger="commit", plan__regex="main"
+        )
+        assert triggers.get_triggered_builds(repo, "push", PUSH) == []
+
+        planrepo.plan.regex = "feature/"
+        planrepo.plan.save()
+
+        assert triggers.get_triggered_builds(repo, "push", PUSH) == [
+            (planrepo, "abc123", None)
+        ]
@@ -68,6 +68,25 @@ class TestPlanViews:
 
         assert response.status_code == 200
 
+    def test_plan_run_repo__branch_choices(self, client, data, superuser):
+        data["repo"].default_branch = "main"
+        data["repo"].save()
+        BranchFactory(name="feature/unbuilt", repo=data["repo"])
+        client.force_login(superuser)
+        url = reverse(
+            "plan_run_repo",
+            kwargs={
+                "plan_id": data["plan"].id,
+                "repo_owner": data["repo"].owner,
+                "repo_name": data["repo"].name,
+            },
+        )
+        response = client.get(url)
+
+        assert response.status_code == 200
+        assert response.context["form"].branch_choices[0] == "main"
+        assert b'<option value="feature/unbuilt">' in response.content
+
     @mock.patch("metaci.plan.views.RunPlanForm")
     def test_plan_run_repo__post(self, RunPlanForm, client, data, superuser):
         client.force_login(superuser)
@@ -88,6 +107,28 @@ class TestPlanViews:
         )
         assert response.status_code == 302
 
+    @mock.patch("metaci.plan.forms.RunPlanForm.create_build")
+    def test_plan_run_repo__post_default_branch(
+        self, create_build, client, data, superuser
+    ):
+        data["repo"].default_branch = "main"
+        data["repo"].save()
+        create_build.return_value = data["build"]
+        client.force_login(superuser)
+        url = reverse(
+            "plan_run_repo",
+            kwargs={
+                "plan_id": data["plan"].id,
+                "repo_owner": data["repo"].owner,
+                "repo_name": data["repo"].name,
+            },
+        )
+
+        response = client.post(url, {"branch": "main"})
+
+        assert response.status_code == 302
+        assert create_build.called
+
     def test_plan_run_repo__no_change_case(self, mocker, client, data, superuser):
         mocker.patch("metaci.plan.forms.RunPlanForm._get_branch_choices")
         mocker.patch(
@@ -95,6 +136,9 @@ class TestPlanViews:
         )
         data["plan"].role = "release"
         data["plan"].save()
+        data["repo"].default_branch = "main"
+        data["repo"].save()
+        BranchFactory(name="feature/branch-a", repo=data["repo"])
 
         client.force_login(superuser)
         url = reverse(
@@ -109,7 +153,7 @@ class TestPlanViews:
         response = client.post(
             url,
             {
-                "branch": BranchFactory(name="feature/branch-a", repo=data["repo"]).pk,
+                "branch": "feature/branch-a",
                 "release": ReleaseFactory(repo=data["repo"]).pk,
             },
         )
@@ -0,0 +1,120 @@
+"""Look up the plans which a GitHub webhook triggers.
+
+A busy repository has dozens of plans, and every push and status webhook
+used to load all of them to try each one's regexes. Instead, the trigger
+settings of a repository's active plans are indexed by the webhook event
+which can trigger them and kept in the cache:
+
+- only plans with the regexes their trigger needs are indexed;
+- an event is checked against the indexed settings, and only the plans
+  it triggers are loaded from the database;
+- regexes are compiled once per process;
+- saving or deleting a Plan or PlanRepository changes the index version,
+  so every process rebuilds the index on its next webhook.
+"""
+import logging
+import re
+import uuid
+
+from django.core.cache import cache
+
+from metaci.plan.models import Plan, PlanRepository, compile_regex
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "metaci:plan_triggers:version"
+# Seconds an index is kept when its repository receives no webhooks
+INDEX_TIMEOUT = 24 * 60 * 60
+EVENT_TRIGGERS = {"push": ("commit", "tag"), "status": ("status",)}
+
+
+def index_key(version, repo_id):
+    return f"metaci:plan_triggers:{version}:{repo_id}"
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, str(uuid.uuid4()), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Make every process rebuild its index."""
+    cache.set(VERSION_KEY, str(uuid.uuid4()), timeout=None)
+
+
+def build_index(repo):
+    """Return the trigger settings of the repository's plans by event."""
+    index = {event: [] for event in EVENT_TRIGGERS}
+    planrepos = (
+        PlanRepository.objects.should_run()
+        .filter(repo=repo, plan__trigger__in=["commit", "tag", "status"])
+        .select_related("plan")
+    )
+    for planrepo in planrepos:
+        plan = planrepo.plan
+        if plan.trigger == "status":
+            # The regex optionally filters the branches of the commit
+            required, optional = plan.commit_status_regex, plan.regex
+        else:
+            required, optional = plan.regex, None
+        if not required:
+            # Nothing can trigger the plan
+            continue
+        try:
+            for pattern in filter(None, (required, optional)):
+                compile_regex(pattern)
+        except re.error as e:
+            logger.warning(f"Not triggering {planrepo} from webhooks: {e}")
+            continue
+
+        for event, triggers in EVENT_TRIGGERS.items():
+            if plan.trigger in triggers:
+                index[event].append(
+                    {
+                        "planrepo_id": planrepo.id,
+                        "plan_id": plan.id,
+                        "trigger": plan.trigger,
+                        "regex": plan.regex,
+                        "commit_status_regex": plan.commit_status_regex,
+                    }
+                )
+    return index
+
+
+def get_index(repo):
+    # Read the version first, so an index built while a plan is being
+    # saved is stored under the version which that save replaces.
+    key = index_key(get_version(), repo.id)
+    index = cache.get(key)
+    if index is None:
+        index = build_index(repo)
+        cache.set(key, index, timeout=INDEX_TIMEOUT)
+    return index
+
+
+def get_triggered_builds(repo, event, payload):
+    """Return the plan repository, commit and commit message of each build
+    which the event triggers."""
+    matches = {}
+    for entry in get_index(repo).get(event, []):
+        plan = Plan(
+            id=entry["plan_id"],
+            trigger=entry["trigger"],
+            regex=entry["regex"],
+            commit_status_regex=entry["commit_status_regex"],
+        )
+        run_build, commit, commit_message = plan.check_github_event(event, payload)
+        if run_build:
+            matches[entry["planrepo_id"]] = commit, commit_message
+    if not matches:
+        return []
+
+    planrepos = PlanRepository.objects.select_related("plan").in_bulk(matches)
+    return [
+        (planrepos[planrepo_id], commit, commit_message)
+        for planrepo_id, (commit, commit_message) in matches.items()
+        if planrepo_id in planrepos
+    ]
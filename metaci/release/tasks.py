@@ -1,6 +1,10 @@
-from datetime import datetime, timezone
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 
+import django_rq
 from django.conf import settings
+from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from django.urls import reverse
@@ -11,6 +15,16 @@ from github3.repos.repo import Repository as GitHubRepository
 from metaci.release.models import Release, ReleaseCohort
 from metaci.repository.models import Repository
 
+logger = logging.getLogger(__name__)
+
+MERGE_FREEZE_PENDING_KEY = "metaci:merge_freeze:pending"
+MERGE_FREEZE_SCHEDULED_KEY = "metaci:merge_freeze:scheduled"
+MERGE_FREEZE_RETRY_KEY = "metaci:merge_freeze:retry"
+# Seconds until an update job which never ran stops blocking new ones
+MERGE_FREEZE_SCHEDULED_TIMEOUT = 5 * 60
+# Seconds until repositories which failed to update are tried again
+MERGE_FREEZE_RETRY_DELAY = 60
+
 
 @job
 def update_cohort_status() -> str:
@@ -43,34 +57,159 @@ def _update_release_cohorts() -> str:
     return f"Enabled merge freeze on {', '.join(names_started)} and ended merge freeze on {', '.join(names_ended)}."
 
 
-def set_merge_freeze_status(repo: Repository, *, freeze: bool):
-    # Get all open PRs in this repository
+def get_pull_request_heads(repo: Repository):
+    """Return the GitHub repository and the head commits of its open PRs."""
     github_repo = repo.get_github_api()
-    for pr in github_repo.pull_requests(state="open", base=github_repo.default_branch):
-        # For each PR, get the head commit and apply the freeze status
-        set_merge_freeze_status_for_commit(github_repo, pr.head.sha, freeze=freeze)
+    pull_requests = github_repo.pull_requests(
+        state="open", base=github_repo.default_branch
+    )
+    return github_repo, [pr.head.sha for pr in pull_requests]
+
+
+def set_merge_freeze_statuses(heads, on_error=None) -> int:
+    """Apply the merge freeze status to the head commits of open PRs.
+
+    heads is a list of (GitHub repository, head commits, freeze) tuples.
+    Statuses are set in parallel. Returns how many were set.
+
+    When a status can't be set, on_error is called with the index of its
+    repository in heads and the exception, or the exception is raised if
+    there is no on_error.
+    """
+    commits = [
+        (i, github_repo, commit, freeze)
+        for i, (github_repo, commits, freeze) in enumerate(heads)
+        for commit in commits
+    ]
+
+    def set_status(item):
+        i, github_repo, commit, freeze = item
+        try:
+            set_merge_freeze_status_for_commit(github_repo, commit, freeze=freeze)
+            return True
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(i, e)
+            return False
+
+    with ThreadPoolExecutor(max_workers=settings.METACI_MERGE_FREEZE_WORKERS) as pool:
+        return sum(pool.map(set_status, commits))
+
+
+def set_merge_freeze_status(repo: Repository, *, freeze: bool) -> int:
+    # Get all open PRs in this repository
+    github_repo, commits = get_pull_request_heads(repo)
+    # For each PR, get the head commit and apply the freeze status
+    return set_merge_freeze_statuses([(github_repo, commits, freeze)])
+
+
+def get_merge_freeze_status(freeze: bool) -> dict:
+    if freeze:
+        return {
+            "state": "error",
+            "description": _("This repository is under merge freeze."),
+            "target_url": settings.SITE_URL + reverse("cohort_list"),
+        }
+    return {"state": "success", "description": "", "target_url": ""}
 
 
 def set_merge_freeze_status_for_commit(
     repo: GitHubRepository, commit: str, *, freeze: bool
 ):
-    if freeze:
-        state = "error"
-        description = _("This repository is under merge freeze.")
-        target_url = settings.SITE_URL + reverse("cohort_list")
-    else:
-        state = "success"
-        description = ""
-        target_url = ""
-
-    repo.create_status(
-        sha=commit,
-        state=state,
-        target_url=target_url,
-        description=description,
-        context=_("Merge Freeze"),
+    status = get_merge_freeze_status(freeze)
+    repo.create_status(sha=commit, context=_("Merge Freeze"), **status)
+
+
+def queue_merge_freeze_update(repo_ids):
+    """Update the merge freeze statuses of repositories in the background.
+
+    The update is queued once the current transaction commits, so that it
+    sees the saved Releases and Release Cohorts. Repositories queued by
+    several saves are updated once.
+    """
+    repo_ids = set(repo_ids)
+    if repo_ids:
+        transaction.on_commit(lambda: schedule_merge_freeze_update(repo_ids))
+
+
+def schedule_merge_freeze_update(repo_ids):
+    connection = django_rq.get_connection("short")
+    connection.sadd(MERGE_FREEZE_PENDING_KEY, *repo_ids)
+    if connection.set(
+        MERGE_FREEZE_SCHEDULED_KEY, 1, nx=True, ex=MERGE_FREEZE_SCHEDULED_TIMEOUT
+    ):
+        update_merge_freeze_statuses.delay()
+
+
+@job("short")
+def update_merge_freeze_statuses() -> str:
+    """Set the merge freeze status of open PRs in the queued repositories.
+
+    Repositories with a Release in an Active Release Cohort are frozen and
+    the others are released.
+    """
+    connection = django_rq.get_connection("short")
+    with connection.pipeline() as pipe:
+        # Repositories queued from now on are updated by the next job
+        pipe.delete(MERGE_FREEZE_SCHEDULED_KEY)
+        pipe.smembers(MERGE_FREEZE_PENDING_KEY)
+        pipe.delete(MERGE_FREEZE_PENDING_KEY)
+        _, repo_ids, _ = pipe.execute()
+
+    repos = list(
+        Repository.objects.filter(id__in=[int(repo_id) for repo_id in repo_ids])
+    )
+    frozen = set(
+        Release.objects.filter(
+            repo__in=repos, release_cohort__status="Active"
+        ).values_list("repo_id", flat=True)
     )
 
+    failed = set()
+
+    def get_heads(repo):
+        try:
+            return get_pull_request_heads(repo)
+        except Exception:
+            logger.exception(f"Could not list the open pull requests of {repo}")
+            failed.add(repo.id)
+
+    with ThreadPoolExecutor(max_workers=settings.METACI_MERGE_FREEZE_WORKERS) as pool:
+        heads = [
+            (repo, repo_heads)
+            for repo, repo_heads in zip(repos, pool.map(get_heads, repos))
+            if repo_heads is not None
+        ]
+
+    def on_error(i, e):
+        repo = heads[i][0]
+        logger.error(f"Could not set a merge freeze status in {repo}: {e}")
+        failed.add(repo.id)
+
+    count = set_merge_freeze_statuses(
+        [
+            (github_repo, commits, repo.id in frozen)
+            for repo, (github_repo, commits) in heads
+        ],
+        on_error=on_error,
+    )
+    result = f"Updated {count} merge freeze statuses in {len(repos)} repositories."
+    if failed:
+        retry_merge_freeze_update(failed)
+        result += f" {len(failed)} repositories failed and will be retried."
+    return result
+
+
+def retry_merge_freeze_update(repo_ids):
+    """Queue repositories which failed to update for a later job."""
+    connection = django_rq.get_connection("short")
+    connection.sadd(MERGE_FREEZE_PENDING_KEY, *repo_ids)
+    if connection.set(MERGE_FREEZE_RETRY_KEY, 1, nx=True, ex=MERGE_FREEZE_RETRY_DELAY):
+        django_rq.get_scheduler("short").enqueue_in(
+            timedelta(seconds=MERGE_FREEZE_RETRY_DELAY), update_merge_freeze_statuses
+        )
+
 
 def release_merge_freeze_if_safe(repo: Repository):
     if not Release.objects.filter(repo=repo, release_cohort__status="Active").count():
@@ -82,14 +221,9 @@ def react_to_release_cohort_change(instance: ReleaseCohort, **kwargs):
     # We're interested in Release Cohort deletion and updates to the date-time fields and Status.
     # Cohort Creation alone won't trigger merge freeze (associating a Release to the Cohort will)
 
-    # If the Release Cohort is currently in scope, add merge freeze on all of its repos.
-    if instance.status == "Active":
-        for release in instance.releases.all():
-            set_merge_freeze_status(release.repo, freeze=True)
-    else:
-        # Otherwise, release any merge freezes that are safe to release.
-        for release in instance.releases.all():
-            release_merge_freeze_if_safe(release.repo)
+    # If the Release Cohort is currently in scope, this adds merge freeze on all of its repos.
+    # Otherwise, it releases any merge freezes that are safe to release.
+    queue_merge_freeze_update(instance.releases.values_list("repo_id", flat=True))
 
 
 @receiver(post_save, sender=Release)
@@ -101,16 +235,13 @@ def react_to_release_change(instance: Release, **kwargs):
     if kwargs.get("created", False):
         # There is no case where Release creation would lead to lifting merge freeze.
         if instance.release_cohort and instance.release_cohort.status == "Active":
-            set_merge_freeze_status(instance.repo, freeze=True)
+            queue_merge_freeze_update([instance.repo_id])
     else:
         # A Release was updated - if it was added to an in-scope Cohort, set merge freeze.
-        if instance.release_cohort and instance.release_cohort.status == "Active":
-            set_merge_freeze_status(instance.repo, freeze=True)
-        else:
-            # This Release might have been moved from an in-scope release cohort to an out-of-scope Release Cohort or None
-            # We don't know if this repo is also included in a different Release that might be in scope, so we can't
-            # safely lift merge freeze until we check.
-            release_merge_freeze_if_safe(instance.repo)
+        # Otherwise, this Release might have been moved from an in-scope release cohort to an
+        # out-of-scope Release Cohort or None. The update checks whether the repo is also
+        # included in a different Release that is in scope before lifting merge freeze.
+        queue_merge_freeze_update([instance.repo_id])
 
 
 @receiver(post_delete, sender=Release)
@@ -119,4 +250,4 @@ def react_to_release_deletion(instance: Release, **kwargs):
     # We don't know if this repo is also included in a different Release that might be in scope, so we can't
     # safely lift merge freeze until we check.
 
-    release_merge_freeze_if_safe(instance.repo)
+    queue_merge_freeze_update([instance.repo_id])
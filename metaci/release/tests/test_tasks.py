@@ -1,6 +1,7 @@
 import unittest
 from datetime import datetime, timedelta, timezone
 
+import django_rq
 import pytest
 from django.conf import settings
 from django.urls.base import reverse
@@ -10,11 +11,16 @@ from metaci.fixtures.factories import (
     ReleaseFactory,
     RepositoryFactory,
 )
+from metaci.release.models import ReleaseCohort
 from metaci.release.tasks import (
+    MERGE_FREEZE_PENDING_KEY,
     _update_release_cohorts,
+    queue_merge_freeze_update,
     release_merge_freeze_if_safe,
     set_merge_freeze_status,
+    update_merge_freeze_statuses,
 )
+from metaci.repository.models import Repository
 
 
 @pytest.mark.django_db
@@ -74,12 +80,12 @@ def test_set_merge_freeze_status__off():
     )
 
 
-@unittest.mock.patch("metaci.release.tasks.release_merge_freeze_if_safe")
-@unittest.mock.patch("metaci.release.tasks.set_merge_freeze_status")
+@unittest.mock.patch("metaci.release.tasks.queue_merge_freeze_update")
 @pytest.mark.django_db
-def test_react_to_release_cohort_change__activate(smfs_mock, rmfs_mock):
+def test_react_to_release_cohort_change__activate(queue_mock):
     cohort = ReleaseCohortFactory()
     release = ReleaseFactory(repo=RepositoryFactory())
+    other_release = ReleaseFactory(repo=release.repo, release_cohort=cohort)
     release.release_cohort = cohort
     release.save()
 
@@ -87,13 +93,12 @@ def test_react_to_release_cohort_change__activate(smfs_mock, rmfs_mock):
     cohort.merge_freeze_start = datetime.now(tz=timezone.utc) - timedelta(days=1)
     cohort.save()
 
-    smfs_mock.assert_called_once_with(release.repo, freeze=True)
+    assert set(queue_mock.call_args[0][0]) == {release.repo_id, other_release.repo_id}
 
 
-@unittest.mock.patch("metaci.release.tasks.release_merge_freeze_if_safe")
-@unittest.mock.patch("metaci.release.tasks.set_merge_freeze_status")
+@unittest.mock.patch("metaci.release.tasks.queue_merge_freeze_update")
 @pytest.mark.django_db
-def test_react_to_release_cohort_change__deactivate(smfs_mock, rmfs_mock):
+def test_react_to_release_cohort_change__deactivate(queue_mock):
     cohort = ReleaseCohortFactory()
     release = ReleaseFactory(repo=RepositoryFactory())
     release.release_cohort = cohort
@@ -102,26 +107,121 @@ def test_react_to_release_cohort_change__deactivate(smfs_mock, rmfs_mock):
     cohort.merge_freeze_start = datetime.now(tz=timezone.utc) - timedelta(days=1)
     cohort.save()
 
-    rmfs_mock.reset_mock()  # Called once on initial add to cohort.
+    queue_mock.reset_mock()
 
     cohort.status = "Canceled"
     cohort.save()
 
-    # Note: set_merge_freeze_status() will also be called once,
-    # when the release is associated with the cohort,
-    # but that's not under test here.
-    rmfs_mock.assert_called_once_with(release.repo)
+    queue_mock.assert_called_once()
+    assert list(queue_mock.call_args[0][0]) == [release.repo_id]
 
 
+@unittest.mock.patch("metaci.release.tasks.queue_merge_freeze_update")
 @pytest.mark.django_db
-@unittest.mock.patch("metaci.release.tasks.release_merge_freeze_if_safe")
-@unittest.mock.patch("metaci.release.tasks.set_merge_freeze_status")
-def test_react_to_release_deletion(smfs_mock, rmfs_mock):
+def test_react_to_release_change__created(queue_mock):
+    ReleaseFactory(repo=RepositoryFactory())
+
+    queue_mock.assert_not_called()
+
+
+@pytest.mark.django_db
+@unittest.mock.patch("metaci.release.tasks.queue_merge_freeze_update")
+def test_react_to_release_deletion(queue_mock):
     cohort = ReleaseCohortFactory()
     release = ReleaseFactory(repo=RepositoryFactory(), release_cohort=cohort)
+    queue_mock.reset_mock()
 
     release.delete()
-    rmfs_mock.assert_called_once_with(release.repo)
+    queue_mock.assert_called_once_with([release.repo_id])
+
+
+@unittest.mock.patch("metaci.release.tasks.update_merge_freeze_statuses")
+@pytest.mark.django_db
+def test_queue_merge_freeze_update(job_mock, django_capture_on_commit_callbacks):
+    connection = django_rq.get_connection("short")
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            queue_merge_freeze_update([1, 2])
+            queue_merge_freeze_update([2, 3])
+            job_mock.delay.assert_not_called()
+
+        assert connection.smembers(MERGE_FREEZE_PENDING_KEY) == {b"1", b"2", b"3"}
+        job_mock.delay.assert_called_once_with()
+    finally:
+        clear_merge_freeze_queue(connection)
+
+
+def clear_merge_freeze_queue(connection):
+    # The update job is mocked, so nothing else clears the queue
+    connection.delete(
+        MERGE_FREEZE_PENDING_KEY,
+        "metaci:merge_freeze:scheduled",
+        "metaci:merge_freeze:retry",
+    )
+
+
+@pytest.mark.django_db
+def test_update_merge_freeze_statuses(mocker):
+    cohort = ReleaseCohortFactory()
+    frozen = ReleaseFactory(repo=RepositoryFactory(), release_cohort=cohort)
+    released = ReleaseFactory(repo=RepositoryFactory())
+    ReleaseCohort.objects.filter(id=cohort.id).update(status="Active")
+    github_repos = {}
+
+    def get_github_api(repo):
+        github_repo = github_repos.setdefault(repo.id, unittest.mock.Mock())
+        github_repo.pull_requests.return_value = [unittest.mock.Mock()] * 2
+        return github_repo
+
+    mocker.patch.object(Repository, "get_github_api", get_github_api)
+    connection = django_rq.get_connection("short")
+    connection.sadd(MERGE_FREEZE_PENDING_KEY, frozen.repo_id, released.repo_id)
+    try:
+        result = update_merge_freeze_statuses()
+    finally:
+        clear_merge_freeze_queue(connection)
+
+    assert result == "Updated 4 merge freeze statuses in 2 repositories."
+    for call in github_repos[frozen.repo_id].create_status.call_args_list:
+        assert call.kwargs["state"] == "error"
+    for call in github_repos[released.repo_id].create_status.call_args_list:
+        assert call.kwargs["state"] == "success"
+    assert not connection.smembers(MERGE_FREEZE_PENDING_KEY)
+
+
+@pytest.mark.django_db
+def test_update_merge_freeze_statuses__errors(mocker):
+    listed = RepositoryFactory()
+    unlisted = RepositoryFactory()
+    failing = RepositoryFactory()
+
+    def get_github_api(repo):
+        if repo.id == unlisted.id:
+            raise Exception("Not Found")
+        github_repo = unittest.mock.Mock()
+        github_repo.pull_requests.return_value = [unittest.mock.Mock()]
+        if repo.id == failing.id:
+            github_repo.create_status.side_effect = Exception("Server Error")
+        return github_repo
+
+    mocker.patch.object(Repository, "get_github_api", get_github_api)
+    get_scheduler = mocker.patch("django_rq.get_scheduler")
+    connection = django_rq.get_connection("short")
+    connection.sadd(MERGE_FREEZE_PENDING_KEY, listed.id, unlisted.id, failing.id)
+    try:
+        result = update_merge_freeze_statuses()
+        pending = connection.smembers(MERGE_FREEZE_PENDING_KEY)
+    finally:
+        clear_merge_freeze_queue(connection)
+
+    assert result == (
+        "Updated 1 merge freeze statuses in 3 repositories. "
+        "2 repositories failed and will be retried."
+    )
+    assert pending == {str(unlisted.id).encode(), str(failing.id).encode()}
+    get_scheduler.return_value.enqueue_in.assert_called_once_with(
+        timedelta(seconds=60), update_merge_freeze_statuses
+    )
 
 
 @unittest.mock.patch("metaci.release.tasks.set_merge_freeze_status")
@@ -132,7 +232,7 @@ def test_release_merge_freeze_if_safe__not_safe(smfs_mock):
     cohort.status = "Active"
     cohort.merge_freeze_start = datetime.now(tz=timezone.utc) - timedelta(days=1)
     cohort.save()
-    
+
     smfs_mock.reset_mock()
 
     release_merge_freeze_if_safe(release.repo)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from metaci.plan.models import PlanRepository
-from metaci.repository.models import Branch, Repository
+from metaci.repository.models import Branch, Repository, WebhookEvent
 
 
 @admin.register(Branch)
@@ -17,3 +17,17 @@ class PlanRepositoryInline(admin.TabularInline):
 class RepositoryAdmin(admin.ModelAdmin):
     list_display = ("name", "owner")
     inlines = [PlanRepositoryInline]
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = (
+        "delivery_id",
+        "event",
+        "status",
+        "attempts",
+        "time_received",
+        "time_processed",
+    )
+    list_filter = ("event", "status")
+    search_fields = ("delivery_id",)
@@ -0,0 +1,148 @@
+"""Process-wide GitHub API clients.
+
+Logging in as a GitHub app installation costs a request for a token, and
+fetching a repository costs another, so both are reused:
+
+- there is one client per repository when authenticating as a GitHub app,
+  or a single client otherwise, replaced shortly before its installation
+  token expires;
+- repositories are reused for METACI_GITHUB_REPOSITORY_CACHE_SECONDS;
+- each client keeps its connections alive, and GET requests are made
+  conditional on the ETag of the previous response for the same URL.
+  GitHub answers those with 304 Not Modified, which doesn't count
+  against the rate limit.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from cumulusci.core.github import get_github_api_for_repo, retries
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from metaci.cumulusci.keychain import GitHubSettingsKeychain
+
+TOKEN_EXPIRY_MARGIN = timedelta(minutes=5)
+
+
+class ETagCachingAdapter(HTTPAdapter):
+    """Make GET requests conditional and serve 304 responses from a cache."""
+
+    def __init__(self, size, **kwargs):
+        super().__init__(max_retries=retries, **kwargs)
+        self.size = size
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != "GET" or stream:
+            return super().send(request, stream=stream, **kwargs)
+
+        # The same URL serves different representations per media type
+        key = (request.url, request.headers.get("Accept"))
+        with self.lock:
+            cached = self.responses.get(key)
+            if cached is not None:
+                self.responses.move_to_end(key)
+        if cached is not None and "If-None-Match" not in request.headers:
+            request.headers["If-None-Match"] = cached.headers["ETag"]
+
+        response = super().send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            return self.replay(cached, request, response)
+        if response.status_code == 200 and "ETag" in response.headers:
+            self.store(key, response)
+        return response
+
+    def store(self, key, response):
+        cached = Response()
+        cached.status_code = response.status_code
+        cached.reason = response.reason
+        cached.headers = CaseInsensitiveDict(response.headers)
+        cached.encoding = response.encoding
+        cached.url = response.url
+        cached._content = response.content
+        with self.lock:
+            self.responses[key] = cached
+            self.responses.move_to_end(key)
+            while len(self.responses) > self.size:
+                self.responses.popitem(last=False)
+
+    def replay(self, cached, request, not_modified):
+        response = Response()
+        response.status_code = cached.status_code
+        response.reason = cached.reason
+        response.headers = CaseInsensitiveDict(cached.headers)
+        # Keep the rate limit headers up to date
+        response.headers.update(
+            (name, value)
+            for name, value in not_modified.headers.items()
+            if name.lower().startswith("x-ratelimit")
+        )
+        response.encoding = cached.encoding
+        response.url = cached.url
+        response._content = cached._content
+        response.request = request
+        response.connection = self
+        response.elapsed = not_modified.elapsed
+        return response
+
+
+class GitHubClient:
+    def __init__(self, gh):
+        self.gh = gh
+        self.repositories = {}
+
+    @property
+    def expired(self):
+        expires_at = getattr(self.gh.session.auth, "expires_at", None)
+        return expires_at is not None and (
+            timezone.now() + TOKEN_EXPIRY_MARGIN > expires_at
+        )
+
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_github_client(owner, name):
+    """Return a logged in github3 client which can access the repository."""
+    # GitHub app installations are looked up per repository
+    key = (owner, name) if os.environ.get("GITHUB_APP_ID") else None
+    with _lock:
+        client = _clients.get(key)
+        if client is None or client.expired:
+            gh = get_github_api_for_repo(GitHubSettingsKeychain(), owner, name)
+            adapter = ETagCachingAdapter(settings.METACI_GITHUB_ETAG_CACHE_SIZE)
+            gh.session.mount("http://", adapter)
+            gh.session.mount("https://", adapter)
+            client = _clients[key] = GitHubClient(gh)
+    return client
+
+
+def get_repository(owner, name):
+    """Return the github3 repository, reusing a recently fetched one."""
+    client = get_github_client(owner, name)
+    with _lock:
+        repository, expires = client.repositories.get((owner, name), (None, 0))
+    if repository is not None and expires > time.monotonic():
+        return repository
+
+    repository = client.gh.repository(owner, name)
+    with _lock:
+        client.repositories[(owner, name)] = (
+            repository,
+            time.monotonic() + settings.METACI_GITHUB_REPOSITORY_CACHE_SECONDS,
+        )
+    return repository
+
+
+def clear():
+    """Forget all clients, for example after changing credentials."""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,105 @@
+import hmac
+import json
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from metaci.repository.models import WebhookEvent
+
+
+def sign(body):
+    key = settings.GITHUB_WEBHOOK_SECRET
+    if isinstance(key, str):
+        key = key.encode()
+    return "sha1=" + hmac.new(key, msg=body, digestmod=sha1).hexdigest()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Posts stored GitHub webhook deliveries to a MetaCI instance, "
+        "for example to load test the webhook endpoint, and reports how "
+        "quickly they were answered. Don't point it at production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://localhost:8000/webhook/github/push",
+            help="Webhook URL of the instance to post to",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=100, help="Replay the last N deliveries"
+        )
+        parser.add_argument(
+            "--event", action="append", help="Only replay deliveries of this event"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=1, help="Deliveries posted at once"
+        )
+        parser.add_argument(
+            "--keep-delivery-ids",
+            action="store_true",
+            help="Post with the original delivery ids, so an instance which "
+            "has received them already turns them away",
+        )
+
+    def handle(self, *args, **options):
+        events = WebhookEvent.objects.order_by("-time_received")
+        if options["event"]:
+            events = events.filter(event__in=options["event"])
+        events = list(events[: options["limit"]])[::-1]
+        if not events:
+            raise CommandError("There are no webhook deliveries to replay")
+
+        def post(event):
+            body = json.dumps(event.payload).encode()
+            delivery_id = (
+                event.delivery_id if options["keep_delivery_ids"] else uuid.uuid4()
+            )
+            start = time.monotonic()
+            try:
+                response = requests.post(
+                    options["url"],
+                    data=body,
+                    headers={
+                        "Content-Type": "application/json",
+                        "X-GitHub-Event": event.event,
+                        "X-GitHub-Delivery": str(delivery_id),
+                        "X-Hub-Signature": sign(body),
+                    },
+                    timeout=30,
+                )
+            except requests.RequestException as e:
+                return e.__class__.__name__, time.monotonic() - start
+            return response.status_code, time.monotonic() - start
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(post, events))
+        elapsed = max(time.monotonic() - start, 0.001)
+
+        statuses = Counter(status for status, _ in results)
+        durations = [duration for _, duration in results]
+        self.stdout.write(
+            f"Replayed {len(results)} deliveries in {elapsed:.2f}s "
+            f"({len(results) / elapsed:.1f}/s)"
+        )
+        for status, count in sorted(statuses.items(), key=str):
+            self.stdout.write(f"  {status}: {count}")
+        self.stdout.write(
+            "Response times: "
+            f"p50 {percentile(durations, 50) * 1000:.0f}ms, "
+            f"p95 {percentile(durations, 95) * 1000:.0f}ms, "
+            f"max {max(durations) * 1000:.0f}ms"
+        )
@@ -0,0 +1,54 @@
+import json
+from io import StringIO
+from unittest import mock
+
+import pytest
+import requests
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from metaci.repository.management.commands.replay_webhooks import sign
+from metaci.repository.models import WebhookEvent
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.repository.management.commands.replay_webhooks.requests.post")
+def test_replay_webhooks(post, settings):
+    settings.GITHUB_WEBHOOK_SECRET = "secret"
+    post.side_effect = [mock.Mock(status_code=202), requests.ConnectionError()]
+    for delivery_id, event in (("1", "push"), ("2", "status"), ("3", "delete")):
+        WebhookEvent.objects.create(
+            delivery_id=delivery_id, event=event, payload={"ref": delivery_id}
+        )
+    out = StringIO()
+
+    call_command("replay_webhooks", event=["push", "status"], stdout=out)
+
+    assert post.call_count == 2
+    (url,) = post.call_args_list[0][0]
+    kwargs = post.call_args_list[0][1]
+    assert url == "http://localhost:8000/webhook/github/push"
+    assert json.loads(kwargs["data"]) == {"ref": "1"}
+    assert kwargs["headers"]["X-GitHub-Event"] == "push"
+    assert kwargs["headers"]["X-GitHub-Delivery"] != "1"
+    assert kwargs["headers"]["X-Hub-Signature"] == sign(kwargs["data"])
+    assert "Replayed 2 deliveries" in out.getvalue()
+    assert "202: 1" in out.getvalue()
+    assert "ConnectionError: 1" in out.getvalue()
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.repository.management.commands.replay_webhooks.requests.post")
+def test_replay_webhooks__keep_delivery_ids(post):
+    post.return_value = mock.Mock(status_code=202)
+    WebhookEvent.objects.create(delivery_id="1", event="push", payload={})
+
+    call_command("replay_webhooks", keep_delivery_ids=True, stdout=StringIO())
+
+    assert post.call_args[1]["headers"]["X-GitHub-Delivery"] == "1"
+
+
+@pytest.mark.django_db
+def test_replay_webhooks__none():
+    with pytest.raises(CommandError):
+        call_command("replay_webhooks")
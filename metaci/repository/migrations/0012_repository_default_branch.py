@@ -0,0 +1,18 @@
+# Generated by Django 3.2.13 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("repository", "0011_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="repository",
+            name="default_branch",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
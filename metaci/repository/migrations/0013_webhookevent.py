@@ -0,0 +1,52 @@
+# Generated by Django 3.2.13 on 2026-10-19 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("repository", "0012_repository_default_branch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebhookEvent",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("delivery_id", models.CharField(max_length=255, unique=True)),
+                ("event", models.CharField(max_length=255)),
+                ("payload", models.JSONField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("processing", "Processing"),
+                            ("processed", "Processed"),
+                            ("error", "Error"),
+                        ],
+                        default="queued",
+                        max_length=16,
+                    ),
+                ),
+                ("result", models.TextField(blank=True, null=True)),
+                (
+                    "time_received",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                ("time_processed", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-time_received"],
+            },
+        ),
+    ]
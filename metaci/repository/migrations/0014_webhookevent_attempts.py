@@ -0,0 +1,23 @@
+# Generated by Django 3.2.13 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("repository", "0013_webhookevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhookevent",
+            name="attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="webhookevent",
+            name="time_claimed",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,5 @@
 import github3.exceptions
 from cumulusci.core.exceptions import GithubException
-from cumulusci.core.github import get_github_api_for_repo
 from django.apps import apps
 from django.db import models
 from django.http import Http404
@@ -8,7 +7,7 @@ from django.urls import reverse
 from model_utils.managers import SoftDeletableManager
 from model_utils.models import SoftDeletableModel
 
-from metaci.cumulusci.keychain import GitHubSettingsKeychain
+from metaci.repository.github import get_repository
 
 
 class RepositoryQuerySet(models.QuerySet):
@@ -37,6 +36,8 @@ class Repository(models.Model):
     release_tag_regex = models.CharField(max_length=255, blank=True, null=True)
     default_implementation_steps = models.JSONField(null=True, blank=True, default=list)
     metadata = models.JSONField(null=True, blank=True, default=dict)
+    # Kept up to date by webhooks and the sync_branches job
+    default_branch = models.CharField(max_length=255, blank=True, null=True)
 
     objects = RepositoryQuerySet.as_manager()
 
@@ -51,9 +52,29 @@ class Repository(models.Model):
         return f"{self.owner}/{self.name}"
 
     def get_github_api(self):
-        gh = get_github_api_for_repo(GitHubSettingsKeychain(), self.owner, self.name)
-        repo = gh.repository(self.owner, self.name)
-        return repo
+        return get_repository(self.owner, self.name)
+
+    def get_default_branch(self):
+        if not self.default_branch:
+            self.default_branch = self.get_github_api().default_branch
+            self.save(update_fields=["default_branch"])
+        return self.default_branch
+
+    def get_branch_head(self, branch_name):
+        """Return the sha of the commit at the HEAD of a branch or tag.
+
+        Looks up the git ref rather than the branch, which is cheaper and
+        answered from the client's ETag cache when it hasn't changed.
+        """
+        if branch_name.startswith("tag: "):
+            ref = f"tags/{branch_name[len('tag: '):]}"
+        else:
+            ref = f"heads/{branch_name}"
+        ref = self.get_github_api().ref(ref)
+        if ref.object.type == "tag":
+            # Annotated tags point at a tag object rather than the commit
+            return self.get_github_api().tag(ref.object.sha).object.sha
+        return ref.object.sha
 
     @property
     def latest_release(self):
@@ -105,3 +126,33 @@ class Branch(SoftDeletableModel):
         except (github3.exceptions.NotFoundError, GithubException):
             branch = None
         return branch
+
+
+WEBHOOK_EVENT_STATUSES = (
+    ("queued", "Queued"),
+    ("processing", "Processing"),
+    ("processed", "Processed"),
+    ("error", "Error"),
+)
+
+
+class WebhookEvent(models.Model):
+    """A GitHub webhook delivery, stored until a worker has processed it."""
+
+    delivery_id = models.CharField(max_length=255, unique=True)
+    event = models.CharField(max_length=255)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=16, choices=WEBHOOK_EVENT_STATUSES, default="queued"
+    )
+    result = models.TextField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    time_received = models.DateTimeField(auto_now_add=True, db_index=True)
+    time_claimed = models.DateTimeField(null=True, blank=True)
+    time_processed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-time_received"]
+
+    def __str__(self):
+        return f"{self.event} {self.delivery_id}"
@@ -1,20 +1,182 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
 from django import db
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from django_rq import job
 
-from metaci.repository.models import Branch
+from metaci.repository.models import Branch, Repository, WebhookEvent
 
+# Events which fail are tried again until they have been tried this often
+WEBHOOK_EVENT_MAX_ATTEMPTS = 3
+# Seconds after which an event is presumed lost, which is longer than the
+# timeout of the short queue's jobs
+WEBHOOK_EVENT_STALE_SECONDS = 10 * 60
 
-@job("short")
-def prune_branches():
+
+def reset_database_connection():
     db.connection.close()
-    pruned = []
-    for branch in Branch.objects.all():
-        if not branch.get_github_api():
-            branch.delete()
-            pruned.append(str(branch))
-    if pruned:
-        msg = "Pruned branches:\n"
-        msg += "\n".join(pruned)
-        return msg
-    else:
-        return "No branches pruned"
+
+
+def get_branch_name(ref):
+    """Return the MetaCI branch name for a git ref."""
+    if ref.startswith("refs/heads/"):
+        return ref[len("refs/heads/") :]
+    if ref.startswith("refs/tags/"):
+        return "tag: " + ref[len("refs/tags/") :]
+    return None
+
+
+def list_branches(repo):
+    """Return the default branch and the names of all branches and tags.
+
+    All refs are listed with one paginated request.
+    """
+    gh_repo = repo.get_github_api()
+    names = {get_branch_name(ref.ref) for ref in gh_repo.refs()}
+    names.discard(None)
+    return gh_repo.default_branch, names
+
+
+def sync_repo_branches(repo, default_branch, names):
+    """Diff the repository's branches with the refs on GitHub.
+
+    Branches which MetaCI hasn't seen yet are added and branches whose
+    ref was deleted are removed. Returns the numbers added and removed.
+    """
+    if repo.default_branch != default_branch:
+        repo.default_branch = default_branch
+        repo.save(update_fields=["default_branch"])
+
+    known = dict(
+        Branch.include_deleted.filter(repo=repo).values_list("name", "is_removed")
+    )
+    Branch.include_deleted.filter(
+        repo=repo,
+        name__in=[name for name in names if known.get(name)],
+    ).update(is_removed=False)
+    # Tags only become branches once they are built
+    added = [
+        Branch(repo=repo, name=name)
+        for name in names
+        if name not in known and not name.startswith("tag: ")
+    ]
+    Branch.objects.bulk_create(added)
+    # Soft delete, like Branch.delete()
+    removed = (
+        Branch.objects.filter(repo=repo).exclude(name__in=names).update(is_removed=True)
+    )
+    return len(added), removed
+
+
+@job("short")
+def sync_branches():
+    """Keep the Branch table in step with the refs on GitHub.
+
+    Webhooks add branches as they are pushed and remove them when they
+    are deleted; this catches up on any which were missed. The refs of
+    several repositories are listed at once.
+    """
+    reset_database_connection()
+    repos = list(Repository.objects.all())
+
+    def fetch(repo):
+        try:
+            return list_branches(repo)
+        except Exception as e:
+            return e
+
+    added = removed = 0
+    errors = []
+    with ThreadPoolExecutor(max_workers=settings.METACI_BRANCH_SYNC_WORKERS) as pool:
+        for repo, result in zip(repos, pool.map(fetch, repos)):
+            if isinstance(result, Exception):
+                errors.append(f"{repo}: {result}")
+                continue
+            repo_added, repo_removed = sync_repo_branches(repo, *result)
+            added += repo_added
+            removed += repo_removed
+    msg = f"Added {added} branches and pruned {removed} branches"
+    if errors:
+        msg += "\nCould not list the refs of:\n" + "\n".join(errors)
+    return msg
+
+
+def get_claimable_events():
+    """Return the webhook events which a worker may start processing.
+
+    These are the queued events, the failed events which have attempts
+    left, and events whose worker died while processing them.
+    """
+    stale = timezone.now() - timedelta(seconds=WEBHOOK_EVENT_STALE_SECONDS)
+    return WebhookEvent.objects.filter(
+        Q(status="queued")
+        | Q(status="error", attempts__lt=WEBHOOK_EVENT_MAX_ATTEMPTS)
+        | Q(status="processing", time_claimed__lt=stale)
+    )
+
+
+@job("short")
+def process_webhook_event(event_id):
+    """Process a stored webhook event, unless a worker has claimed it already."""
+    from metaci.repository.views import handle_github_event
+
+    reset_database_connection()
+    claimed = (
+        get_claimable_events()
+        .filter(id=event_id)
+        .update(
+            status="processing",
+            attempts=F("attempts") + 1,
+            time_claimed=timezone.now(),
+        )
+    )
+    if not claimed:
+        return f"Webhook event #{event_id} was already processed"
+
+    webhook_event = WebhookEvent.objects.get(id=event_id)
+    try:
+        # The event's changes are kept only if it is marked processed, so
+        # that an event which is tried again doesn't repeat them
+        with transaction.atomic():
+            webhook_event.result = handle_github_event(
+                webhook_event.event,
+                webhook_event.payload,
+                time_received=webhook_event.time_received,
+            )
+            webhook_event.status = "processed"
+            webhook_event.time_processed = timezone.now()
+            webhook_event.save()
+    except Exception:
+        webhook_event.status = "error"
+        webhook_event.result = traceback.format_exc()
+        webhook_event.time_processed = timezone.now()
+        webhook_event.save()
+        raise
+    return webhook_event.result
+
+
+@job("short")
+def requeue_webhook_events():
+    """Queue the webhook events which were lost or failed again.
+
+    An event is lost when its job never ran, for example because Redis
+    was flushed, or when the worker processing it died. Only events
+    received some time ago are queued, so that recent events whose job
+    is still waiting in the queue aren't queued twice.
+    """
+    reset_database_connection()
+    received = timezone.now() - timedelta(seconds=WEBHOOK_EVENT_STALE_SECONDS)
+    event_ids = list(
+        get_claimable_events()
+        .filter(time_received__lt=received)
+        .order_by("time_received")
+        .values_list("id", flat=True)
+    )
+    for event_id in event_ids:
+        process_webhook_event.delay(event_id)
+    return f"Queued {len(event_ids)} webhook events again"
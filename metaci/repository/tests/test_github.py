@@ -0,0 +1,144 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+import requests
+import responses
+from django.test import override_settings
+from django.utils import timezone
+
+from metaci.repository import github
+from metaci.repository.github import (
+    ETagCachingAdapter,
+    get_github_client,
+    get_repository,
+)
+
+URL = "https://api.github.com/repos/SFDO-Tooling/MetaCI"
+
+
+@pytest.fixture(autouse=True)
+def clear_clients():
+    github.clear()
+    yield
+    github.clear()
+
+
+@pytest.fixture
+def session():
+    session = requests.Session()
+    session.mount("https://", ETagCachingAdapter(size=2))
+    return session
+
+
+class TestETagCachingAdapter:
+    @responses.activate
+    def test_not_modified(self, session):
+        responses.add("GET", URL, json={"name": "MetaCI"}, headers={"ETag": '"abc"'})
+        responses.add("GET", URL, status=304, headers={"X-RateLimit-Remaining": "4999"})
+
+        session.get(URL)
+        response = session.get(URL)
+
+        assert responses.calls[1].request.headers["If-None-Match"] == '"abc"'
+        assert response.status_code == 200
+        assert response.json() == {"name": "MetaCI"}
+        assert response.headers["X-RateLimit-Remaining"] == "4999"
+
+    @responses.activate
+    def test_modified(self, session):
+        responses.add("GET", URL, json={"name": "MetaCI"}, headers={"ETag": '"abc"'})
+        responses.add("GET", URL, json={"name": "MetaDeploy"}, headers={"ETag": '"d"'})
+
+        session.get(URL)
+        response = session.get(URL)
+
+        assert response.json() == {"name": "MetaDeploy"}
+        cached = session.get_adapter(URL).responses[(URL, "*/*")]
+        assert cached.headers["ETag"] == '"d"'
+
+    @responses.activate
+    def test_accept(self, session):
+        raw = "application/vnd.github.raw"
+        responses.add("GET", URL, json={"name": "MetaCI"}, headers={"ETag": '"abc"'})
+        responses.add("GET", URL, body="MetaCI", headers={"ETag": '"raw"'})
+
+        session.get(URL)
+        response = session.get(URL, headers={"Accept": raw})
+
+        assert "If-None-Match" not in responses.calls[1].request.headers
+        assert response.text == "MetaCI"
+        assert list(session.get_adapter(URL).responses) == [(URL, "*/*"), (URL, raw)]
+
+    @responses.activate
+    def test_size(self, session):
+        for i in range(3):
+            responses.add("GET", f"{URL}/{i}", json={}, headers={"ETag": f'"{i}"'})
+            session.get(f"{URL}/{i}")
+
+        assert list(session.get_adapter(URL).responses) == [
+            (f"{URL}/1", "*/*"),
+            (f"{URL}/2", "*/*"),
+        ]
+
+    @responses.activate
+    def test_not_get(self, session):
+        responses.add("POST", URL, json={}, headers={"ETag": '"abc"'})
+
+        session.post(URL)
+
+        assert not session.get_adapter(URL).responses
+
+
+@mock.patch("metaci.repository.github.get_github_api_for_repo")
+class TestClients:
+    def test_get_github_client__shared(self, get_github_api_for_repo):
+        get_github_api_for_repo.return_value.session.auth = None
+
+        client = get_github_client("SFDO-Tooling", "MetaCI")
+
+        assert get_github_client("SFDO-Tooling", "CumulusCI") is client
+        get_github_api_for_repo.assert_called_once()
+        client.gh.session.mount.assert_any_call("https://", mock.ANY)
+
+    @mock.patch.dict("os.environ", {"GITHUB_APP_ID": "1"})
+    def test_get_github_client__app(self, get_github_api_for_repo):
+        get_github_api_for_repo.return_value.session.auth.expires_at = (
+            timezone.now() + timedelta(hours=1)
+        )
+
+        client = get_github_client("SFDO-Tooling", "MetaCI")
+
+        assert get_github_client("SFDO-Tooling", "MetaCI") is client
+        get_github_client("SFDO-Tooling", "CumulusCI")
+        assert get_github_api_for_repo.call_count == 2
+
+    @mock.patch.dict("os.environ", {"GITHUB_APP_ID": "1"})
+    def test_get_github_client__token_expiring(self, get_github_api_for_repo):
+        get_github_api_for_repo.return_value.session.auth.expires_at = (
+            timezone.now() + timedelta(minutes=1)
+        )
+
+        get_github_client("SFDO-Tooling", "MetaCI")
+        get_github_client("SFDO-Tooling", "MetaCI")
+
+        assert get_github_api_for_repo.call_count == 2
+
+    def test_get_repository(self, get_github_api_for_repo):
+        gh = get_github_api_for_repo.return_value
+        gh.session.auth = None
+
+        repository = get_repository("SFDO-Tooling", "MetaCI")
+
+        assert get_repository("SFDO-Tooling", "MetaCI") is repository
+        gh.repository.assert_called_once_with("SFDO-Tooling", "MetaCI")
+
+    @override_settings(METACI_GITHUB_REPOSITORY_CACHE_SECONDS=0)
+    def test_get_repository__expired(self, get_github_api_for_repo):
+        gh = get_github_api_for_repo.return_value
+        gh.session.auth = None
+
+        get_repository("SFDO-Tooling", "MetaCI")
+        get_repository("SFDO-Tooling", "MetaCI")
+
+        assert gh.repository.call_count == 2
@@ -4,6 +4,7 @@ import github3.exceptions
 import pytest
 
 from metaci.fixtures.factories import BranchFactory, RepositoryFactory
+from metaci.repository.models import Repository
 
 
 @pytest.mark.django_db
@@ -42,3 +43,39 @@ def test_branch_get_github_api__normal():
     mock_gh.return_value.branch.return_value = mock_branch_api = object()
     branch.repo.get_github_api = mock_gh
     assert branch.get_github_api() is mock_branch_api
+
+
+@pytest.mark.django_db
+def test_repository_get_default_branch():
+    repo = RepositoryFactory()
+    repo.get_github_api = mock.Mock()
+    repo.get_github_api.return_value.default_branch = "main"
+
+    assert repo.get_default_branch() == "main"
+    assert repo.get_default_branch() == "main"
+
+    repo.get_github_api.assert_called_once()
+    repo.refresh_from_db()
+    assert repo.default_branch == "main"
+
+
+def test_repository_get_branch_head():
+    repo = Repository(owner="SFDO-Tooling", name="MetaCI")
+    repo.get_github_api = mock.Mock()
+    gh_repo = repo.get_github_api.return_value
+    gh_repo.ref.return_value.object = mock.Mock(type="commit", sha="abc123")
+
+    assert repo.get_branch_head("feature/test") == "abc123"
+    gh_repo.ref.assert_called_once_with("heads/feature/test")
+
+
+def test_repository_get_branch_head__annotated_tag():
+    repo = Repository(owner="SFDO-Tooling", name="MetaCI")
+    repo.get_github_api = mock.Mock()
+    gh_repo = repo.get_github_api.return_value
+    gh_repo.ref.return_value.object = mock.Mock(type="tag", sha="tag123")
+    gh_repo.tag.return_value.object.sha = "abc123"
+
+    assert repo.get_branch_head("tag: release/1.0") == "abc123"
+    gh_repo.ref.assert_called_once_with("tags/release/1.0")
+    gh_repo.tag.assert_called_once_with("tag123")
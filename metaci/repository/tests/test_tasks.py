@@ -0,0 +1,59 @@
+from unittest import mock
+
+import pytest
+
+from metaci.fixtures.factories import BranchFactory, RepositoryFactory
+from metaci.repository.models import Branch
+from metaci.repository.tasks import get_branch_name, sync_branches
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
+def test_sync_branches():
+    repo = RepositoryFactory()
+    BranchFactory(repo=repo, name="main")
+    BranchFactory(repo=repo, name="feature/deleted")
+    BranchFactory(repo=repo, name="tag: beta/1.0")
+    BranchFactory(repo=repo, name="feature/removed").delete()
+    broken = RepositoryFactory()
+    BranchFactory(repo=broken, name="feature/unknown")
+    gh_repo = mock.Mock(default_branch="main")
+    gh_repo.refs.return_value = [
+        mock.Mock(ref=ref)
+        for ref in (
+            "refs/heads/main",
+            "refs/heads/feature/removed",
+            "refs/heads/feature/new",
+            "refs/tags/beta/1.0",
+            "refs/tags/beta/1.1",
+            "refs/pull/1/head",
+        )
+    ]
+
+    def get_github_api(self):
+        if self == broken:
+            raise Exception("Not Found")
+        return gh_repo
+
+    with mock.patch(
+        "metaci.repository.models.Repository.get_github_api", get_github_api
+    ):
+        result = sync_branches()
+
+    assert result.startswith("Added 1 branches and pruned 1 branches")
+    assert f"{broken}: Not Found" in result
+    assert set(Branch.objects.filter(repo=repo).values_list("name", flat=True)) == {
+        "main",
+        "feature/removed",
+        "feature/new",
+        "tag: beta/1.0",
+    }
+    assert Branch.objects.filter(repo=broken).exists()
+    repo.refresh_from_db()
+    assert repo.default_branch == "main"
+
+
+def test_get_branch_name():
+    assert get_branch_name("refs/heads/feature/a") == "feature/a"
+    assert get_branch_name("refs/tags/beta/1.0") == "tag: beta/1.0"
+    assert get_branch_name("refs/pull/1/head") is None
@@ -4,7 +4,9 @@ from unittest import mock
 from unittest.mock import patch
 
 import pytest
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.db import IntegrityError
 from django.test import Client, TestCase
 from django.test.client import RequestFactory
 from django.urls import reverse
@@ -21,8 +23,14 @@ from metaci.conftest import (
     UserFactory,
 )
 from metaci.fixtures.factories import ReleaseCohortFactory
+from metaci.plan import triggers
 from metaci.repository import views
-from metaci.repository.models import Branch
+from metaci.repository.models import Branch, WebhookEvent
+from metaci.repository.tasks import (
+    WEBHOOK_EVENT_MAX_ATTEMPTS,
+    process_webhook_event,
+    requeue_webhook_events,
+)
 
 
 class TestRepositoryViews(TestCase):
@@ -41,6 +49,10 @@ class TestRepositoryViews(TestCase):
         cls.branch = BranchFactory(name="test-branch", repo=cls.repo)
         super(TestRepositoryViews, cls).setUpTestData()
 
+    def setUp(self):
+        # Plans saved by other tests are rolled back without invalidating it
+        triggers.invalidate()
+
     @pytest.mark.django_db
     def test_repo_list(self):
         self.client.force_login(self.superuser)
@@ -184,6 +196,24 @@ class TestRepositoryViews(TestCase):
         response = self.client.get(url)
         assert response.status_code == 200
 
+    @pytest.mark.django_db
+    def test_repo_branch_search(self):
+        BranchFactory(name="feature/typeahead", repo=self.repo)
+        BranchFactory(name="feature/other", repo=self.repo)
+        self.client.force_login(self.user)
+        url = reverse(
+            "repo_branch_search",
+            kwargs={"owner": self.repo.owner, "name": self.repo.name},
+        )
+
+        response = self.client.get(url, {"q": "TYPEAHEAD"})
+        assert response.status_code == 404  # no permissions
+
+        assign_perm("plan.view_builds", self.user, self.planrepo)
+
+        response = self.client.get(url, {"q": "TYPEAHEAD"})
+        assert response.json() == {"branches": ["feature/typeahead"]}
+
     @pytest.mark.django_db
     def test_commit_detail__as_superuser(self):
         self.client.force_login(self.superuser)
@@ -253,6 +283,7 @@ class TestRepositoryViews(TestCase):
         assert response.content == b"Not listening for this repository"
 
     @pytest.mark.django_db
+    @mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
     @mock.patch("metaci.repository.views.validate_github_webhook")
     def test_github_webhook__status_event(self, validate):
         self.plan.trigger = "status"
@@ -274,10 +305,24 @@ class TestRepositoryViews(TestCase):
             data=json.dumps(data),
             content_type="application/json",
             HTTP_X_GITHUB_EVENT="status",
+            HTTP_X_GITHUB_DELIVERY="72d3162e-cc78-11e3-81ab-4c9367dc0958",
         )
 
-        assert response.content == b"OK"
+        assert response.status_code == 202
+        assert response.content == b"Accepted"
+        assert not Build.objects.exists()
+
+        event = WebhookEvent.objects.get(
+            delivery_id="72d3162e-cc78-11e3-81ab-4c9367dc0958"
+        )
+        assert event.event == "status"
+        assert event.payload == data
+        assert process_webhook_event(event.id) == "OK"
         assert len(Build.objects.all()) == 1
+        event.refresh_from_db()
+        assert event.status == "processed"
+        assert event.result == "OK"
+        assert event.time_processed is not None
 
     @pytest.mark.django_db
     def test_handle_github_push_webhook__no_branch_found(self):
@@ -289,11 +334,11 @@ class TestRepositoryViews(TestCase):
         response = views.handle_github_push_or_status_webhook(
             "push", push_data, self.repo
         )
-        assert response.status_code == 200
-        assert response.content == b"No branch found"
+        assert response == "No branch found"
 
     # TODO: this test is essentially a no-op and should be revised.
     @pytest.mark.django_db
+    @mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
     @mock.patch("metaci.repository.views.validate_github_webhook")
     def test_github_webhook__with_tag(self, validate):
         self.client.force_login(self.user)
@@ -310,8 +355,8 @@ class TestRepositoryViews(TestCase):
             content_type="application/json",
             HTTP_X_GITHUB_EVENT="push",
         )
-        assert response.status_code == 200
-        assert response.content == b"OK"
+        assert response.status_code == 202
+        assert process_webhook_event(WebhookEvent.objects.get().id) == "OK"
 
     @pytest.mark.django_db
     def test_handle_github_push_webhook__with_branch(self):
@@ -325,7 +370,7 @@ class TestRepositoryViews(TestCase):
         response = views.handle_github_push_or_status_webhook(
             "push", push_data, self.repo
         )
-        assert response.content == b"OK"
+        assert response == "OK"
         assert Branch.objects.filter(name=branch_name).count() == 1
 
     @pytest.mark.django_db
@@ -344,7 +389,7 @@ class TestRepositoryViews(TestCase):
             response = views.handle_github_pr_webhook(
                 "pull_request", payload, self.repo
             )
-            assert response.content == b"OK"
+            assert response == "OK"
             smfsc_mock.assert_called_once_with(
                 api.return_value, "abcdef123", freeze=False
             )
@@ -375,16 +420,13 @@ class TestRepositoryViews(TestCase):
             response = views.handle_github_pr_webhook(
                 "pull_request", payload, self.repo
             )
-            assert response.content == b"OK"
+            assert response == "OK"
             smfsc_mock.assert_called_once_with(
                 api.return_value, "abcdef123", freeze=True
             )
 
     @pytest.mark.django_db
-    @mock.patch("metaci.repository.views.validate_github_webhook")
-    def test_github_webhook(self, validate):
-        self.client.force_login(self.user)
-        url = reverse("github_webhook")
+    def test_handle_github_event(self):
         push_data = {
             "repository": {"id": self.repo.github_id},
             "ref": "refs/tags/beta",
@@ -396,39 +438,238 @@ class TestRepositoryViews(TestCase):
             "handle_github_push_or_status_webhook",
             wraps=views.handle_github_push_or_status_webhook,
         ) as handler_mock:
-            self.client.post(
-                url,
-                data=json.dumps(push_data),
-                content_type="application/json",
-                HTTP_X_GITHUB_EVENT="push",
-            )
-            handler_mock.assert_called_once_with("push", push_data, self.repo)
+            views.handle_github_event("push", push_data)
+            handler_mock.assert_called_once_with("push", push_data, self.repo, None)
 
         with patch.object(
             views,
             "handle_github_push_or_status_webhook",
             wraps=views.handle_github_push_or_status_webhook,
         ) as handler_mock:
-            self.client.post(
-                url,
-                data=json.dumps(push_data),
-                content_type="application/json",
-                HTTP_X_GITHUB_EVENT="status",
-            )
-            handler_mock.assert_called_once_with("status", push_data, self.repo)
+            views.handle_github_event("status", push_data)
+            handler_mock.assert_called_once_with("status", push_data, self.repo, None)
 
         with patch.object(
             views,
             "handle_github_pr_webhook",
             wraps=views.handle_github_push_or_status_webhook,
         ) as handler_mock:
-            self.client.post(
+            views.handle_github_event("pull_request", push_data)
+            handler_mock.assert_called_once_with("pull_request", push_data, self.repo)
+
+        assert views.handle_github_event("fork", push_data) == "Unrecognized event"
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.views.validate_github_webhook")
+    def test_github_webhook__duplicate_delivery(self, validate):
+        url = reverse("github_webhook")
+        data = {"repository": {"id": self.repo.github_id}, "ref": "test-branch"}
+
+        def post():
+            return self.client.post(
                 url,
-                data=json.dumps(push_data),
+                data=json.dumps(data),
                 content_type="application/json",
-                HTTP_X_GITHUB_EVENT="pull_request",
+                HTTP_X_GITHUB_EVENT="delete",
+                HTTP_X_GITHUB_DELIVERY="0b989ba4-242f-11e5-81e1-c7b6966d2516",
             )
-            handler_mock.assert_called_once_with("pull_request", push_data, self.repo)
+
+        with mock.patch(
+            "metaci.repository.tasks.process_webhook_event.delay"
+        ) as delay, self.captureOnCommitCallbacks(execute=True):
+            assert post().content == b"Accepted"
+            response = post()
+            assert response.status_code == 202
+            assert response.content == b"Already received"
+        event = WebhookEvent.objects.get()
+        delay.assert_called_once_with(event.id)
+
+        # Once committed, redeliveries are turned away by the cache
+        try:
+            with mock.patch("metaci.repository.views.WebhookEvent") as model:
+                response = post()
+            assert response.content == b"Already received"
+            model.objects.get_or_create.assert_not_called()
+        finally:
+            cache.delete(
+                "metaci:webhooks:delivery:0b989ba4-242f-11e5-81e1-c7b6966d2516"
+            )
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
+    def test_process_webhook_event__once(self):
+        event = WebhookEvent.objects.create(
+            delivery_id="72d3162e-cc78-11e3-81ab-4c9367dc0958",
+            event="delete",
+            payload={
+                "repository": {"id": self.repo.github_id},
+                "ref": "test-branch",
+                "ref_type": "branch",
+            },
+        )
+
+        assert process_webhook_event(event.id) == "Pruned branch"
+        assert process_webhook_event(event.id) == (
+            f"Webhook event #{event.id} was already processed"
+        )
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
+    @mock.patch("metaci.repository.views.handle_github_event")
+    def test_process_webhook_event__error(self, handle_github_event):
+        handle_github_event.side_effect = Exception("Oops")
+        event = WebhookEvent.objects.create(
+            delivery_id="72d3162e-cc78-11e3-81ab-4c9367dc0958",
+            event="push",
+            payload={},
+        )
+
+        with pytest.raises(Exception):
+            process_webhook_event(event.id)
+
+        event.refresh_from_db()
+        assert event.status == "error"
+        assert "Oops" in event.result
+
+        # Failed events are tried again until they run out of attempts
+        handle_github_event.side_effect = None
+        handle_github_event.return_value = "OK"
+        assert process_webhook_event(event.id) == "OK"
+        event.refresh_from_db()
+        assert event.status == "processed"
+        assert event.attempts == 2
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
+    @mock.patch("metaci.repository.views.handle_github_event")
+    def test_process_webhook_event__rolls_back(self, handle_github_event):
+        def handle(*args, **kwargs):
+            BranchFactory(name="feature/partial", repo=self.repo)
+            raise Exception("Oops")
+
+        handle_github_event.side_effect = handle
+        event = WebhookEvent.objects.create(
+            delivery_id="72d3162e-cc78-11e3-81ab-4c9367dc0958",
+            event="push",
+            payload={},
+        )
+
+        with pytest.raises(Exception):
+            process_webhook_event(event.id)
+
+        assert not Branch.objects.filter(name="feature/partial").exists()
+        event.refresh_from_db()
+        assert event.status == "error"
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
+    @mock.patch("metaci.repository.views.handle_github_event")
+    def test_process_webhook_event__out_of_attempts(self, handle_github_event):
+        event = WebhookEvent.objects.create(
+            delivery_id="72d3162e-cc78-11e3-81ab-4c9367dc0958",
+            event="push",
+            payload={},
+            status="error",
+            attempts=WEBHOOK_EVENT_MAX_ATTEMPTS,
+        )
+
+        assert process_webhook_event(event.id) == (
+            f"Webhook event #{event.id} was already processed"
+        )
+        handle_github_event.assert_not_called()
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.tasks.reset_database_connection", lambda: None)
+    @mock.patch("metaci.repository.tasks.process_webhook_event.delay")
+    def test_requeue_webhook_events(self, delay):
+        def webhook_event(status, minutes_ago, **kwargs):
+            event = WebhookEvent.objects.create(
+                delivery_id=f"{status}-{minutes_ago}",
+                event="push",
+                payload={},
+                status=status,
+                **kwargs,
+            )
+            WebhookEvent.objects.filter(id=event.id).update(
+                time_received=datetime.now(timezone.utc)
+                - timedelta(minutes=minutes_ago)
+            )
+            return event
+
+        lost = webhook_event("queued", 15)
+        failed = webhook_event("error", 30, attempts=1)
+        died = webhook_event(
+            "processing",
+            60,
+            time_claimed=datetime.now(timezone.utc) - timedelta(minutes=20),
+        )
+        webhook_event("queued", 1)
+        webhook_event("processing", 20, time_claimed=datetime.now(timezone.utc))
+        webhook_event("error", 20, attempts=WEBHOOK_EVENT_MAX_ATTEMPTS)
+        webhook_event("processed", 20)
+
+        assert requeue_webhook_events() == "Queued 3 webhook events again"
+        assert delay.call_args_list == [
+            mock.call(died.id),
+            mock.call(failed.id),
+            mock.call(lost.id),
+        ]
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.views.validate_github_webhook")
+    def test_github_webhook__concurrent_delivery(self, validate):
+        with mock.patch(
+            "metaci.repository.views.WebhookEvent.objects.get_or_create"
+        ) as get_or_create:
+            get_or_create.side_effect = IntegrityError
+            response = self.client.post(
+                reverse("github_webhook"),
+                data=json.dumps({"repository": {"id": self.repo.github_id}}),
+                content_type="application/json",
+                HTTP_X_GITHUB_EVENT="push",
+                HTTP_X_GITHUB_DELIVERY="0b989ba4-242f-11e5-81e1-c7b6966d2516",
+            )
+
+        assert response.status_code == 200
+        assert response.content == b"Already received"
+
+    @pytest.mark.django_db
+    def test_handle_github_delete_webhook(self):
+        BranchFactory(name="tag: beta/1.0", repo=self.repo)
+        data = {
+            "repository": {"id": self.repo.github_id},
+            "ref": "test-branch",
+            "ref_type": "branch",
+        }
+
+        response = views.handle_github_delete_webhook(data, self.repo)
+        assert response == "Pruned branch"
+        assert not Branch.objects.filter(repo=self.repo, name="test-branch").exists()
+        assert Branch.include_deleted.filter(
+            repo=self.repo, name="test-branch"
+        ).exists()
+
+        data.update(ref="beta/1.0", ref_type="tag")
+        response = views.handle_github_delete_webhook(data, self.repo)
+        assert response == "Pruned branch"
+        assert not Branch.objects.filter(repo=self.repo).exists()
+
+    @pytest.mark.django_db
+    def test_handle_github_delete_webhook__no_branch(self):
+        response = views.handle_github_delete_webhook(
+            {"ref": "unknown", "ref_type": "branch"}, self.repo
+        )
+        assert response == "No branch found"
+
+    @pytest.mark.django_db
+    def test_update_default_branch(self):
+        views.update_default_branch(
+            {"repository": {"id": self.repo.github_id, "default_branch": "main"}},
+            self.repo,
+        )
+
+        self.repo.refresh_from_db()
+        assert self.repo.default_branch == "main"
 
     @pytest.mark.django_db
     def test_get_repository(self):
@@ -518,3 +759,56 @@ class TestRepositoryViews(TestCase):
         builds_before = len(Build.objects.all())
         views.create_builds("push", None, self.repo, self.branch, None)
         assert builds_before == len(Build.objects.all())
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.build.handlers.statuses.request_many")
+    @mock.patch("metaci.build.handlers.django_rq.get_queue")
+    def test_create_builds__bulk(self, get_queue, request_many):
+        request_many.return_value = "status-job"
+        get_queue.return_value.enqueue_many.side_effect = lambda job_datas: [
+            mock.Mock(id=f"check-{job_data.args[0]}") for job_data in job_datas
+        ]
+        for _ in range(3):
+            PlanRepositoryFactory(
+                repo=self.repo, plan__trigger="commit", plan__regex="feature/"
+            )
+        payload = {
+            "ref": "refs/heads/feature/bulk",
+            "after": "aR4Zd84F1i3No8",
+            "commits": [{"id": "aR4Zd84F1i3No8", "message": "Bulk"}],
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            views.create_builds("push", payload, self.repo, self.branch, None)
+
+        builds = Build.objects.filter(commit="aR4Zd84F1i3No8")
+        assert len(builds) == 3
+        get_queue.return_value.enqueue_many.assert_called_once()
+        request_many.assert_called_once()
+        for build in builds:
+            assert build.commit_message == "Bulk"
+            assert build.config_hash == build.plan.get_config_hash()
+            assert build.task_id_status_start == "status-job"
+            assert build.task_id_check == f"check-{build.id}"
+
+    @pytest.mark.django_db
+    @mock.patch("metaci.repository.views.queue_builds")
+    def test_create_builds__queue_error(self, queue_builds):
+        queue_builds.side_effect = Exception("Redis is down")
+        PlanRepositoryFactory(
+            repo=self.repo, plan__trigger="commit", plan__regex="feature/"
+        )
+        payload = {
+            "ref": "refs/heads/feature/bulk",
+            "after": "aR4Zd84F1i3No8",
+            "commits": [{"id": "aR4Zd84F1i3No8", "message": "Bulk"}],
+        }
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            views.create_builds("push", payload, self.repo, self.branch, None)
+        queue_builds.assert_not_called()
+        with self.assertLogs("metaci.repository.views", "ERROR"):
+            for callback in callbacks:
+                callback()
+
+        assert Build.objects.filter(commit="aR4Zd84F1i3No8").count() == 1
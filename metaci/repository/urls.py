@@ -13,6 +13,11 @@ urlpatterns = [
         repository_views.commit_detail,
         name="commit_detail",
     ),
+    re_path(
+        r"(?P<owner>[-\w]+)/(?P<name>[^/].*)/branches/search$",
+        repository_views.repo_branch_search,
+        name="repo_branch_search",
+    ),
     re_path(
         r"(?P<owner>[-\w]+)/(?P<name>[^/].*)/branches",
         repository_views.repo_branches,
@@ -1,15 +1,22 @@
 from metaci.build.exceptions import BuildError
 
 
-def create_status(build):
+def get_status(build):
+    """Return the arguments for the GitHub commit status of a build.
+
+    Returns None if the build doesn't report a status.
+    """
     if not build.plan.context:
         # skip setting Github status if the context field is empty
         return
 
+    if build.build_type == "pool":
+        # org pool builds only prepare orgs; they don't test the commit
+        return
+
     state = None
     target_url = build.get_external_url()
     description = None
-    repo = build.repo.get_github_api()
 
     build_status = build.get_status()
 
@@ -43,6 +50,10 @@ def create_status(build):
         state = "error"
         description = "An error occurred during the build"
 
+    elif build_status == "canceled":
+        state = "error"
+        description = "The build was canceled"
+
     elif build_status == "fail":
         state = "failure"
         if build.plan.role == "qa":
@@ -62,12 +73,17 @@ def create_status(build):
     else:
         raise BuildError(f"Unrecognized build status encountered: {build_status}")
 
-    response = repo.create_status(
-        sha=build.commit,
-        state=state,
-        target_url=target_url,
-        description=description,
-        context=build.plan.context,
-    )
+    return {
+        "sha": build.commit,
+        "state": state,
+        "target_url": target_url,
+        "description": description,
+        "context": build.plan.context,
+    }
+
 
-    return response
+def create_status(build):
+    status = get_status(build)
+    if status is None:
+        return
+    return build.repo.get_github_api().create_status(**status)
@@ -2,21 +2,25 @@ import hmac
 import json
 import logging
 import re
+import uuid
 from hashlib import sha1
-from typing import Optional
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
+from metaci.build.handlers import queue_builds
 from metaci.build.models import Build
 from metaci.build.utils import view_queryset
+from metaci.plan.triggers import get_triggered_builds
 from metaci.release.models import Release
 from metaci.release.tasks import set_merge_freeze_status_for_commit
-from metaci.repository.models import Branch, Repository
+from metaci.repository.models import Branch, Repository, WebhookEvent
 
 logger = logging.getLogger(__name__)
 
@@ -114,6 +118,19 @@ def repo_results(request, owner, name, tab):
     return render(request, "repository/repo_results.html", context=context)
 
 
+def repo_branch_search(request, owner, name):
+    """Return the names of branches matching the q parameter, as JSON."""
+    repo = Repository.objects.get_for_user_or_404(
+        request.user, {"owner": owner, "name": name}
+    )
+
+    branches = repo.branches.filter(name__icontains=request.GET.get("q", ""))
+    names = branches.order_by("name").values_list("name", flat=True)
+    return JsonResponse(
+        {"branches": list(names[: settings.METACI_BRANCH_CHOICES_LIMIT])}
+    )
+
+
 def branch_detail(request, owner, name, branch):
     repo = Repository.objects.get_for_user_or_404(
         request.user, {"owner": owner, "name": name}
@@ -151,48 +168,89 @@ def validate_github_webhook(request):
 @csrf_exempt
 @require_POST
 def github_webhook(request):
+    """Store a webhook delivery for a worker to process.
+
+    GitHub gives up on webhooks which take more than 10 seconds, so the
+    event is processed by the process_webhook_event job. Deliveries which
+    GitHub redelivers are only processed once; recent delivery ids are
+    also kept in the cache to answer redeliveries without a query.
+    """
     validate_github_webhook(request)
     event = request.META.get("HTTP_X_GITHUB_EVENT")
+    delivery_id = request.META.get("HTTP_X_GITHUB_DELIVERY") or str(uuid.uuid4())
+    delivery_key = f"metaci:webhooks:delivery:{delivery_id}"
+    if cache.get(delivery_key):
+        return HttpResponse("Already received", status=202)
     payload = json.loads(request.body)
 
     try:
-        repo = get_repository(payload)
+        get_repository(payload)
     except Repository.DoesNotExist:
         return HttpResponse("Not listening for this repository")
 
+    try:
+        webhook_event, created = WebhookEvent.objects.get_or_create(
+            delivery_id=delivery_id, defaults={"event": event, "payload": payload}
+        )
+    except IntegrityError:
+        # A concurrent redelivery is storing the event
+        return HttpResponse("Already received")
+    if not created:
+        return HttpResponse("Already received", status=202)
+
+    from metaci.repository.tasks import process_webhook_event
+
+    def on_commit():
+        cache.set(delivery_key, 1, timeout=settings.METACI_WEBHOOK_DEDUP_SECONDS)
+        process_webhook_event.delay(webhook_event.id)
+
+    transaction.on_commit(on_commit)
+    return HttpResponse("Accepted", status=202)
+
+
+def handle_github_event(event: str, payload: dict, time_received=None) -> str:
+    """Act on a webhook event. Returns a description of the outcome.
+
+    time_received is when the event was received, which orders the
+    builds it triggers among those of other events.
+    """
+    try:
+        repo = get_repository(payload)
+    except Repository.DoesNotExist:
+        return "Not listening for this repository"
+
+    update_default_branch(payload, repo)
     if event in ("push", "status"):
-        return handle_github_push_or_status_webhook(event, payload, repo)
+        return handle_github_push_or_status_webhook(event, payload, repo, time_received)
     elif event == "pull_request":
         return handle_github_pr_webhook(event, payload, repo)
+    elif event == "delete":
+        return handle_github_delete_webhook(payload, repo)
     else:
-        return HttpResponse("Unrecognized event")
+        return "Unrecognized event"
 
 
 def handle_github_push_or_status_webhook(
-    event: str, payload: dict, repo: Repository
-) -> Optional[HttpResponse]:
+    event: str, payload: dict, repo: Repository, time_received=None
+) -> str:
     branch_name = get_branch_name_from_payload(payload)
 
     if not branch_name:
-        return HttpResponse("No branch found")
+        return "No branch found"
 
     branch = get_or_create_branch(branch_name, repo)
     release = get_release_if_applicable(payload, repo)
-    create_builds(event, payload, repo, branch, release)
-    return HttpResponse("OK")
+    create_builds(event, payload, repo, branch, release, time_received)
+    return "OK"
 
 
-def handle_github_pr_webhook(
-    event: str, payload: dict, repo: Repository
-) -> Optional[HttpResponse]:
+def handle_github_pr_webhook(event: str, payload: dict, repo: Repository) -> str:
     valid_action = payload.get("action") in [
         "opened",
         "reopened",
         "synchronize",
     ]
-    on_main_branch = (
-        payload["pull_request"]["base"]["ref"] == repo.get_github_api().default_branch
-    )
+    on_main_branch = payload["pull_request"]["base"]["ref"] == repo.get_default_branch()
     not_a_fork = (
         payload["pull_request"]["head"]["repo"]["id"]
         == payload["pull_request"]["base"]["repo"]["id"]
@@ -209,7 +267,18 @@ def handle_github_pr_webhook(
                 > 0
             ),
         )
-    return HttpResponse("OK")
+    return "OK"
+
+
+def handle_github_delete_webhook(payload: dict, repo: Repository) -> str:
+    if payload.get("ref_type") == "tag":
+        branch_name = "tag: " + payload["ref"]
+    else:
+        branch_name = payload["ref"]
+
+    # Soft delete, like Branch.delete()
+    pruned = Branch.objects.filter(repo=repo, name=branch_name).update(is_removed=True)
+    return "Pruned branch" if pruned else "No branch found"
 
 
 def get_repository(event):
@@ -217,6 +286,13 @@ def get_repository(event):
     return Repository.objects.get(github_id=repo_id)
 
 
+def update_default_branch(event, repo):
+    default_branch = event["repository"].get("default_branch")
+    if default_branch and default_branch != repo.default_branch:
+        repo.default_branch = default_branch
+        repo.save(update_fields=["default_branch"])
+
+
 def get_branch_name_from_payload(event):
     branches = event.get("branches")
     if branches:
@@ -245,26 +321,46 @@ def get_or_create_branch(branch_name, repo):
     return branch
 
 
-def create_builds(event, payload, repo, branch, release):
-    for pr in repo.planrepository_set.should_run().filter(
-        plan__trigger__in=["commit", "tag", "status"]
-    ):
-        plan = pr.plan
-        run_build, commit, commit_message = plan.check_github_event(event, payload)
-        if run_build:
-            build = Build(
-                repo=repo,
-                plan=plan,
-                planrepo=pr,
-                commit=commit,
-                commit_message=commit_message,
-                branch=branch,
-                build_type="auto",
+def create_builds(event, payload, repo, branch, release, time_push=None):
+    builds = []
+    for pr, commit, commit_message in get_triggered_builds(repo, event, payload):
+        build = Build(
+            repo=repo,
+            plan=pr.plan,
+            planrepo=pr,
+            commit=commit,
+            commit_message=commit_message,
+            branch=branch,
+            build_type="auto",
+            time_push=time_push,
+        )
+        if release:
+            build.release = release
+            build.release_relationship_type = "test"
+        builds.append(build)
+    if not builds:
+        return
+
+    # A push can trigger dozens of plans, so create and queue their builds
+    # together.
+    builds = Build.objects.bulk_create(builds)
+
+    def on_commit():
+        # The event was processed once it committed, so it isn't retried
+        # here, which would create its builds again
+        try:
+            queue_builds(builds)
+        except Exception:
+            logger.exception(
+                f"Could not queue builds {', '.join(str(b.id) for b in builds)}"
             )
-            if release:
-                build.release = release
-                build.release_relationship_type = "test"
-            build.save()
+            return
+        for build in builds:
+            if build.plan.cancel_superseded != "none":
+                build.cancel_superseded_builds()
+
+    # Builds are only queued if the event is processed successfully
+    transaction.on_commit(on_commit)
 
 
 def is_tag(ref):
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TestResultsConfig(AppConfig):
     name = "metaci.testresults"
+
+    def ready(self):
+        import metaci.testresults.handlers  # noqa; side effect import
@@ -0,0 +1,14 @@
+from django.dispatch import receiver
+
+from metaci.build.signals import build_complete
+from metaci.testresults.tasks import record_test_impact
+
+
+@receiver(build_complete)
+def queue_test_impact(sender, **kwargs):
+    build = kwargs.get("build")
+    status = kwargs.get("status")
+    # Failures map tests to the changed paths, and full runs which pass
+    # show that the changes didn't break anything
+    if status in ("success", "fail") and build.plan.test_impact_analysis:
+        record_test_impact.delay(build.id)
@@ -0,0 +1,145 @@
+"""Pick the Apex test classes worth running for a feature branch build.
+
+A class is selected when it has failed before in builds which changed one
+of the paths changed by this build, when its name matches a changed
+class (FooTest or Foo_Test for Foo.cls), or when it failed recently on
+the same branch.
+
+The impact of a path is only known once a build which ran the full suite
+changed it, so builds changing other paths still run the full suite.
+Default branch builds run the full suite and learn from the paths their
+commit changed.
+"""
+import os
+
+from django.db.models import F
+from django.utils import timezone
+
+from metaci.testresults.models import (
+    TestClass,
+    TestClassImpact,
+    TestImpactPath,
+    TestResult,
+)
+
+FAILED_OUTCOMES = ("Fail", "CompileFail")
+RECENT_BUILDS = 5
+
+
+def get_changed_paths(build):
+    """Return the paths changed by the build's commit relative to the
+    default branch, or None for builds of the default branch or of a
+    commit without a branch."""
+    if build.branch is None:
+        return None
+    gh_repo = build.repo.get_github_api()
+    if build.branch.name == gh_repo.default_branch:
+        return None
+    comparison = gh_repo.compare_commits(gh_repo.default_branch, build.commit)
+    return [f["filename"] for f in comparison.files]
+
+
+def get_commit_paths(build):
+    """Return the paths changed by the build's commit itself."""
+    gh_repo = build.repo.get_github_api()
+    return [f["filename"] for f in gh_repo.commit(build.commit).files]
+
+
+def ran_full_suite(build):
+    """Return whether the build ran all Apex test classes, not a selection."""
+    return not build.flows.filter(
+        rebuild=build.current_rebuild, selected_test_classes__isnull=False
+    ).exists()
+
+
+def record_test_impact(build):
+    """Count the Apex classes which failed in this build against its changed paths.
+
+    If the build ran the full suite, its changed paths are also recorded
+    as covered, so that later builds may select tests for them.
+    """
+    full_suite = ran_full_suite(build)
+    failed = TestClass.objects.filter(
+        test_type="Apex",
+        methods__test_results__build_flow__build=build,
+        methods__test_results__outcome__in=FAILED_OUTCOMES,
+    ).distinct()
+    if not full_suite and not failed.exists():
+        return 0
+    paths = get_changed_paths(build)
+    if paths is None:
+        paths = get_commit_paths(build)
+    if not paths:
+        return 0
+
+    now = timezone.now()
+    if full_suite:
+        for path in paths:
+            TestImpactPath.objects.update_or_create(
+                repo=build.repo, path=path, defaults={"time_last_run": now}
+            )
+    count = 0
+    for testclass in failed:
+        for path in paths:
+            impact, created = TestClassImpact.objects.get_or_create(
+                path=path, testclass=testclass
+            )
+            TestClassImpact.objects.filter(id=impact.id).update(
+                failures=F("failures") + 1, time_last_failed=now
+            )
+            count += 1
+    return count
+
+
+def select_test_classes(build, paths):
+    """Return the names of the Apex test classes to run for the changed paths.
+
+    Returns None if the full suite should run, because a full run hasn't
+    covered some of the paths yet.
+    """
+    covered = set(
+        TestImpactPath.objects.filter(repo=build.repo, path__in=paths).values_list(
+            "path", flat=True
+        )
+    )
+    covered.update(
+        TestClassImpact.objects.filter(
+            testclass__repo=build.repo, path__in=paths
+        ).values_list("path", flat=True)
+    )
+    if not covered.issuperset(paths):
+        return None
+
+    names = set(
+        TestClassImpact.objects.filter(
+            testclass__repo=build.repo, path__in=paths, failures__gt=0
+        ).values_list("testclass__name", flat=True)
+    )
+
+    candidates = []
+    for path in paths:
+        name, ext = os.path.splitext(os.path.basename(path))
+        if ext == ".cls":
+            candidates.extend([name, f"{name}Test", f"{name}_Test", f"Test{name}"])
+    names.update(
+        TestClass.objects.filter(
+            repo=build.repo, test_type="Apex", name__in=candidates
+        ).values_list("name", flat=True)
+    )
+
+    recent_builds = (
+        build.__class__.objects.filter(
+            repo=build.repo, branch=build.branch, plan=build.plan
+        )
+        .exclude(id=build.id)
+        .order_by("-id")
+        .values_list("id", flat=True)[:RECENT_BUILDS]
+    )
+    names.update(
+        TestResult.objects.filter(
+            build_flow__build__in=list(recent_builds),
+            method__testclass__test_type="Apex",
+            outcome__in=FAILED_OUTCOMES,
+        ).values_list("method__testclass__name", flat=True)
+    )
+    return sorted(names)
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.13 on 2026-10-19 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("testresults", "0021_delete_testresultperfweeklysummary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestClassImpact",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path", models.CharField(max_length=255)),
+                ("failures", models.PositiveIntegerField(default=0)),
+                ("time_last_failed", models.DateTimeField(blank=True, null=True)),
+                (
+                    "testclass",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="impacts",
+                        to="testresults.testclass",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Test Class Impact",
+                "unique_together": {("path", "testclass")},
+            },
+        ),
+    ]
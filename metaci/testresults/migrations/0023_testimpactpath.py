@@ -0,0 +1,43 @@
+# Generated by Django 3.2.13 on 2026-10-19 16:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("repository", "0014_webhookevent_attempts"),
+        ("testresults", "0022_testclassimpact"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestImpactPath",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path", models.CharField(max_length=255)),
+                ("time_last_run", models.DateTimeField(blank=True, null=True)),
+                (
+                    "repo",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="test_impact_paths",
+                        to="repository.repository",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Test Impact Path",
+                "unique_together": {("repo", "path")},
+            },
+        ),
+    ]
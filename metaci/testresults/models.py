@@ -47,6 +47,43 @@ class TestMethod(models.Model):
     __test__ = False
 
 
+class TestClassImpact(models.Model):
+    """How often a test class failed in builds which changed a path."""
+
+    path = models.CharField(max_length=255)
+    testclass = models.ForeignKey(
+        TestClass, related_name="impacts", on_delete=models.CASCADE
+    )
+    failures = models.PositiveIntegerField(default=0)
+    time_last_failed = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Test Class Impact"
+        unique_together = ("path", "testclass")
+
+    def __str__(self):
+        return f"{self.path}: {self.testclass}"
+
+
+class TestImpactPath(models.Model):
+    """A changed path which a build running the full Apex test suite covered."""
+
+    repo = models.ForeignKey(
+        "repository.Repository",
+        related_name="test_impact_paths",
+        on_delete=models.CASCADE,
+    )
+    path = models.CharField(max_length=255)
+    time_last_run = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Test Impact Path"
+        unique_together = ("repo", "path")
+
+    def __str__(self):
+        return f"{self.repo}: {self.path}"
+
+
 class TestResultManager(models.Manager):
     def update_summary_fields(self):
         for summary in self.all():
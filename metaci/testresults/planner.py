@@ -0,0 +1,97 @@
+"""Split tests into shards which take about the same time to run.
+
+Each test class (or robot suite) is weighted by the sum of the median
+duration of its methods over their most recent results. Tests which have
+never run are weighted with the median of the known classes, and if
+nothing is known at all every test counts the same.
+"""
+import heapq
+import os
+import typing as T
+from datetime import timedelta
+from statistics import median
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from metaci.testresults.models import TestResult
+
+
+class Shard(T.NamedTuple):
+    tests: T.List[str]
+    duration: float
+
+
+def robot_suite_name(path: str) -> str:
+    """Return the suite name robot framework gives the suite at path."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if "__" in name:
+        name = name.split("__", 1)[1] or name
+    name = name.replace("_", " ").strip()
+    return name.title() if name.islower() else name
+
+
+def get_test_durations(repo, names, plan=None, test_type=None):
+    """Estimate the duration of each named test class from recent results."""
+    results = TestResult.objects.filter(
+        duration__isnull=False,
+        build_flow__time_end__gte=timezone.now()
+        - timedelta(days=settings.METACI_SHARD_HISTORY_DAYS),
+    )
+    if plan is not None:
+        results = results.filter(build_flow__build__plan=plan)
+
+    # Only fetch the most recent runs of each method: the oldest result
+    # kept is the method's Nth most recent one, if it has that many
+    runs = settings.METACI_SHARD_HISTORY_RUNS
+    oldest = (
+        results.filter(method=OuterRef("method"))
+        .order_by("-id")
+        .values("id")[runs - 1 : runs]
+    )
+    results = results.filter(
+        method__testclass__repo=repo,
+        method__testclass__name__in=set(names),
+        id__gte=Coalesce(Subquery(oldest), 0),
+    )
+    if test_type is not None:
+        results = results.filter(method__testclass__test_type=test_type)
+    results = results.values_list("method__testclass__name", "method_id", "duration")
+
+    samples = {}
+    for class_name, method_id, duration in results.iterator():
+        samples.setdefault(class_name, {}).setdefault(method_id, []).append(duration)
+
+    return {
+        class_name: sum(median(durations) for durations in methods.values())
+        for class_name, methods in samples.items()
+    }
+
+
+def plan_shards(repo, tests, count, plan=None, test_type=None, key=None):
+    """Split tests into at most `count` shards balanced by historical duration.
+
+    `key` maps each test to the TestClass name its results are recorded
+    under; by default the test is the class name.
+    """
+    key = key or (lambda test: test)
+    tests = list(dict.fromkeys(tests))
+    durations = get_test_durations(
+        repo, [key(test) for test in tests], plan=plan, test_type=test_type
+    )
+    default = median(durations.values()) if durations else 1
+    weights = {test: durations.get(key(test), default) for test in tests}
+
+    # Longest first onto the least loaded shard
+    heap = [(0, i, []) for i in range(min(count, len(tests)))]
+    for test in sorted(tests, key=lambda test: (-weights[test], test)):
+        load, i, shard = heapq.heappop(heap)
+        shard.append(test)
+        heapq.heappush(heap, (load + weights[test], i, shard))
+
+    return [
+        Shard(tests=sorted(shard), duration=load)
+        for load, i, shard in sorted(heap, key=lambda item: item[1])
+    ]
@@ -0,0 +1,14 @@
+import django_rq
+
+from metaci.build.tasks import reset_database_connection
+
+
+@django_rq.job("short")
+def record_test_impact(build_id):
+    reset_database_connection()
+    from metaci.build.models import Build
+    from metaci.testresults.impact import record_test_impact
+
+    build = Build.objects.get(id=build_id)
+    count = record_test_impact(build)
+    return f"Recorded {count} test impacts for build {build_id}"
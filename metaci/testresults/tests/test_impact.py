@@ -0,0 +1,129 @@
+from unittest import mock
+
+import pytest
+
+from metaci.conftest import (
+    BuildFactory,
+    BuildFlowFactory,
+    TestClassFactory,
+    TestResultFactory,
+)
+from metaci.testresults.impact import (
+    get_changed_paths,
+    record_test_impact,
+    select_test_classes,
+)
+from metaci.testresults.models import TestClassImpact, TestImpactPath
+
+
+def add_result(build, class_name, outcome):
+    return TestResultFactory(
+        build_flow=BuildFlowFactory(build=build),
+        method__testclass__repo=build.repo,
+        method__testclass__name=class_name,
+        method__testclass__test_type="Apex",
+        outcome=outcome,
+    )
+
+
+@pytest.mark.django_db
+def test_get_changed_paths():
+    build = BuildFactory(branch__name="feature/test")
+    with mock.patch("metaci.repository.models.Repository.get_github_api") as gh:
+        gh.return_value.default_branch = "main"
+        gh.return_value.compare_commits.return_value.files = [
+            {"filename": "force-app/main/default/classes/Foo.cls"}
+        ]
+        assert get_changed_paths(build) == ["force-app/main/default/classes/Foo.cls"]
+        gh.return_value.compare_commits.assert_called_once_with("main", build.commit)
+
+
+@pytest.mark.django_db
+def test_get_changed_paths__default_branch():
+    build = BuildFactory(branch__name="main")
+    with mock.patch("metaci.repository.models.Repository.get_github_api") as gh:
+        gh.return_value.default_branch = "main"
+        assert get_changed_paths(build) is None
+
+
+@pytest.mark.django_db
+def test_get_changed_paths__no_branch():
+    build = BuildFactory(branch=None)
+    with mock.patch("metaci.repository.models.Repository.get_github_api") as gh:
+        assert get_changed_paths(build) is None
+        assert not gh.called
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.testresults.impact.get_changed_paths")
+def test_record_test_impact(get_changed_paths):
+    get_changed_paths.return_value = ["src/Foo.cls", "src/Bar.cls"]
+    build = BuildFactory()
+    failed = add_result(build, "FooTest", "Fail").method.testclass
+    add_result(build, "BazTest", "Pass")
+
+    assert record_test_impact(build) == 2
+    assert record_test_impact(build) == 2
+
+    impacts = TestClassImpact.objects.filter(testclass=failed)
+    assert sorted(impacts.values_list("path", "failures")) == [
+        ("src/Bar.cls", 2),
+        ("src/Foo.cls", 2),
+    ]
+    assert sorted(
+        TestImpactPath.objects.filter(repo=build.repo).values_list("path", flat=True)
+    ) == ["src/Bar.cls", "src/Foo.cls"]
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.testresults.impact.get_changed_paths")
+def test_record_test_impact__default_branch(get_changed_paths):
+    get_changed_paths.return_value = None
+    build = BuildFactory()
+    add_result(build, "FooTest", "Pass")
+
+    with mock.patch("metaci.repository.models.Repository.get_github_api") as gh:
+        gh.return_value.commit.return_value.files = [{"filename": "src/Foo.cls"}]
+        assert record_test_impact(build) == 0
+        gh.return_value.commit.assert_called_once_with(build.commit)
+
+    assert TestImpactPath.objects.get(repo=build.repo).path == "src/Foo.cls"
+
+
+@pytest.mark.django_db
+@mock.patch("metaci.testresults.impact.get_changed_paths")
+def test_record_test_impact__selected_tests_passed(get_changed_paths):
+    build = BuildFactory()
+    result = add_result(build, "FooTest", "Pass")
+    result.build_flow.selected_test_classes = "FooTest"
+    result.build_flow.save()
+
+    assert record_test_impact(build) == 0
+    assert not get_changed_paths.called
+
+
+@pytest.mark.django_db
+def test_select_test_classes():
+    build = BuildFactory()
+    impacted = TestClassFactory(repo=build.repo, name="ImpactedTest", test_type="Apex")
+    TestClassImpact.objects.create(path="src/Other.cls", testclass=impacted, failures=1)
+    TestClassFactory(repo=build.repo, name="Foo_Test", test_type="Apex")
+    TestClassFactory(repo=build.repo, name="UnrelatedTest", test_type="Apex")
+    TestImpactPath.objects.create(repo=build.repo, path="src/Foo.cls")
+    previous = BuildFactory(planrepo=build.planrepo, branch=build.branch, org=build.org)
+    add_result(previous, "FlakyTest", "Fail")
+
+    assert select_test_classes(build, ["src/Foo.cls", "src/Other.cls"]) == [
+        "FlakyTest",
+        "Foo_Test",
+        "ImpactedTest",
+    ]
+
+
+@pytest.mark.django_db
+def test_select_test_classes__not_covered():
+    build = BuildFactory()
+    TestClassFactory(repo=build.repo, name="Foo_Test", test_type="Apex")
+    TestImpactPath.objects.create(repo=build.repo, path="src/Foo.cls")
+
+    assert select_test_classes(build, ["src/Foo.cls", "src/New.cls"]) is None
@@ -0,0 +1,69 @@
+import pytest
+
+from metaci.conftest import BuildFlowFactory, RepositoryFactory, TestResultFactory
+from metaci.testresults.planner import get_test_durations, plan_shards, robot_suite_name
+
+
+def add_results(repo, class_name, durations, test_type="Robot"):
+    build_flow = BuildFlowFactory(build__planrepo__repo=repo)
+    for duration in durations:
+        TestResultFactory(
+            build_flow=build_flow,
+            method__testclass__repo=repo,
+            method__testclass__name=class_name,
+            method__testclass__test_type=test_type,
+            duration=duration,
+        )
+
+
+def test_robot_suite_name():
+    assert robot_suite_name("robot/tests/create_contact.robot") == "Create Contact"
+    assert robot_suite_name("robot/tests/01__Smoke_Test.robot") == "Smoke Test"
+
+
+@pytest.mark.django_db
+def test_get_test_durations():
+    repo = RepositoryFactory()
+    add_results(repo, "Slow", [100, 50])
+    add_results(repo, "Fast", [1])
+
+    durations = get_test_durations(repo, ["Slow", "Fast", "New"])
+
+    assert durations == {"Slow": 150, "Fast": 1}
+
+
+@pytest.mark.django_db
+def test_get_test_durations__recent_runs(settings):
+    settings.METACI_SHARD_HISTORY_RUNS = 2
+    repo = RepositoryFactory()
+    build_flow = BuildFlowFactory(build__planrepo__repo=repo)
+    method = TestResultFactory(
+        build_flow=build_flow,
+        method__testclass__repo=repo,
+        method__testclass__name="Flaky",
+        duration=1000,
+    ).method
+    for duration in (10, 20):
+        TestResultFactory(build_flow=build_flow, method=method, duration=duration)
+
+    assert get_test_durations(repo, ["Flaky"]) == {"Flaky": 15}
+
+
+@pytest.mark.django_db
+def test_plan_shards():
+    repo = RepositoryFactory()
+    add_results(repo, "A", [90])
+    add_results(repo, "B", [50])
+    add_results(repo, "C", [40])
+
+    shards = plan_shards(repo, ["A", "B", "C", "D"], 2)
+
+    assert [shard.tests for shard in shards] == [["A", "C"], ["B", "D"]]
+    assert shards[0].duration == 130
+
+
+@pytest.mark.django_db
+def test_plan_shards__no_history():
+    repo = RepositoryFactory()
+    shards = plan_shards(repo, ["a", "b", "c"], 5)
+    assert [shard.tests for shard in shards] == [["a"], ["b"], ["c"]]